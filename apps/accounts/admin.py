@@ -6,6 +6,7 @@ from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import ugettext_lazy as _
 
 from apps.accounts.models import User
+from apps.habits import deletion
 
 
 class UserCreationForm(forms.ModelForm):
@@ -87,10 +88,11 @@ class CustomUserAdmin(UserAdmin):
     form = UserChangeForm
     add_form = UserCreationForm
     fieldsets = (
-        (None, {'fields': ('email', 'password', 'name',)}),
+        (None, {'fields': ('email', 'password', 'name', 'timezone',)}),
         (_('Permissions'), {'fields': ('is_active', 'is_staff', 'is_superuser',
                                        'groups', 'user_permissions')}),
-        (_('Important dates'), {'fields': ('last_login', 'date_joined')}),
+        (_('Important dates'), {'fields': ('last_login', 'date_joined',
+                                           'scheduled_for_deletion')}),
     )
     add_fieldsets = (
         (None, {
@@ -99,9 +101,28 @@ class CustomUserAdmin(UserAdmin):
         ),
     )
 
-    list_display = ('id', 'name', 'email', 'is_staff')
+    list_display = ('id', 'name', 'email', 'is_staff', 'scheduled_for_deletion')
     search_fields = ('name', 'email')
     ordering = ('name',)
+    readonly_fields = ('scheduled_for_deletion',)
+    actions = ['schedule_for_deletion']
+
+    def get_actions(self, request):
+        # Deleting a user in one go locks their buckets for far too long:
+        # schedule them for the deletescheduled command instead
+        actions = super(CustomUserAdmin, self).get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def schedule_for_deletion(self, request, queryset):
+        for user in queryset:
+            deletion.schedule_user(user)
+        self.message_user(request, _("%d users scheduled for deletion.") %
+                          len(queryset))
+    schedule_for_deletion.short_description = _("Schedule selected users for deletion")
 
 
 admin.site.register(User, CustomUserAdmin)
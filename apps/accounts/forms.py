@@ -51,4 +51,9 @@ class HobbitPasswordResetNotStupidForm(PasswordResetForm):
             # none of the filtered users are active
             raise forms.ValidationError(self.error_messages['inactive'])
         return email
-    
\ No newline at end of file
+    
+
+class TimezoneForm(forms.ModelForm):
+    class Meta:
+        model = User
+        fields = ('timezone',)
@@ -0,0 +1,48 @@
+from optparse import make_option
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from lib.batchprofile import ProfiledCommand
+
+class Command(ProfiledCommand):
+    option_list = ProfiledCommand.option_list + (
+        make_option('--batch-size', type='int', default=1000,
+                    help='Number of sessions to delete at a time.'),
+        make_option('--pause', type='float', default=0.1,
+                    help='Seconds to wait between batches.'),
+    )
+
+    def handle(self, *args, **options):
+        """
+        Delete expired sessions, a batch at a time. Unlike clearsessions,
+        which deletes them all in one statement, this only ever locks a few
+        rows at once, so it's safe to run against a large backlog on a live
+        database. This command should be called on a cronjob once a day.
+        """
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        now = timezone.now()
+        deleted = 0
+        for keys in self.profile.iterate(self.batches(now, options['batch_size'])):
+            with self.profile.phase('delete'):
+                # Each batch is committed on its own
+                Session.objects.filter(session_key__in=keys).delete()
+            deleted += len(keys)
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        if int(options['verbosity']) > 0:
+            self.stdout.write('Deleted %d expired sessions' % deleted)
+
+    def batches(self, now, batch_size):
+        while True:
+            keys = list(Session.objects.filter(
+                expire_date__lt=now,
+            ).values_list('session_key', flat=True)[:batch_size])
+            if not keys:
+                return
+            yield keys
@@ -1,5 +1,6 @@
 from django.contrib.auth import models as user_models
 from django.db import models
+import pytz
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
@@ -41,6 +42,9 @@ class UserManager(user_models.BaseUserManager):
         return u
 
 
+TIMEZONES = [(tz, tz) for tz in pytz.common_timezones]
+
+
 class User(user_models.AbstractBaseUser, user_models.PermissionsMixin):
     email = models.CharField(max_length=500, unique=True, db_index=True)
     name = models.CharField(max_length=500)
@@ -51,6 +55,13 @@ class User(user_models.AbstractBaseUser, user_models.PermissionsMixin):
         help_text=_('Designates whether this user should be treated as '
                     'active. Unselect this instead of deleting accounts.'))
     date_joined = models.DateTimeField(_('date joined'), default=timezone.now)
+    timezone = models.CharField(_('timezone'), max_length=63,
+        choices=TIMEZONES, default='UTC',
+        help_text=_('Reminders are sent at this local time.'))
+    scheduled_for_deletion = models.DateTimeField(_('scheduled for deletion'),
+        null=True, blank=True, db_index=True,
+        help_text=_('When this account was set to be deleted, by the '
+                    'deletescheduled command.'))
 
     objects = UserManager()
 
@@ -62,3 +73,6 @@ class User(user_models.AbstractBaseUser, user_models.PermissionsMixin):
 
     def get_short_name(self):
         return self.name
+
+    def get_timezone(self):
+        return pytz.timezone(self.timezone)
@@ -2,9 +2,13 @@ import datetime
 from django_webtest import TestCase, WebTest
 from django.core.urlresolvers import reverse
 from django.core import mail
+from django.core.management import call_command
+from django.contrib.sessions.models import Session
+from django.utils import timezone
 
 from apps.accounts.models import User
 from apps.habits.models import Habit
+from lib import test_helpers as helpers
 
 
 class PasswordChangeTest(TestCase):
@@ -41,16 +45,18 @@ class SettingsTest(WebTest):
                                              password='12345',
                                              is_active=True)
 
-    def test_disabling_data_collection_email(self):
+    def test_enabling_data_collection_email(self):
         habit1 = Habit.objects.create(
             user=self.user,
             description='brush teeth',
             start=datetime.date.today(),
+            send_data_collection_emails=False,
         )
         habit2 = Habit.objects.create(
             user=self.user,
             description='drink lots',
             start=datetime.date.today(),
+            send_data_collection_emails=False,
         )
 
         response = self.app.get(
@@ -59,44 +65,88 @@ class SettingsTest(WebTest):
         )
 
         form = response.forms['settings-form']
-        form.set('form-0-send_data_collection_emails', False)
+        form.set('form-0-send_data_collection_emails', True)
         response = form.submit()
 
         self.assertEqual(302, response.status_code)
 
         habit1 = Habit.objects.get(pk=habit1.pk)
-        self.assertTrue(habit1.send_data_collection_emails)
+        self.assertFalse(habit1.send_data_collection_emails)
 
         habit2 = Habit.objects.get(pk=habit2.pk)
-        self.assertFalse(habit2.send_data_collection_emails)
+        self.assertTrue(habit2.send_data_collection_emails)
 
-    def test_enabling_data_collection_email(self):
-        habit1 = Habit.objects.create(
-            user=self.user,
-            description='brush teeth',
-            start=datetime.date.today(),
-            send_data_collection_emails=False,
-        )
-        habit2 = Habit.objects.create(
+
+def test_disabling_data_collection_email(self, num_habits):
+    habits = [
+        Habit.objects.create(
             user=self.user,
-            description='drink lots',
+            description='Habit %d' % i,
             start=datetime.date.today(),
-            send_data_collection_emails=False,
         )
+        for i in range(num_habits)
+    ]
 
+    # Including logging in, on the first request
+    with helpers.assert_max_queries(10):
         response = self.app.get(
             reverse('account_settings'),
             user='someone@example.com',
         )
 
-        form = response.forms['settings-form']
-        form.set('form-0-send_data_collection_emails', True)
+    # Newest first
+    form = response.forms['settings-form']
+    form.set('form-0-send_data_collection_emails', False)
+    # Only the changed habit is saved
+    with helpers.assert_max_queries(7):
         response = form.submit()
 
-        self.assertEqual(302, response.status_code)
+    self.assertEqual(302, response.status_code)
 
-        habit1 = Habit.objects.get(pk=habit1.pk)
-        self.assertFalse(habit1.send_data_collection_emails)
+    for habit in habits[:-1]:
+        self.assertTrue(Habit.objects.get(pk=habit.pk).send_data_collection_emails)
+    self.assertFalse(Habit.objects.get(pk=habits[-1].pk).send_data_collection_emails)
 
-        habit2 = Habit.objects.get(pk=habit2.pk)
-        self.assertTrue(habit2.send_data_collection_emails)
+def test_changing_timezone_reschedules_reminders(self, num_habits):
+    for i in range(num_habits):
+        habit = Habit(
+            user=self.user,
+            description='Habit %d' % i,
+            start=datetime.date.today(),
+        )
+        habit.set_reminder_schedule([True] * 7, 9)
+        habit.save()
+        self.assertEqual(9, habit.reminder_utc_hour)
+
+    response = self.app.get(
+        reverse('account_settings'),
+        user='someone@example.com',
+    )
+    form = response.forms['timezone-form']
+    form.set('timezone', 'Asia/Tokyo')
+    # Habits on the same schedule are rescheduled together
+    with helpers.assert_max_queries(6):
+        response = form.submit()
+
+    self.assertEqual(302, response.status_code)
+    self.assertEqual('Asia/Tokyo', User.objects.get(pk=self.user.pk).timezone)
+    for habit in Habit.objects.all():
+        self.assertEqual(540, habit.reminder_utc_offset)
+        self.assertEqual(0, habit.reminder_utc_hour)
+
+helpers.attach_fixture_tests(SettingsTest, test_disabling_data_collection_email, [2, 50])
+helpers.attach_fixture_tests(SettingsTest, test_changing_timezone_reschedules_reminders, [1, 50])
+
+
+class PruneExpiredSessionsTest(TestCase):
+    def test_prunes_expired_sessions(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key='expired%d' % i, session_data='',
+                                   expire_date=now - datetime.timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='',
+                               expire_date=now + datetime.timedelta(days=1))
+
+        with helpers.assert_max_queries(7):
+            call_command('pruneexpiredsessions', batch_size=2, pause=0, verbosity=0)
+        self.assertEqual(['live'], list(Session.objects.values_list('session_key', flat=True)))
@@ -9,10 +9,12 @@ from django.template.response import TemplateResponse
 from django.utils.http import base36_to_int
 from django.views.decorators.cache import never_cache
 from django.views.decorators.debug import sensitive_post_parameters
-from django.views.generic import TemplateView, FormView
+from django.utils import timezone
+from django.views.generic import TemplateView, FormView, UpdateView
 
+from apps.accounts.forms import TimezoneForm
 from apps.habits.models import Habit
-from apps.habits.forms import HabitEmailOptionsForm
+from apps.habits.forms import BaseHabitEmailOptionsFormSet, HabitEmailOptionsForm
 from lib.render_to_email import render_to_email
 
 from .signals import user_changed_password
@@ -107,10 +109,11 @@ class SettingsView(FormView):
         return reverse('account_settings')
 
     def get_form_class(self):
-        self.queryset = self.request.user.habits.all()
+        self.queryset = Habit.for_user(self.request.user)
         return modelformset_factory(
             Habit,
             form=HabitEmailOptionsForm,
+            formset=BaseHabitEmailOptionsFormSet,
             max_num=self.queryset.count(),
             extra=0,
         )
@@ -123,3 +126,32 @@ class SettingsView(FormView):
     def form_valid(self, form):
         form.save()
         return super(SettingsView, self).form_valid(form)
+
+    def get_context_data(self, **kwargs):
+        ctx = super(SettingsView, self).get_context_data(**kwargs)
+        ctx['timezone_form'] = TimezoneForm(instance=self.request.user)
+        return ctx
+
+
+class TimezoneView(UpdateView):
+    form_class = TimezoneForm
+    http_method_names = ['post']
+
+    def get_object(self, queryset=None):
+        return self.request.user
+
+    def get_success_url(self):
+        return reverse('account_settings')
+
+    def form_valid(self, form):
+        response = super(TimezoneView, self).form_valid(form)
+        habits = list(self.object.habits.all())
+        for habit in habits:
+            habit.user = self.object
+        Habit.update_reminder_schedules(habits, timezone.now())
+        return response
+
+    def form_invalid(self, form):
+        # The form is a single select, so this only happens if it's tampered
+        # with. Send them back to try again.
+        return HttpResponseRedirect(self.get_success_url())
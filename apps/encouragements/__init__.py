@@ -1,3 +1,4 @@
 from models import ProviderRegistry
 from models import providers, get_encouragement
+from models import HabitEncouragement, store_encouragement, stored_encouragement
 
@@ -1,11 +1,14 @@
 import calendar
-from collections import defaultdict
 import datetime
 import random
 
+from django.db import IntegrityError, models, transaction
 from django.db.models import Max
+from django.utils import timezone
 
-from apps.habits.models import Bucket
+from apps.habits import calendar_index, runs
+from apps.habits.models import Habit
+from apps.habits.signals import habit_resolution_changed
 from strings import *
 
 
@@ -40,6 +43,67 @@ providers = ProviderRegistry()
 get_encouragement = providers.get_encouragement
 
 
+class HabitEncouragement(models.Model):
+    """
+    The encouragement chosen for a habit when its data was last recorded,
+    so that showing it is one row read, and the same each time.
+    """
+    habit = models.OneToOneField(Habit, primary_key=True,
+                                 related_name='encouragement')
+    # The latest time period recorded, at the habit's resolution
+    index = models.IntegerField()
+    # None if no provider had anything to say
+    text = models.TextField(null=True)
+    modified = models.DateTimeField(auto_now=True)
+
+
+def store_encouragement(habit, index=None):
+    """
+    Choose an encouragement for ``habit``'s data as it stands, and store it
+    as the one for the latest time period recorded (``index``, at the
+    habit's resolution, if the caller knows it). Call this in the same
+    transaction as recording the data. Returns the encouragement.
+    """
+    if index is None:
+        latest = habit.get_buckets(order_by='-index').values_list('index', flat=True)[:1]
+        index = latest[0] if latest else -1
+
+    text = get_encouragement(habit)
+    # Don't replace one chosen for a later time period
+    stored = HabitEncouragement.objects.filter(habit=habit, index__lte=index)
+    if not stored.update(index=index, text=text, modified=timezone.now()):
+        # There's none yet, or one for a later time period. If another
+        # request stores one between the update and this, update that one
+        # instead, as above.
+        sid = transaction.savepoint()
+        try:
+            HabitEncouragement.objects.create(habit=habit, index=index, text=text)
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            stored.update(index=index, text=text, modified=timezone.now())
+    return text
+
+
+def forget_encouragement(sender, **kwargs):
+    # A receiver for habit_resolution_changed: the stored encouragement's
+    # index is at the old resolution
+    HabitEncouragement.objects.filter(habit=sender).delete()
+
+habit_resolution_changed.connect(forget_encouragement)
+
+
+def stored_encouragement(habit):
+    """
+    Return the encouragement chosen when ``habit``'s data was last recorded,
+    choosing one now if there isn't one.
+    """
+    try:
+        return HabitEncouragement.objects.get(habit=habit).text
+    except HabitEncouragement.DoesNotExist:
+        return store_encouragement(habit)
+
+
 @providers.register
 def static_encouragement_provider(habit):
     """
@@ -63,7 +127,7 @@ def longest_streak_succeeding(habit):
 # 1B. Most periods in a row non-zero
 @providers.register
 def longest_streak_nonzero(habit):
-    longest = _longest_streak(habit, success=lambda b: b.value > 0)
+    longest = _longest_streak(habit, kinds=(runs.SUCCESS, runs.PARTIAL))
     if longest:
         return random.choice(ENCOURAGEMENT_2)
 
@@ -110,17 +174,8 @@ def streak_of_doom(habit):
     else:
         return None
 
-    buckets = habit.get_buckets(order_by='-index')
-    if buckets.count() < doom_threshold:
-        return None
-
-    latest = buckets[0]
-    buckets = buckets.exclude(index__lt=(latest.index - (doom_threshold - 1)))
-    buckets = buckets.filter(value=0)
-
-    if buckets.count() < doom_threshold:
-        return None
-    else:
+    latest = habit.get_runs(1)
+    if latest and latest[0].kind == runs.FAIL and latest[0].length >= doom_threshold:
         return random.choice(ENCOURAGEMENT_6)
 
 
@@ -158,7 +213,7 @@ def every_day_this_month_nonzero(habit):
 # 7b. Success if you've hit your target every day in the past month.
 @providers.register
 def every_day_this_month_succeeding(habit):
-    if _every_day_this_month(habit, habit.target_value):
+    if _every_day_this_month(habit, succeeding=True):
         latest = habit.get_buckets(order_by='-index')[0]
         latest_date = habit.start + datetime.timedelta(days=latest.index)
         return random.choice(ENCOURAGEMENT_9) % {
@@ -198,10 +253,45 @@ def every_xday_this_month_succeeding(habit):
 #     m time periods of failure, followed by k time periods of success
 #     (we believe that n and m will be something and something like the
 #     ratio of k to m will be at least something)
+@providers.register
+def comeback(habit):
+    if habit.resolution in ['day', 'weekday', 'weekendday']:
+        min_before, min_slump, min_since = 3, 3, 2
+    elif habit.resolution == 'week':
+        min_before, min_slump, min_since = 2, 2, 1
+    else:
+        min_before, min_slump, min_since = 2, 1, 1
+
+    since, slump, before = _latest_stretches(habit, 3)
+    if (since >= min_since and slump >= min_slump and before >= min_before and
+            # Back for at least half as long as it was away
+            since * 2 >= slump):
+        return random.choice(ENCOURAGEMENT_12) % {
+            'length': slump,
+            'resolution': habit.get_resolution_name(),
+        }
+
+
+def _latest_stretches(habit, count):
+    """
+    Return the lengths of the latest ``count`` stretches of alternately
+    succeeding and not succeeding (failing, falling short, or missing) time
+    periods, latest first, starting with a succeeding one (0 if the latest
+    time period didn't succeed), and padded with 0s.
+    """
+    lengths = [0]
+    for run in habit.runs.order_by('-start').iterator():
+        succeeding = run.kind == runs.SUCCESS
+        if succeeding != (len(lengths) % 2 == 1):
+            if len(lengths) == count:
+                break
+            lengths.append(0)
+        lengths[-1] += run.length
+    return lengths + [0] * (count - len(lengths))
 
 
 def _longest_streak(habit, **kwargs):
-    streaks = habit.get_streaks(**kwargs)
+    streaks = habit.get_run_streaks(**kwargs)
 
     # Get most recent streak, if any
     try:
@@ -229,43 +319,26 @@ def _best_bucket_ever(habit, resolution):
     return latest.value > max_val
 
 
-def _weekdays_in_month(year, month):
-    start, num_days = calendar.monthrange(year, month)
-    weekdays = defaultdict(list)
-    for i, weekday in enumerate((x + start) % 7 for x in xrange(num_days)):
-        weekdays[weekday].append(i + 1)
-    return weekdays
-
-
-def _every_day_this_month(habit, target_value=1):
+def _every_day_this_month(habit, succeeding=False):
     if habit.resolution != 'day':
         return False
 
-    buckets = habit.buckets.filter(resolution=habit.resolution).order_by('-index')
-
-    if buckets.count() < 28:
+    latest = habit.get_buckets(order_by='-index').values_list('index', flat=True)[:1]
+    if not latest:
         return False
-
-    latest = buckets[0]
-    latest_date = habit.start + datetime.timedelta(days=latest.index)
+    latest_index = latest[0]
+    latest_date = habit.start + datetime.timedelta(days=latest_index)
 
     # Only proceed to check all buckets this month if we've just entered the
-    # last bucket this month. Use == because months aren't monotonically
-    # increasing (December -> January).
-    next_date = latest_date + datetime.timedelta(days=1)
-    if latest_date.month == next_date.month:
+    # last bucket this month
+    if not calendar_index.ends_period(latest_date, 'month'):
         return False
 
-    # Get a list of buckets from the current month
-    month_ndays = latest_date.day
-    buckets_filtered = buckets.exclude(index__lt=latest.index - (month_ndays - 1))
-    buckets_filtered = buckets_filtered.exclude(value__lt=target_value)
-
     # If you haven't provided data for every day this month, fail
-    if buckets_filtered.count() < month_ndays:
-        return False
-
-    return True
+    month_ndays = latest_date.day
+    stats = habit.window_stats(latest_index - (month_ndays - 1), latest_index + 1)
+    done = stats.successes if succeeding else stats.nonzero
+    return done == month_ndays
 
 
 def _every_xday_this_month(habit, target_value=1):
@@ -281,38 +354,19 @@ def _every_xday_this_month(habit, target_value=1):
 
     latest = buckets[0]
     latest_date = habit.start + datetime.timedelta(days=latest.index)
-    month_weekdays = _weekdays_in_month(latest_date.year, latest_date.month)
-    last_weekdays = [v[-1] for k, v in month_weekdays.items()]
 
-    try:
-        # Set weekday to the integer weekday (Monday=0...Sunday=6) represented
-        # by latest_date...
-        weekday = last_weekdays.index(latest_date.day)
-    except ValueError:
-        # ...but fail if it's not one of the last weekdays of the month (e.g.
-        # if it's a Wednesday but not the last Wednesday of the month)
+    # Fail if it's not one of the last weekdays of the month (e.g. if it's a
+    # Wednesday but not the last Wednesday of the month)
+    if not calendar_index.is_last_weekday_of_month(latest_date):
         return False
 
-    # Get buckets for all the days in the month which are the same weekday as
-    # latest_date.
-    month_ndays = latest_date.day
-    min_index = latest.index - (month_ndays - 1)
-    buckets_filtered = list(Bucket.objects.raw("""
-        SELECT * FROM habits_bucket
-        WHERE habit_id = %s
-        AND resolution = %s
-        AND index > %s
-        AND (index + %s) %% 7 = %s
-        AND value >= %s
-    """, [habit.pk,
-          habit.resolution,
-          min_index,
-          habit.start.weekday(),
-          weekday,
-          target_value]))
-
-    if len(buckets_filtered) < len(month_weekdays[weekday]):
-        # Haven't got a bucket for each, so automatically fail
-        return False
+    # The indexes of all the days in the month which are the same weekday as
+    # latest_date
+    days = calendar_index.weekday_occurrences(latest_date.year,
+                                              latest_date.month)[latest_date.weekday()]
+    first_of_month = latest.index - (latest_date.day - 1)
+    indexes = [first_of_month + day - 1 for day in days]
 
-    return True
+    hits = buckets.filter(index__in=indexes, value__gte=target_value).count()
+    # Haven't got a bucket for each, so fail
+    return hits == len(days)
@@ -91,6 +91,12 @@ ENCOURAGEMENT_11 = (
     "Congratulations, you've hit your target every %(day)s this %(month)s!",
 )
 
+ENCOURAGEMENT_12 = (
+    "Don't call it a comeback!",
+    "%(length)d %(resolution)s off, and you're straight back on it. Nice.",
+    "Back in the saddle!",
+)
+
 # __Out__
 #     "At this rate, you'll figure out ALL THE SECRETS!",
 #     "Have you ever seen a house fly?",
@@ -1,16 +1,19 @@
 from collections import namedtuple
 import datetime
 
+from django.db import transaction
 from django.test import TestCase
 
 from apps.accounts.models import User
-from apps.encouragements.models import (ProviderRegistry,
+from apps.encouragements.models import (ProviderRegistry, providers,
+                                        HabitEncouragement, store_encouragement,
+                                        stored_encouragement,
                                         longest_streak_nonzero, longest_streak_succeeding,
                                         best_day_ever, best_week_ever, best_month_ever,
                                         better_than_before,
                                         every_day_this_month_nonzero, every_day_this_month_succeeding,
                                         every_xday_this_month_nonzero, every_xday_this_month_succeeding,
-                                        streak_of_doom)
+                                        streak_of_doom, comeback)
 
 from apps.habits.models import Bucket, Habit
 
@@ -529,3 +532,119 @@ def test_streak_of_doom(self, fixture):
 
 helpers.attach_fixture_tests(TestProviders, test_streak_of_doom, DOOM_FIXTURES)
 
+COMEBACK_FIXTURES = (
+    # Three days on, three off, two back on
+    PF(func=comeback,
+       habit=('2013-03-01', 'day'),
+       data=(('2013-03-01', 3), ('2013-03-02', 3), ('2013-03-03', 4),
+             ('2013-03-04', 0), ('2013-03-05', 1),
+             ('2013-03-07', 3), ('2013-03-08', 3)),
+       expects_none=False),
+    # Not back for long enough
+    PF(func=comeback,
+       habit=('2013-03-01', 'day'),
+       data=(('2013-03-01', 3), ('2013-03-02', 3), ('2013-03-03', 4),
+             ('2013-03-04', 0), ('2013-03-05', 1), ('2013-03-06', 0),
+             ('2013-03-07', 3)),
+       expects_none=True),
+    # Not on for long enough beforehand
+    PF(func=comeback,
+       habit=('2013-03-01', 'day'),
+       data=(('2013-03-02', 3), ('2013-03-03', 4),
+             ('2013-03-04', 0), ('2013-03-05', 1), ('2013-03-06', 0),
+             ('2013-03-07', 3), ('2013-03-08', 3)),
+       expects_none=True),
+    # Away too long to be back after two days
+    PF(func=comeback,
+       habit=('2013-03-01', 'day'),
+       data=(('2013-03-01', 3), ('2013-03-02', 3), ('2013-03-03', 4),
+             ('2013-03-04', 0), ('2013-03-09', 1),
+             ('2013-03-10', 3), ('2013-03-11', 3)),
+       expects_none=True),
+    # Not back at all
+    PF(func=comeback,
+       habit=('2013-03-01', 'day'),
+       data=(('2013-03-01', 3), ('2013-03-02', 3), ('2013-03-03', 4),
+             ('2013-03-04', 0), ('2013-03-05', 1), ('2013-03-06', 0)),
+       expects_none=True),
+    PF(func=comeback,
+       habit=('2013-03-01', 'week'),
+       data=(('2013-03-04', 3), ('2013-03-11', 3),
+             ('2013-03-18', 0), ('2013-03-25', 2),
+             ('2013-04-01', 5)),
+       expects_none=False),
+)
+
+def test_comeback(self, fixture):
+    _test_provider(self, fixture)
+
+helpers.attach_fixture_tests(TestProviders, test_comeback, COMEBACK_FIXTURES)
+
+
+
+class TestStoredEncouragement(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='foo@bar.com')
+        self.habit = Habit.objects.create(user=self.user, description='test',
+                                          start=datetime.date(2013, 3, 1),
+                                          resolution='day', target_value=1)
+        self.habit.record(self.habit.get_time_period(self.habit.start), 1)
+
+    def test_stores_for_latest_index(self):
+        text = store_encouragement(self.habit)
+        stored = HabitEncouragement.objects.get(habit=self.habit)
+        self.assertEqual(0, stored.index)
+        self.assertEqual(text, stored.text)
+
+    def test_stored_is_reused(self):
+        HabitEncouragement.objects.create(habit=self.habit, index=0, text='Hooray')
+        with helpers.assert_max_queries(1):
+            self.assertEqual('Hooray', stored_encouragement(self.habit))
+
+    def test_chosen_if_missing(self):
+        text = stored_encouragement(self.habit)
+        self.assertEqual(text, HabitEncouragement.objects.get(habit=self.habit).text)
+
+    def test_later_index_wins(self):
+        HabitEncouragement.objects.create(habit=self.habit, index=5, text='Hooray')
+        store_encouragement(self.habit, 3)
+        self.assertEqual('Hooray', stored_encouragement(self.habit))
+        store_encouragement(self.habit, 6)
+        self.assertEqual(6, HabitEncouragement.objects.get(habit=self.habit).index)
+
+    def test_stored_concurrently(self):
+        # Another request stores one between the update and the insert
+        savepoint = transaction.savepoint
+        def race(*args, **kwargs):
+            HabitEncouragement.objects.create(habit=self.habit, index=0, text='Hooray')
+            return savepoint(*args, **kwargs)
+        transaction.savepoint = race
+        try:
+            text = store_encouragement(self.habit, 3)
+        finally:
+            transaction.savepoint = savepoint
+
+        stored = HabitEncouragement.objects.get(habit=self.habit)
+        self.assertEqual(3, stored.index)
+        self.assertEqual(text, stored.text)
+
+
+class TestProviderQueryBudgets(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='foo@bar.com')
+
+
+def test_provider_query_budget(self, num_buckets):
+    start = datetime.date(2013, 1, 7)
+    habit = Habit.objects.create(user=self.user, description='test',
+                                 start=start, resolution='week',
+                                 target_value=2)
+    for i in range(num_buckets):
+        tp = habit.get_time_period(start + datetime.timedelta(days=7 * i))
+        habit.record(tp, i % 3)
+
+    for provider in providers._providers:
+        with helpers.assert_max_queries(5):
+            provider(habit)
+
+helpers.attach_fixture_tests(TestProviderQueryBudgets, test_provider_query_budget, [1, 50])
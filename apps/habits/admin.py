@@ -1,11 +1,30 @@
 from django.contrib import admin
 
+from apps.habits import deletion
 from apps.habits.models import Habit
 
 
 class HabitAdmin(admin.ModelAdmin):
-    list_display = ('id', 'resolution', 'start', 'user')
+    list_display = ('id', 'resolution', 'start', 'user', 'scheduled_for_deletion')
     raw_id_fields = ('user',)
+    readonly_fields = ('scheduled_for_deletion',)
+    actions = ['schedule_for_deletion']
+
+    def get_actions(self, request):
+        # See CustomUserAdmin.get_actions
+        actions = super(HabitAdmin, self).get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def schedule_for_deletion(self, request, queryset):
+        for habit in queryset:
+            deletion.schedule_habit(habit)
+        self.message_user(request, "%d habits scheduled for deletion." %
+                          len(queryset))
+    schedule_for_deletion.short_description = "Schedule selected habits for deletion"
 
 
 admin.site.register(Habit, HabitAdmin)
@@ -0,0 +1,77 @@
+"""
+Backfills (see ``lib.backfill``) of the data derived from each habit's
+buckets, for rebuilding it on a live database, and of columns added by
+migrations which would otherwise lock the buckets table to fill them in.
+"""
+from django.db import connection
+from django.db.models import Max, Min
+from south.models import MigrationHistory
+
+from apps.habits import runs
+from apps.habits.models import RESOLUTION_CODES, Bucket, Habit, rebuild_cumulative_sums
+from lib.backfill import Backfill, backfills
+
+
+@backfills.register
+class BuildRuns(Backfill):
+    name = 'habits.runs'
+    model = Habit
+    chunk_size = 100
+
+    def process(self, habits):
+        count = 0
+        for habit in habits.iterator():
+            runs.rebuild(habit)
+            count += 1
+        return count
+
+
+@backfills.register
+class CumulativeSums(Backfill):
+    name = 'habits.cumulative_sums'
+    model = Habit
+    chunk_size = 100
+
+    def process(self, habits):
+        # Locked, as Habit.record does, so that data recorded meanwhile
+        # isn't added to sums which are about to be replaced
+        habit_ids = list(habits.select_for_update().values_list('pk', flat=True))
+        for habit_id in habit_ids:
+            rebuild_cumulative_sums(habit_id)
+        return len(habit_ids)
+
+
+@backfills.register
+class BucketResolutionCodes(Backfill):
+    """
+    Fill in ``habits_bucket.resolution_code``, which migration 0023 adds,
+    from the resolution's name. Run it between migrations 0023 and 0024
+    (which swaps the columns, and fills in any rows written since), with
+    --restart if it was run before 0023. The release before Bucket.resolution
+    became a ResolutionField serves traffic meanwhile: see 0024.
+    """
+    name = 'habits.bucket_resolution_codes'
+    model = Bucket
+    chunk_size = 5000
+
+    def queryset(self):
+        # Nothing to do before 0023, or after 0024
+        applied = MigrationHistory.objects.filter(app_name='habits').values_list('migration', flat=True)
+        if ('0023_auto__add_field_bucket_resolution_code' not in applied or
+                '0024_bucket_resolution_smallint' in applied):
+            return Bucket.objects.none()
+        return Bucket.objects.all()
+
+    def process(self, buckets):
+        # Bucket.resolution is already the column of codes which 0024 makes
+        # of this one, so this is SQL rather than the ORM
+        bounds = buckets.aggregate(lo=Min('pk'), hi=Max('pk'))
+        if bounds['lo'] is None:
+            return 0
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE habits_bucket SET resolution_code = CASE resolution %s END
+            WHERE id BETWEEN %%s AND %%s AND resolution_code IS NULL
+        """ % ' '.join("WHEN '%s' THEN %d" % code for code in RESOLUTION_CODES.items()),
+            [bounds['lo'], bounds['hi']])
+        return cursor.rowcount
@@ -0,0 +1,216 @@
+"""
+Benchmarks of the hot paths, run against a seeded database by the bench
+management command.
+
+Each benchmark is a function taking a ``BenchContext`` and an iteration
+number. It does any setup it needs and returns a callable, which is what
+gets timed.
+"""
+import datetime
+import random
+import time
+
+from django.core import mail
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.client import Client
+from django.utils import timezone
+
+from apps.encouragements import get_encouragement
+from apps.habits.models import Habit, _increment_bucket
+from apps.habits.seeding import SEED_PASSWORD
+from lib.querylog import QueryLog
+
+
+class BenchmarkRegistry(object):
+    """
+    An ordered registry of benchmark functions.
+    """
+
+    def __init__(self):
+        self._benchmarks = []
+
+    def register(self, func):
+        if not callable(func):
+            raise ValueError("func must be callable")
+        self._benchmarks.append(func)
+        return func
+
+    def names(self):
+        return [b.__name__ for b in self._benchmarks]
+
+    def get(self, name):
+        for b in self._benchmarks:
+            if b.__name__ == name:
+                return b
+        raise KeyError(name)
+
+
+benchmarks = BenchmarkRegistry()
+
+
+class BenchContext(object):
+    """
+    The seeded data the benchmarks run against: ``habits`` to cycle through,
+    and a test ``client`` logged in as ``user``, the owner of the first one.
+    """
+
+    def __init__(self, habits, today=None):
+        if not habits:
+            raise ValueError("No habits to benchmark")
+        self.habits = habits
+        self.today = today or datetime.date.today()
+        self.user = habits[0].user
+        self.client = Client()
+        if not self.client.login(email=self.user.email, password=SEED_PASSWORD):
+            raise ValueError("Couldn't log in as %s" % self.user.email)
+
+    def habit(self, i):
+        return self.habits[i % len(self.habits)]
+
+    def period(self, i):
+        habit = self.habit(i)
+        return habit, habit.get_time_period(self.today)
+
+
+@benchmarks.register
+def habit_record(ctx, i):
+    habit, period = ctx.period(i)
+    return lambda: habit.record(period, 1)
+
+
+@benchmarks.register
+def increment_bucket(ctx, i):
+    habit, period = ctx.period(i)
+    return lambda: _increment_bucket(habit, period, 1)
+
+
+@benchmarks.register
+def unentered_time_periods(ctx, i):
+    habit = ctx.habit(i)
+    return lambda: habit.get_unentered_time_periods(ctx.today)
+
+
+@benchmarks.register
+def streaks(ctx, i):
+    habit = ctx.habit(i)
+    return lambda: list(habit.get_streaks())
+
+
+@benchmarks.register
+def run_streaks(ctx, i):
+    habit = ctx.habit(i)
+    return lambda: list(habit.get_run_streaks())
+
+
+@benchmarks.register
+def encouragement(ctx, i):
+    habit = ctx.habit(i)
+    # Providers are tried in a random order; make it the same every run
+    random.seed(i)
+    return lambda: get_encouragement(habit)
+
+
+@benchmarks.register
+def dashboard(ctx, i):
+    return lambda: ctx.client.get(reverse('homepage'))
+
+
+@benchmarks.register
+def habit_performance(ctx, i):
+    return lambda: ctx.client.get(reverse('habit_performance'))
+
+
+@benchmarks.register
+def connection_cycle(ctx, i):
+    # What every request does: Django closes the connection at the end of
+    # each, so the next one connects again (or, when pooled, checks one out)
+    habit = ctx.habit(i)
+
+    def cycle():
+        connection.close()
+        Habit.objects.filter(pk=habit.pk).exists()
+    return cycle
+
+
+@benchmarks.register
+def sendreminders(ctx, i):
+    # Make every scheduled reminder due now
+    now = timezone.now().replace(minute=0, second=0, microsecond=0)
+    Habit.objects.filter(reminder_utc_hour=now.hour).update(next_reminder_at=now)
+    mail.outbox = []
+    return lambda: call_command('sendreminders')
+
+
+@benchmarks.register
+def senddatacollections(ctx, i):
+    mail.outbox = []
+    return lambda: call_command('senddatacollections')
+
+
+def percentile(values, p):
+    """
+    Return the ``p``th percentile (0-100) of ``values``, by nearest rank.
+    """
+    values = sorted(values)
+    rank = int(round(p / 100.0 * (len(values) - 1)))
+    return values[rank]
+
+
+def run_benchmark(func, ctx, iterations):
+    """
+    Run the benchmark ``func`` ``iterations`` times. Returns a dict of
+    timing percentiles (in ms) and the median number of queries.
+    """
+    times = []
+    queries = []
+    for i in range(iterations):
+        timed = func(ctx, i)
+        with QueryLog() as log:
+            started = time.time()
+            timed()
+            times.append((time.time() - started) * 1000)
+        queries.append(log.count)
+
+    return {
+        'iterations': iterations,
+        'p50': round(percentile(times, 50), 3),
+        'p90': round(percentile(times, 90), 3),
+        'p99': round(percentile(times, 99), 3),
+        'max': round(max(times), 3),
+        'queries': percentile(queries, 50),
+    }
+
+
+def compare(results, baseline, tolerance, min_delta):
+    """
+    Return a list of messages describing each benchmark in ``results``
+    which is slower than in ``baseline`` by more than the fraction
+    ``tolerance`` (and by more than ``min_delta`` ms, to ignore noise), runs
+    more queries, failed, or has no baseline; and each benchmark in
+    ``baseline`` missing from ``results``.
+    """
+    regressions = []
+    for name in sorted(set(baseline) - set(results)):
+        regressions.append('%s: missing from results' % name)
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if 'error' in result:
+            regressions.append('%s: failed with %s' % (name, result['error']))
+            continue
+        if base is None:
+            regressions.append('%s: no baseline' % name)
+            continue
+        if 'error' in base:
+            # Fixed since the baseline, so nothing to compare with
+            continue
+        for key in ('p50', 'p90'):
+            if (result[key] > base[key] * (1 + tolerance) and
+                    result[key] - base[key] > min_delta):
+                regressions.append('%s: %s %.3fms, was %.3fms' % (
+                    name, key, result[key], base[key]))
+        if result['queries'] > base['queries']:
+            regressions.append('%s: %d queries, was %d' % (
+                name, result['queries'], base['queries']))
+    return regressions
@@ -0,0 +1,121 @@
+"""
+Caching of each user's habit list, and of the dashboard's row for each
+habit, so that a warm dashboard touches neither the habit nor the bucket
+tables.
+
+Cached values are keyed on version counters (one per habit, and one per
+user for their list of habits), which are bumped whenever the habit or its
+data changes; nothing is ever deleted from the cache, and everything
+expires after DASHBOARD_CACHE_TIMEOUT seconds. Dashboard rows are
+also keyed on the habit's current time period, so that they roll over
+(and "up to date" flips back) at the period boundary.
+
+Nothing is cached unless DASHBOARD_CACHE is on, since the version counters
+only work in a cache shared by every process. What is cached is read from
+the primary database, even inside ``use_replica``: a lagging replica's rows
+would otherwise be cached under the new version, and stay there.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from lib.dbrouter import use_primary
+
+
+def _version_key(kind, pk):
+    return 'version:%s:%d' % (kind, pk)
+
+
+def _new_version():
+    # If a counter is evicted, start it again above any value it had, so
+    # that stale entries keyed on an old value can't come back.
+    return int(time.time() * 1000)
+
+
+def get_versions(kind, pks):
+    """
+    Return a dict of the current version of each of ``pks``.
+    """
+    keys = dict((_version_key(kind, pk), pk) for pk in pks)
+    found = cache.get_many(keys.keys())
+    versions = {}
+    for key, pk in keys.items():
+        if key not in found:
+            version = _new_version()
+            if not cache.add(key, version, settings.DASHBOARD_CACHE_TIMEOUT):
+                # Someone else got there first
+                version = cache.get(key, version)
+            found[key] = version
+        versions[pk] = found[key]
+    return versions
+
+
+def bump_version(kind, pk):
+    key = _version_key(kind, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), settings.DASHBOARD_CACHE_TIMEOUT)
+
+
+def get_habit_list(user):
+    """
+    Return a list of ``user``'s habits, from the cache if it can be.
+    """
+    if not settings.DASHBOARD_CACHE:
+        return list(user.habits.filter(scheduled_for_deletion__isnull=True))
+
+    version = get_versions('user', [user.pk])[user.pk]
+    key = 'habits:%d:%d' % (user.pk, version)
+    habits = cache.get(key)
+    if habits is None:
+        with use_primary():
+            habits = list(user.habits.filter(scheduled_for_deletion__isnull=True))
+        cache.set(key, habits, settings.DASHBOARD_CACHE_TIMEOUT)
+    return habits
+
+
+def get_fragments(name, habits, render, today=None):
+    """
+    Return a list of the fragment ``name`` for each of ``habits``, from the
+    cache where possible. ``render`` is called with a list of the habits
+    whose fragments aren't cached, and returns a list of their fragments.
+    """
+    if not settings.DASHBOARD_CACHE:
+        return render(habits)
+    if today is None:
+        today = datetime.date.today()
+
+    versions = get_versions('habit', [h.pk for h in habits])
+    keys = ['%s:%d:%d:%d' % (name, h.pk, versions[h.pk],
+                             h.get_time_period(today).index)
+            for h in habits]
+    fragments = cache.get_many(keys)
+
+    missing = [(key, h) for key, h in zip(keys, habits) if key not in fragments]
+    if missing:
+        with use_primary():
+            rendered = render([h for key, h in missing])
+        new = dict(zip([key for key, h in missing], rendered))
+        cache.set_many(new, settings.DASHBOARD_CACHE_TIMEOUT)
+        fragments.update(new)
+
+    return [fragments[key] for key in keys]
+
+
+def habit_changed(sender, instance=None, **kwargs):
+    # A receiver for the habit signals, and for post_save and post_delete of
+    # habits. habit_archived and habit_data_recorded have the habit as their
+    # sender.
+    habit = instance or sender
+    bump_version('habit', habit.pk)
+    bump_version('user', habit.user_id)
+
+
+def user_changed(sender, instance, **kwargs):
+    # A receiver for post_save of users. Makes sure that a new user doesn't
+    # find a list of habits cached for an earlier user with the same pk.
+    if kwargs.get('created'):
+        bump_version('user', instance.pk)
@@ -0,0 +1,92 @@
+"""
+Precomputed calendar facts for the rules about time periods: which days of
+a month fall on each weekday, and which dates end a time period at each
+resolution. The tables cover the years in CALENDAR_INDEX_YEARS, and are
+built the first time they're needed; dates outside those years are worked
+out when they're asked about.
+"""
+import calendar
+import datetime
+
+from django.conf import settings
+
+from apps.habits.models import RESOLUTIONS
+
+_RESOLUTION_BITS = dict((r, 1 << i) for i, (r, _) in enumerate(RESOLUTIONS))
+
+_tables = None
+
+
+def _weekday_occurrences(year, month):
+    first_weekday, num_days = calendar.monthrange(year, month)
+    return tuple(
+        tuple(range(1 + (weekday - first_weekday) % 7, num_days + 1, 7))
+        for weekday in range(7)
+    )
+
+
+def _period_end_bits(date):
+    weekday = date.weekday()
+    ends = ['day']
+    ends.append('weekday' if weekday < 5 else 'weekendday')
+    if weekday == 6:
+        ends.append('week')
+    if (date + datetime.timedelta(days=1)).day == 1:
+        ends.append('month')
+    return sum(_RESOLUTION_BITS[r] for r in ends)
+
+
+class _Tables(object):
+
+    def __init__(self, first_year, last_year):
+        self.months = {}
+        for year in range(first_year, last_year + 1):
+            for month in range(1, 13):
+                self.months[(year, month)] = _weekday_occurrences(year, month)
+
+        # By day, from the first of first_year
+        self.first_day = datetime.date(first_year, 1, 1).toordinal()
+        last_day = datetime.date(last_year, 12, 31).toordinal()
+        self.period_ends = bytearray(
+            _period_end_bits(datetime.date.fromordinal(day))
+            for day in range(self.first_day, last_day + 1)
+        )
+
+
+def _get_tables():
+    global _tables
+    if _tables is None:
+        _tables = _Tables(*settings.CALENDAR_INDEX_YEARS)
+    return _tables
+
+
+def weekday_occurrences(year, month):
+    """
+    Return a tuple with, for each weekday (Monday=0...Sunday=6), a tuple of
+    the days of the month which fall on it.
+    """
+    try:
+        return _get_tables().months[(year, month)]
+    except KeyError:
+        return _weekday_occurrences(year, month)
+
+
+def is_last_weekday_of_month(date):
+    """
+    Whether ``date`` is the last of its weekday in its month (the last
+    Friday of March, say).
+    """
+    return weekday_occurrences(date.year, date.month)[date.weekday()][-1] == date.day
+
+
+def ends_period(date, resolution):
+    """
+    Whether ``date`` is the last day of a time period at ``resolution``.
+    """
+    tables = _get_tables()
+    day = date.toordinal() - tables.first_day
+    if 0 <= day < len(tables.period_ends):
+        bits = tables.period_ends[day]
+    else:
+        bits = _period_end_bits(date)
+    return bool(bits & _RESOLUTION_BITS[resolution])
@@ -0,0 +1,121 @@
+"""
+Deleting users and habits a chunk at a time.
+
+Deleting a model through the ORM first collects everything which cascades
+from it into memory, then deletes it all in one transaction: for a user who
+has been around for years, that's thousands of buckets, with
+``habits_bucket`` locked until it's done. Instead, users and habits are
+*scheduled* for deletion (which hides them straight away: see
+``Habit.for_user``), and the
+deletescheduled command deletes their buckets and runs in small chunks,
+each committed on its own, before deleting what little is left through the
+ORM. The schedule is only cleared by that final delete, so if the command
+is interrupted, running it again carries on from where it stopped.
+"""
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.accounts.models import User
+from apps.habits import caching
+from apps.habits.models import Bucket, Habit, Run
+
+# Rows deleted per statement
+CHUNK_SIZE = 1000
+
+# Models with a ``habit`` foreign key which can have many rows per habit
+_CHUNKED_MODELS = (Bucket, Run)
+
+
+def schedule_user(user, when=None):
+    """
+    Schedule ``user`` and all of their habits for deletion, deactivating the
+    account so that they can't log in in the meantime.
+    """
+    now = timezone.now()
+    when = when or now
+    User.objects.filter(pk=user.pk).update(scheduled_for_deletion=when,
+                                           is_active=False)
+    habits = Habit.objects.filter(user=user)
+    pks = list(habits.values_list('pk', flat=True))
+    # update() doesn't send post_save, so set ``modified`` for the reminder
+    # scheduler, and invalidate the cached dashboard, by hand
+    habits.update(scheduled_for_deletion=when, archived=True, modified=now)
+    for pk in pks:
+        caching.bump_version('habit', pk)
+    caching.bump_version('user', user.pk)
+
+
+def schedule_habit(habit, when=None):
+    """
+    Schedule ``habit`` for deletion, archiving it so that it's off the
+    dashboard, and no more reminders are sent for it.
+    """
+    now = timezone.now()
+    when = when or now
+    Habit.objects.filter(pk=habit.pk).update(scheduled_for_deletion=when,
+                                             archived=True, modified=now)
+    # As in schedule_user
+    caching.habit_changed(habit)
+
+
+def _delete_chunks(model, habit_id, chunk_size, pause):
+    table = connection.ops.quote_name(model._meta.db_table)
+    sql = """
+        DELETE FROM %(table)s WHERE id IN (
+            SELECT id FROM %(table)s WHERE habit_id = %%s LIMIT %%s
+        )
+    """ % {'table': table}
+    deleted = 0
+    cursor = connection.cursor()
+    while True:
+        cursor.execute(sql, [habit_id, chunk_size])
+        transaction.commit_unless_managed()
+        deleted += cursor.rowcount
+        if cursor.rowcount < chunk_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def delete_habit(habit, chunk_size=CHUNK_SIZE, pause=0):
+    """
+    Delete ``habit`` and everything recorded for it, ``chunk_size`` rows at
+    a time, waiting ``pause`` seconds between chunks. Returns the number of
+    rows deleted.
+    """
+    deleted = 0
+    for model in _CHUNKED_MODELS:
+        deleted += _delete_chunks(model, habit.pk, chunk_size, pause)
+    # Only a few rows left to cascade to
+    habit.delete()
+    return deleted + 1
+
+
+def delete_user(user, chunk_size=CHUNK_SIZE, pause=0):
+    """
+    Delete ``user`` and all of their habits, as ``delete_habit`` does.
+    Returns the number of rows deleted.
+    """
+    deleted = 0
+    for habit in Habit.objects.filter(user=user):
+        deleted += delete_habit(habit, chunk_size, pause)
+    user.delete()
+    return deleted + 1
+
+
+def delete_scheduled(chunk_size=CHUNK_SIZE, pause=0, now=None):
+    """
+    Delete every habit and user scheduled for deletion before ``now``
+    (defaults to now). Yields ``(model, pk, rows deleted)`` for each.
+    """
+    now = now or timezone.now()
+    habits = Habit.objects.filter(scheduled_for_deletion__lte=now,
+                                  user__scheduled_for_deletion__isnull=True)
+    for habit in habits.iterator():
+        yield Habit, habit.pk, delete_habit(habit, chunk_size, pause)
+    users = User.objects.filter(scheduled_for_deletion__lte=now)
+    for user in users.iterator():
+        pk = user.pk
+        yield User, pk, delete_user(user, chunk_size, pause)
@@ -1,4 +1,7 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.validators import EMPTY_VALUES
+from django.forms.models import BaseModelFormSet
 from apps.habits.models import Habit 
 from apps.onboarding.forms import DAYS_OF_WEEK, HOURS, ReminderDaysField
 
@@ -24,3 +27,41 @@ class HabitEmailOptionsForm(forms.ModelForm):
     class Meta:
         model = Habit
         fields = ('send_data_collection_emails',)
+
+
+class _ExistingObjectField(forms.ModelChoiceField):
+    """
+    The hidden primary key field of a model formset, which finds its object
+    among the formset's objects (fetched in one query) rather than running a
+    query for each form.
+    """
+
+    def __init__(self, formset, *args, **kwargs):
+        self.formset = formset
+        super(_ExistingObjectField, self).__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in EMPTY_VALUES:
+            return None
+        try:
+            pk = self.queryset.model._meta.pk.to_python(value)
+        except ValidationError:
+            pk = None
+        obj = pk is not None and self.formset._existing_object(pk)
+        if not obj:
+            raise ValidationError(self.error_messages['invalid_choice'])
+        return obj
+
+
+class BaseHabitEmailOptionsFormSet(BaseModelFormSet):
+
+    def add_fields(self, form, index):
+        super(BaseHabitEmailOptionsFormSet, self).add_fields(form, index)
+        field = form.fields[self._pk_field.name]
+        form.fields[self._pk_field.name] = _ExistingObjectField(
+            self,
+            field.queryset,
+            initial=field.initial,
+            required=False,
+            widget=field.widget,
+        )
@@ -0,0 +1,277 @@
+"""
+Drive the data recording flow (the links in data collection emails) against
+a running server with many concurrent users. See the loadtest management
+command.
+
+Each flow is one user clicking through from their email:
+
+    login        GET the auto login link, which redirects to...
+    record_form  GET the habit's record form
+    record_post  POST a value for each period on it, redirecting to...
+    encouragement
+
+Links are made, and the habits prepared, before any requests are sent, so
+the worker threads don't touch the database themselves.
+"""
+from collections import defaultdict, namedtuple
+from HTMLParser import HTMLParser
+import Queue
+import cookielib
+import threading
+import time
+import urllib
+import urllib2
+import urlparse
+
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models import F
+
+from apps.autologin.views import make_auto_login_link
+from apps.habits import runs
+from apps.habits.benchmarks import percentile
+from apps.habits.models import Habit, TimePeriod, rebuild_cumulative_sums
+
+STEPS = ('login', 'record_form', 'record_post', 'encouragement')
+
+Flow = namedtuple('Flow', 'habit_pk link')
+
+
+def prepare_flows(num_users):
+    """
+    Return a Flow for one habit of each of up to ``num_users`` seeded users.
+    Each habit's latest period is forgotten, so that there's at least one
+    period to record.
+    """
+    flows = []
+    seen = set()
+    habits = Habit.objects.filter(
+        archived=False,
+        user__email__startswith='load-',
+    ).select_related('user').order_by('pk')
+
+    for habit in habits.iterator():
+        if habit.user_id in seen:
+            continue
+        seen.add(habit.user_id)
+
+        forget_latest_period(habit)
+
+        link = make_auto_login_link(habit.user, redirect=reverse('habit_record', args=[habit.pk]))
+        flows.append(Flow(habit.pk, link))
+        if len(flows) == num_users:
+            break
+    return flows
+
+
+def forget_latest_period(habit):
+    """
+    Delete ``habit``'s latest bucket, and take out what recording it added
+    to the week and month buckets, runs and cumulative sums, so that
+    recording it again leaves them as they were.
+    """
+    latest = list(habit.get_buckets(order_by='-index')[:1])
+    if not latest:
+        return
+    bucket = latest[0]
+
+    # The lower resolution buckets which Habit.record adds to
+    if habit.resolution in ['day', 'weekday', 'weekendday']:
+        containing = ['week', 'month']
+    elif habit.resolution == 'week':
+        containing = ['month']
+    else:
+        containing = []
+
+    with transaction.commit_on_success():
+        if containing:
+            date = TimePeriod.from_index(habit.start, habit.resolution, bucket.index).date
+        for resolution in containing:
+            habit.buckets.filter(
+                resolution=resolution,
+                index=habit.get_time_period(date, resolution).index,
+            ).update(value=F('value') - bucket.value)
+        bucket.delete()
+        runs.rebuild(habit)
+        rebuild_cumulative_sums(habit.pk)
+
+
+class _NoRedirectHandler(urllib2.HTTPRedirectHandler):
+    # Each step of the flow is timed separately, so follow redirects by hand
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class _InputParser(HTMLParser):
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.inputs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'input':
+            self.inputs.append(dict(attrs))
+
+
+def record_form_data(html, value=1):
+    """
+    Return the POST data for the record form in ``html``, giving each
+    period ``value``.
+    """
+    parser = _InputParser()
+    parser.feed(html)
+    data = {}
+    for attrs in parser.inputs:
+        name = attrs.get('name')
+        if not name:
+            continue
+        if name.endswith('-value'):
+            data[name] = str(value)
+        elif attrs.get('type') == 'hidden':
+            data[name] = attrs.get('value', '')
+    return data
+
+
+class Result(object):
+    """
+    Latencies and errors of the requests made by a load test, by step.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.integrity_errors = 0
+        self.flows = 0
+        self.started = self.finished = None
+
+    def record(self, step, elapsed, error=None, body=''):
+        with self.lock:
+            if error is None:
+                self.latencies[step].append(elapsed * 1000)
+            else:
+                self.errors[step] += 1
+                if 'IntegrityError' in body:
+                    self.integrity_errors += 1
+
+    def summary(self):
+        duration = self.finished - self.started
+        requests = sum(len(l) for l in self.latencies.values())
+        errors = sum(self.errors.values())
+        steps = {}
+        for step in STEPS:
+            latencies = self.latencies[step]
+            steps[step] = {'requests': len(latencies), 'errors': self.errors[step]}
+            if latencies:
+                steps[step].update({
+                    'p50': round(percentile(latencies, 50), 3),
+                    'p90': round(percentile(latencies, 90), 3),
+                    'p99': round(percentile(latencies, 99), 3),
+                    'max': round(max(latencies), 3),
+                })
+        return {
+            'flows': self.flows,
+            'duration': round(duration, 3),
+            'flows_per_second': round(self.flows / duration, 3) if duration else None,
+            'requests_per_second': round((requests + errors) / duration, 3) if duration else None,
+            'error_rate': round(errors / float(requests + errors), 4) if requests + errors else 0,
+            'integrity_errors': self.integrity_errors,
+            'steps': steps,
+        }
+
+
+class _StepFailed(Exception):
+    pass
+
+
+def run_flow(base_url, flow, result, double_submit=False, timeout=30):
+    """
+    Click through one Flow, recording each request in ``result``.
+    """
+    cookies = cookielib.CookieJar()
+    opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(cookies),
+                                  _NoRedirectHandler())
+
+    def request(step, url, data=None):
+        url = urlparse.urljoin(base_url, url)
+        headers = {'Referer': url}
+        started = time.time()
+        try:
+            response = opener.open(urllib2.Request(url, data, headers), timeout=timeout)
+        except urllib2.HTTPError as e:
+            if e.code in (301, 302, 303):
+                response = e
+            else:
+                result.record(step, time.time() - started, error=e.code, body=e.read())
+                raise _StepFailed(step)
+        except Exception as e:
+            result.record(step, time.time() - started, error=e)
+            raise _StepFailed(step)
+        body = response.read()
+        result.record(step, time.time() - started)
+        return response, body
+
+    try:
+        response, _ = request('login', flow.link)
+        record_url = response.info().get('Location')
+        response, html = request('record_form', record_url)
+
+        data = record_form_data(html)
+        for cookie in cookies:
+            if cookie.name == 'csrftoken':
+                data['csrfmiddlewaretoken'] = cookie.value
+        data = urllib.urlencode(data)
+
+        if double_submit:
+            # The same form submitted twice at once, as by an impatient
+            # double click.
+            second = threading.Thread(target=lambda: _ignore(_StepFailed, request, 'record_post', record_url, data))
+            second.start()
+        response, _ = request('record_post', record_url, data)
+        if double_submit:
+            second.join()
+
+        encouragement_url = response.info().get('Location')
+        if encouragement_url:
+            request('encouragement', encouragement_url)
+    except _StepFailed:
+        return
+
+    with result.lock:
+        result.flows += 1
+
+
+def _ignore(exc_type, func, *args):
+    try:
+        func(*args)
+    except exc_type:
+        pass
+
+
+def run_load_test(base_url, flows, concurrency, double_submit=False, timeout=30):
+    """
+    Run ``flows`` against the server at ``base_url`` from ``concurrency``
+    threads. Returns a Result.
+    """
+    queue = Queue.Queue()
+    for flow in flows:
+        queue.put(flow)
+
+    result = Result()
+
+    def worker():
+        while True:
+            try:
+                flow = queue.get_nowait()
+            except Queue.Empty:
+                return
+            run_flow(base_url, flow, result, double_submit, timeout)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    result.started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    result.finished = time.time()
+    return result
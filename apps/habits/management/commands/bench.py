@@ -0,0 +1,127 @@
+from optparse import make_option
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from south.management.commands import patch_for_test_db_setup
+
+from apps.habits.benchmarks import (benchmarks, compare, run_benchmark,
+                                    BenchContext)
+from apps.habits.models import Habit
+from apps.habits.seeding import seed_load_data
+from lib.test_helpers import parse_isodate
+
+class Command(BaseCommand):
+    args = '[<benchmark> ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('--iterations', type='int', default=20,
+                    help='Number of times to run each benchmark.'),
+        make_option('--users', type='int', default=50,
+                    help='Number of users to seed the test database with.'),
+        make_option('--habits-per-user', type='int', default=3,
+                    help='Number of habits to seed for each user.'),
+        make_option('--years', type='int', default=2,
+                    help='Maximum age of each seeded habit, in years.'),
+        make_option('--seed', type='int', default=0,
+                    help='Random seed for the seeded data.'),
+        make_option('--today', default='2013-06-01',
+                    help='Date (YYYY-MM-DD) to seed data up to and to '
+                         'benchmark at.'),
+        make_option('--use-current-db', action='store_true', default=False,
+                    help="Benchmark the current database (which must already "
+                         "have been seeded) instead of a new test database."),
+        make_option('--output', default=None,
+                    help='File to write the results to, as JSON.'),
+        make_option('--baseline', default=None,
+                    help='Results file to compare against.'),
+        make_option('--tolerance', type='float', default=0.25,
+                    help='Fraction by which a benchmark may be slower than '
+                         'the baseline.'),
+        make_option('--min-delta', type='float', default=1.0,
+                    help='Ignore slowdowns smaller than this many ms.'),
+    )
+
+    def handle(self, *args, **options):
+        """
+        Time the hot paths (recording data, encouragements, the dashboard,
+        the reminder commands and so on) against a seeded database, and print
+        percentiles and query counts as JSON. With --baseline, fail if any
+        benchmark has got slower, runs more queries, fails, or is missing
+        from either the results or the baseline.
+
+        By default this creates, seeds and destroys a test database, and
+        sends email to a local stub.
+        """
+        if options['years'] < 1:
+            raise CommandError("--years must be at least 1")
+
+        names = list(args) or benchmarks.names()
+        unknown = set(names) - set(benchmarks.names())
+        if unknown:
+            raise CommandError("Unknown benchmarks: %s" % ', '.join(sorted(unknown)))
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            if args:
+                # Only those asked for are expected in the results
+                baseline = dict((name, result) for name, result in baseline.items()
+                                if name in names)
+
+        today = parse_isodate(options['today'])
+        # Set up as the test runner does
+        setup_test_environment()
+        no_debug = override_settings(DEBUG=False)
+        no_debug.enable()
+        if not options['use_current_db']:
+            old_name = connection.settings_dict['NAME']
+            # Migrate the test database, as the test runner does
+            patch_for_test_db_setup()
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            if not options['use_current_db']:
+                seed_load_data(users=options['users'],
+                               habits_per_user=options['habits_per_user'],
+                               years=options['years'],
+                               seed=options['seed'],
+                               today=today)
+            results = self.run(names, options['iterations'], today)
+        finally:
+            if not options['use_current_db']:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            no_debug.disable()
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+
+        if baseline is not None:
+            regressions = compare(results, baseline,
+                                  options['tolerance'], options['min_delta'])
+            if regressions:
+                raise CommandError("Benchmarks regressed:\n  %s" %
+                                   '\n  '.join(regressions))
+
+    def run(self, names, iterations, today):
+        habits = Habit.objects.select_related('user').filter(
+            user__email__startswith='load-',
+        ).order_by('pk')[:iterations]
+        try:
+            ctx = BenchContext(list(habits), today)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        results = {}
+        for name in names:
+            try:
+                results[name] = run_benchmark(benchmarks.get(name), ctx, iterations)
+            except Exception as e:
+                # Report it, and carry on with the other benchmarks
+                results[name] = {'error': '%s: %s' % (type(e).__name__, e)}
+        return results
@@ -0,0 +1,37 @@
+from optparse import make_option
+
+from django.core.management.base import CommandError
+
+from apps.habits import deletion
+from lib.batchprofile import ProfiledCommand
+
+class Command(ProfiledCommand):
+    option_list = ProfiledCommand.option_list + (
+        make_option('--chunk-size', type='int', default=deletion.CHUNK_SIZE,
+                    help='Number of rows to delete at a time.'),
+        make_option('--pause', type='float', default=0.1,
+                    help='Seconds to wait between chunks.'),
+    )
+
+    def handle(self, *args, **options):
+        """
+        Delete the users and habits scheduled for deletion (from the admin),
+        a chunk of their buckets and runs at a time, so that deleting even a
+        long-lived account never holds locks for long. Each chunk is
+        committed on its own, so an interrupted run can just be started
+        again. This command should be called on a cronjob once a day.
+        """
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        scheduled = deletion.delete_scheduled(options['chunk_size'], options['pause'])
+        deleted = 0
+        for model, pk, rows in self.profile.iterate(scheduled, phase='delete'):
+            deleted += 1
+            if int(options['verbosity']) > 1:
+                self.stdout.write('Deleted %s %d (%d rows)' % (
+                    model._meta.verbose_name, pk, rows))
+
+        if int(options['verbosity']) > 0:
+            self.stdout.write('Deleted %d scheduled users and habits' %
+                              deleted)
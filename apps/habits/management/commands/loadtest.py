@@ -0,0 +1,52 @@
+from optparse import make_option
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.habits.loadtest import prepare_flows, run_load_test
+
+class Command(BaseCommand):
+    args = '<base url>'
+    option_list = BaseCommand.option_list + (
+        make_option('--users', type='int', default=100,
+                    help='Number of seeded users to click through.'),
+        make_option('--concurrency', type='int', default=10,
+                    help='Number of users clicking through at once.'),
+        make_option('--double-submit', action='store_true', default=False,
+                    help='Submit every record form twice at once.'),
+        make_option('--timeout', type='int', default=30,
+                    help='Seconds to wait for each response.'),
+        make_option('--output', default=None,
+                    help='File to write the results to, as JSON.'),
+    )
+
+    def handle(self, *args, **options):
+        """
+        Simulate a burst of users clicking through from their data collection
+        emails to record their habits, against the server at the given base
+        URL (e.g. a local gunicorn), and report throughput, latencies and
+        error rates as JSON.
+
+        Needs a database seeded with seed_load_data, shared with the server.
+        Each run deletes the latest bucket of each habit it uses, so don't run
+        it against production.
+        """
+        if len(args) != 1:
+            raise CommandError("Usage: loadtest %s" % self.args)
+        if options['concurrency'] <= 0:
+            raise CommandError("--concurrency must be positive")
+
+        flows = prepare_flows(options['users'])
+        if not flows:
+            raise CommandError("No seeded users found; run seed_load_data first")
+
+        result = run_load_test(args[0], flows,
+                               concurrency=options['concurrency'],
+                               double_submit=options['double_submit'],
+                               timeout=options['timeout'])
+
+        output = json.dumps(result.summary(), indent=2, sort_keys=True)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
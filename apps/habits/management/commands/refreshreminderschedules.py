@@ -0,0 +1,34 @@
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from apps.accounts.models import User
+from apps.habits.models import Habit, utc_offset_minutes
+from lib.batchprofile import ProfiledCommand
+
+class Command(ProfiledCommand):
+
+    def handle(self, *args, **kwargs):
+        """
+        Reconvert habit reminder schedules to UTC for every timezone whose UTC
+        offset has changed (usually a daylight saving transition) since they
+        were last converted. This command should be called on a cronjob once
+        an hour, shortly before sendreminders.
+        """
+        now = timezone.now()
+        zones = User.objects.filter(
+            habits__reminder_days__gt=0,
+        ).values_list('timezone', flat=True).order_by().distinct()
+
+        for zone in zones:
+            offset = utc_offset_minutes(User(timezone=zone).get_timezone(), now)
+            stale = Habit.objects.filter(
+                user__timezone=zone,
+                reminder_days__gt=0,
+            ).exclude(
+                reminder_utc_offset=offset,
+            ).select_related('user')
+
+            for habit in self.profile.iterate(stale.iterator()):
+                with self.profile.phase('save'):
+                    habit.update_reminder_schedule(now)
+                    habit.save()
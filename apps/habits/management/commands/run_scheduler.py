@@ -0,0 +1,115 @@
+import datetime
+from optparse import make_option
+import os
+import signal
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_connection, reset_queries
+from django.utils import timezone
+
+from apps.habits.scheduler import ReminderScheduler
+from lib.metrics import statsd
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--poll-interval', type='int', default=30,
+                    help='Seconds between polls for changed habits.'),
+        make_option('--heartbeat-interval', type='int', default=60,
+                    help='Seconds between heartbeat lines.'),
+        make_option('--heartbeat-file', default=None,
+                    help='File to touch on every heartbeat.'),
+        make_option('--spread-minutes', type='int',
+                    default=settings.REMINDER_SPREAD_MINUTES,
+                    help='Minutes over which to spread reminders due at the same time.'),
+        make_option('--poll-overlap', type='int',
+                    default=settings.REMINDER_POLL_OVERLAP_SECONDS,
+                    help='Seconds by which each poll overlaps the last.'),
+        make_option('--data-collection-hour', type='int',
+                    default=settings.DATA_COLLECTION_HOUR,
+                    help='Hour (UTC) at which to send data collection emails. '
+                         'Pass -1 to leave them to cron.'),
+    )
+
+    def handle(self, *args, **options):
+        """
+        Run forever, sending habit reminders as they fall due and data
+        collection emails once a day. Use this instead of the sendreminders
+        and senddatacollections cronjobs, not as well as them.
+        """
+        if options['poll_interval'] <= 0:
+            raise CommandError("--poll-interval must be positive")
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        scheduler = ReminderScheduler(
+            spread=datetime.timedelta(minutes=options['spread_minutes']),
+            overlap=datetime.timedelta(seconds=options['poll_overlap']),
+        )
+        grace = datetime.timedelta(hours=settings.REMINDER_GRACE_HOURS)
+        poll_interval = datetime.timedelta(seconds=options['poll_interval'])
+        heartbeat_interval = datetime.timedelta(seconds=options['heartbeat_interval'])
+        collection_hour = options['data_collection_hour']
+
+        now = timezone.now()
+        next_poll = next_heartbeat = now
+        # Don't resend today's data collection emails if we're restarted after
+        # they've gone out.
+        collected_on = now.date() if now.hour > collection_hour else None
+        sent = 0
+
+        while self.running:
+            now = timezone.now()
+
+            if now >= next_poll:
+                scheduler.refresh(now)
+                next_poll = now + poll_interval
+
+            dispatched = scheduler.dispatch_due(now, grace)
+            if dispatched:
+                statsd.incr('scheduler.sent', dispatched)
+                sent += dispatched
+
+            if now.hour == collection_hour and collected_on != now.date():
+                call_command('senddatacollections')
+                collected_on = now.date()
+
+            if now >= next_heartbeat:
+                self.heartbeat(now, scheduler, sent, options['heartbeat_file'])
+                next_heartbeat = now + heartbeat_interval
+
+            # Long-running process: don't hold a connection (or, with DEBUG,
+            # a query log) open between wakeups.
+            reset_queries()
+            close_connection()
+
+            wake_at = min(filter(None, [scheduler.next_fire_time(),
+                                        next_poll,
+                                        next_heartbeat]))
+            self.sleep((wake_at - timezone.now()).total_seconds())
+
+    def heartbeat(self, now, scheduler, sent, heartbeat_file):
+        next_fire = scheduler.next_fire_time()
+        self.stdout.write('heartbeat at=%s pending=%d sent=%d next=%s' % (
+            now.isoformat(),
+            len(scheduler),
+            sent,
+            next_fire.isoformat() if next_fire else '-',
+        ))
+        statsd.gauge('scheduler.pending', len(scheduler))
+        if heartbeat_file:
+            with open(heartbeat_file, 'a'):
+                os.utime(heartbeat_file, None)
+
+    def sleep(self, seconds):
+        # Sleep in short steps so that a SIGTERM is handled promptly.
+        deadline = time.time() + max(seconds, 0)
+        while self.running and time.time() < deadline:
+            time.sleep(min(1, deadline - time.time()))
+
+    def stop(self, signum, frame):
+        self.running = False
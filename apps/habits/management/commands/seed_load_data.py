@@ -0,0 +1,51 @@
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.habits.seeding import seed_load_data, SEED_PASSWORD
+from lib.test_helpers import parse_isodate
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--users', type='int', default=100,
+                    help='Number of users to create.'),
+        make_option('--habits-per-user', type='int', default=3,
+                    help='Number of habits to create for each user.'),
+        make_option('--years', type='int', default=2,
+                    help='Maximum age of each habit, in years.'),
+        make_option('--seed', type='int', default=0,
+                    help='Random seed. Each seed creates different users.'),
+        make_option('--today', default=None,
+                    help='Date (YYYY-MM-DD) to generate data up to. '
+                         'Defaults to today.'),
+        make_option('--chunk-size', type='int', default=5000,
+                    help='Number of rows to insert at a time.'),
+    )
+
+    def handle(self, *args, **options):
+        """
+        Fill the database with made-up users, habits and data for load testing
+        and benchmarking. The same options always create the same data. Don't
+        run this against production.
+        """
+        if options['years'] < 1:
+            raise CommandError("--years must be at least 1")
+
+        today = options['today'] and parse_isodate(options['today'])
+        started = time.time()
+        try:
+            users, habits, buckets = seed_load_data(
+                users=options['users'],
+                habits_per_user=options['habits_per_user'],
+                years=options['years'],
+                seed=options['seed'],
+                today=today,
+                chunk_size=options['chunk_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write('Created %d users, %d habits and %d buckets in %.1fs. '
+                          'Every user\'s password is "%s".' % (
+            users, habits, buckets, time.time() - started, SEED_PASSWORD))
@@ -1,9 +1,12 @@
-from django.core.management.base import BaseCommand, CommandError
+from django.core.mail import get_connection
+from django.core.management.base import CommandError
 
 from apps.habits.models import Habit
 from apps.habits.reminders import send_data_collection_email
+from lib.batchprofile import ProfiledCommand
+from lib.dbrouter import use_replica
 
-class Command(BaseCommand):
+class Command(ProfiledCommand):
 
     def handle(self, *args, **kwargs):
         """
@@ -11,6 +14,16 @@ class Command(BaseCommand):
         called on a cronjob once a day (probably at the start of the working
         day).
         """
-        for habit in Habit.objects.filter(send_data_collection_emails=True):
-            send_data_collection_email(habit)
-
+        habits = Habit.objects.filter(send_data_collection_emails=True).select_related('user')
+        # One connection to the mail server for the whole run
+        connection = get_connection()
+        try:
+            with use_replica():
+                for habit in self.profile.iterate(habits.iterator()):
+                    with self.profile.phase('render'):
+                        msg = send_data_collection_email(habit, send=False)
+                    if msg is not None:
+                        with self.profile.phase('send'):
+                            connection.send_messages([msg])
+        finally:
+            connection.close()
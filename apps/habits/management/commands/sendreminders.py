@@ -1,23 +1,63 @@
-from django.core.management.base import BaseCommand, CommandError
+import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import CommandError
 from django.utils import timezone
 
 from apps.habits.models import Habit
-from apps.habits.reminders import send_reminder_email
+from apps.habits.reminders import (claim_due_reminders, release_reminders,
+                                   send_reminder_email)
+from lib.batchprofile import ProfiledCommand
+from lib.dbrouter import use_replica
+
+# Due habits claimed at a time
+CHUNK_SIZE = 100
 
-class Command(BaseCommand):
+class Command(ProfiledCommand):
 
     def handle(self, *args, **kwargs):
         """
         Send all pending habit reminders. This command should be called on a
         cronjob once an hour (ideally shortly after the top of the hour).
-        """
-        now = timezone.now().replace(minute=0, second=0, microsecond=0)
-        for habit in Habit.scheduled_for_reminder(now.weekday(), now.hour):
-            # Only send the reminder if either
-            #   a) the habit has never had any reminders send for it
-            #   b) the habit last had a reminder sent at least an hour ago
-            if habit.reminder_last_sent is None or habit.reminder_last_sent < now:
-                habit.reminder_last_sent = now
-                habit.save()
-                send_reminder_email(habit)
 
+        Reminders missed by a late or skipped run are caught up, as long as
+        they fell due no more than REMINDER_GRACE_HOURS ago. So are those
+        which were claimed but not sent because sending another one failed.
+        """
+        now = timezone.now()
+        grace = datetime.timedelta(hours=settings.REMINDER_GRACE_HOURS)
+        # One connection to the mail server for the whole run
+        connection = get_connection()
+        try:
+            # Find the due habits on the replica. Claiming reminders is a
+            # conditional update on the primary, so one which the replica is
+            # behind on is skipped rather than sent twice.
+            with use_replica():
+                due = self.profile.iterate(Habit.due_for_reminder(now).iterator())
+                while True:
+                    chunk = list(islice(due, CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    previous = dict((habit.pk, (habit.next_reminder_at,
+                                                habit.reminder_last_sent))
+                                    for habit in chunk)
+                    with self.profile.phase('claim'):
+                        habits = claim_due_reminders(chunk, now, grace)
+                    sent = 0
+                    try:
+                        for habit in habits:
+                            with self.profile.phase('render'):
+                                msg = send_reminder_email(habit, send=False)
+                            if msg is not None:
+                                with self.profile.phase('send'):
+                                    connection.send_messages([msg])
+                            sent += 1
+                    except Exception:
+                        # Hand back the reminders claimed but not sent,
+                        # rather than losing the rest of the chunk
+                        release_reminders(habits[sent:], previous)
+                        raise
+        finally:
+            connection.close()
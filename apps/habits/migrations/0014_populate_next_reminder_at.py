@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+from django.utils import timezone
+
+
+# A copy of apps.habits.models.next_reminder_time as of this migration, so
+# that later changes to it can't change what this migration does
+def next_reminder_time(reminder_days, reminder_hour, after):
+    if not reminder_days & 0x7f or reminder_hour is None:
+        return None
+
+    candidate = after.replace(hour=reminder_hour, minute=0, second=0, microsecond=0)
+    if candidate <= after:
+        candidate += datetime.timedelta(days=1)
+
+    while not reminder_days & (1 << candidate.weekday()):
+        candidate += datetime.timedelta(days=1)
+
+    return candidate
+
+class Migration(DataMigration):
+
+    def forwards(self, orm):
+        now = timezone.now()
+        habits = orm['habits.Habit'].objects.filter(reminder_hour__isnull=False)
+        for habit in habits.exclude(reminder_days=0):
+            habit.next_reminder_at = next_reminder_time(habit.reminder_days,
+                                                        habit.reminder_hour,
+                                                        now)
+            habit.save()
+
+    def backwards(self, orm):
+        orm['habits.Habit'].objects.update(next_reminder_at=None)
+
+    models = {
+        u'accounts.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '500', 'db_index': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '500'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'habits.bucket': {
+            'Meta': {'unique_together': "([u'habit', u'resolution', u'index'],)", 'object_name': 'Bucket'},
+            'habit': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "u'buckets'", 'to': u"orm['habits.Habit']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'index': ('django.db.models.fields.IntegerField', [], {}),
+            'resolution': ('django.db.models.fields.CharField', [], {'default': "u'day'", 'max_length': '10'}),
+            'value': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        u'habits.habit': {
+            'Meta': {'ordering': "[u'archived', u'-id']", 'object_name': 'Habit'},
+            'archived': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'description': ('django.db.models.fields.TextField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'next_reminder_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'reminder': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'reminder_days': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'reminder_hour': ('django.db.models.fields.IntegerField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'reminder_last_sent': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'resolution': ('django.db.models.fields.CharField', [], {'default': "u'day'", 'max_length': '10'}),
+            'send_data_collection_emails': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'start': ('django.db.models.fields.DateField', [], {}),
+            'target_value': ('django.db.models.fields.PositiveIntegerField', [], {'default': '1'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "u'habits'", 'to': u"orm['accounts.User']"})
+        }
+    }
+
+    complete_apps = ['habits']
+    symmetrical = True
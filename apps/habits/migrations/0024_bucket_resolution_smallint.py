@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import connections, models
+
+
+# RESOLUTION_CODES, as of this migration
+CODES = (
+    ('day',        0),
+    ('weekday',    1),
+    ('weekendday', 2),
+    ('week',       3),
+    ('month',      4),
+)
+
+
+# Fills in the codes of buckets which the backfill hasn't: the ones written
+# since it started, or all of them if it wasn't run
+CATCH_UP = ("UPDATE habits_bucket SET resolution_code = CASE resolution %s END "
+            "WHERE resolution_code IS NULL" %
+            ' '.join("WHEN '%s' THEN %d" % code for code in CODES))
+
+
+def execute_outside_transaction(sql):
+    """
+    Run ``sql`` in autocommit mode, between South's transactions, as CREATE
+    INDEX CONCURRENTLY must be.
+    """
+    db.commit_transaction()
+    raw = connections[db.db_alias].connection
+    level = raw.isolation_level
+    raw.set_isolation_level(0)
+    try:
+        db.execute(sql)
+    finally:
+        raw.set_isolation_level(level)
+        db.start_transaction()
+
+
+class Migration(SchemaMigration):
+    """
+    Swap the resolution_code column, added by 0023 and filled in by the
+    habits.bucket_resolution_codes backfill, for the old resolution column.
+
+    Between 0023 and this migration, the code from before Bucket.resolution
+    was a ResolutionField must serve traffic: this one's models need the
+    swapped column. Release it as this migration runs; until the old
+    processes are replaced, their bucket writes fail.
+    """
+
+    def forwards(self, orm):
+        if db.backend_name != 'postgres':
+            db.execute(CATCH_UP)
+            db.delete_unique(u'habits_bucket', ['index', 'resolution', 'habit_id'])
+            db.delete_column(u'habits_bucket', 'resolution')
+            db.rename_column(u'habits_bucket', 'resolution_code', 'resolution')
+            db.alter_column(u'habits_bucket', 'resolution',
+                            self.gf('django.db.models.fields.SmallIntegerField')())
+            db.create_unique(u'habits_bucket', ['index', 'resolution', 'habit_id'])
+            return
+
+        # On Postgres, only ever hold the exclusive lock on habits_bucket for
+        # statements which don't scan it. First catch up, taking only row
+        # locks, and build the new indexes without blocking writes: the
+        # unique index, and one to find the rows written meanwhile.
+        unique = db.create_index_name(u'habits_bucket', ['index', 'resolution', 'habit_id'],
+                                      suffix='_uniq')
+        db.execute(CATCH_UP)
+        execute_outside_transaction(
+            'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS habits_bucket_resolution_code_uniq '
+            'ON habits_bucket ("index", resolution_code, habit_id)')
+        execute_outside_transaction(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS habits_bucket_resolution_code_null '
+            'ON habits_bucket (id) WHERE resolution_code IS NULL')
+
+        # Then swap the columns, which only changes the catalog
+        db.execute("SET LOCAL lock_timeout = '10s'")
+        db.execute('LOCK TABLE habits_bucket IN ACCESS EXCLUSIVE MODE')
+        db.execute(CATCH_UP)
+        db.execute('DROP INDEX habits_bucket_resolution_code_null')
+        db.delete_unique(u'habits_bucket', ['index', 'resolution', 'habit_id'])
+        db.delete_column(u'habits_bucket', 'resolution')
+        db.rename_column(u'habits_bucket', 'resolution_code', 'resolution')
+        # Renames the index after the constraint, which is named as
+        # create_unique would have
+        db.execute('ALTER TABLE habits_bucket ADD CONSTRAINT %s '
+                   'UNIQUE USING INDEX habits_bucket_resolution_code_uniq' % unique)
+        db.execute('ALTER TABLE habits_bucket ADD CONSTRAINT habits_bucket_resolution_not_null '
+                   'CHECK (resolution IS NOT NULL) NOT VALID')
+        db.commit_transaction()
+
+        # Checking the constraint scans the table, but doesn't block writes.
+        # With it, SET NOT NULL needn't scan (on Postgres 12 and later).
+        db.start_transaction()
+        db.execute('ALTER TABLE habits_bucket VALIDATE CONSTRAINT habits_bucket_resolution_not_null')
+        db.commit_transaction()
+        db.start_transaction()
+        db.execute("SET LOCAL lock_timeout = '10s'")
+        db.execute('ALTER TABLE habits_bucket ALTER COLUMN resolution SET NOT NULL')
+        db.execute('ALTER TABLE habits_bucket DROP CONSTRAINT habits_bucket_resolution_not_null')
+
+    def backwards(self, orm):
+        db.delete_unique(u'habits_bucket', ['index', 'resolution', 'habit_id'])
+
+        db.add_column(u'habits_bucket', 'resolution_name',
+                      self.gf('django.db.models.fields.CharField')(default='day', max_length=10),
+                      keep_default=False)
+        db.execute("UPDATE habits_bucket SET resolution_name = CASE resolution %s END" %
+                   ' '.join("WHEN %d THEN '%s'" % (code, name) for name, code in CODES))
+        db.rename_column(u'habits_bucket', 'resolution', 'resolution_code')
+        db.alter_column(u'habits_bucket', 'resolution_code',
+                        self.gf('django.db.models.fields.SmallIntegerField')(null=True))
+        db.rename_column(u'habits_bucket', 'resolution_name', 'resolution')
+
+        db.create_unique(u'habits_bucket', ['index', 'resolution', 'habit_id'])
+
+    models = {
+        u'accounts.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '500', 'db_index': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '500'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'scheduled_for_deletion': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'timezone': ('django.db.models.fields.CharField', [], {'default': "'UTC'", 'max_length': '63'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'habits.bucket': {
+            'Meta': {'unique_together': "([u'habit', u'resolution', u'index'],)", 'object_name': 'Bucket'},
+            'cumulative_nonzero': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'cumulative_successes': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'cumulative_value': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'habit': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "u'buckets'", 'to': u"orm['habits.Habit']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'index': ('django.db.models.fields.IntegerField', [], {}),
+            'resolution': ('apps.habits.models.ResolutionField', [], {'default': "u'day'"}),
+            'value': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        u'habits.habit': {
+            'Meta': {'ordering': "[u'archived', u'-id']", 'object_name': 'Habit'},
+            'archived': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'description': ('django.db.models.fields.TextField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'next_reminder_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'reminder': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'reminder_days': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'reminder_hour': ('django.db.models.fields.IntegerField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'reminder_last_sent': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'reminder_utc_days': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'reminder_utc_hour': ('django.db.models.fields.IntegerField', [], {'default': 'None', 'null': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'reminder_utc_offset': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'resolution': ('django.db.models.fields.CharField', [], {'default': "u'day'", 'max_length': '10'}),
+            'scheduled_for_deletion': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'send_data_collection_emails': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'start': ('django.db.models.fields.DateField', [], {}),
+            'target_value': ('django.db.models.fields.PositiveIntegerField', [], {'default': '1'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "u'habits'", 'to': u"orm['accounts.User']"})
+        },
+        u'habits.run': {
+            'Meta': {'unique_together': "([u'habit', u'start'],)", 'object_name': 'Run'},
+            'habit': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "u'runs'", 'to': u"orm['habits.Habit']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'kind': ('django.db.models.fields.CharField', [], {'max_length': '7'}),
+            'start': ('django.db.models.fields.IntegerField', [], {}),
+            'stop': ('django.db.models.fields.IntegerField', [], {})
+        }
+    }
+
+    complete_apps = ['habits']
\ No newline at end of file
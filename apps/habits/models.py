@@ -4,11 +4,18 @@ from collections import namedtuple
 import datetime
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.humanize.templatetags.humanize import ordinal
+from south.modelsinspector import add_introspection_rules
 
-from .signals import habit_archived, habit_created, habit_data_recorded
+from apps.accounts.models import User
+from . import caching, runs
+from .signals import (habit_archived, habit_created, habit_data_recorded,
+                      habit_resolution_changed)
 
 RESOLUTIONS = (
     ('day',        _('day')),
@@ -25,6 +32,45 @@ RESOLUTIONS_NO_MONTH = (
     ('week',       _('week')),
 )
 
+# How each resolution is stored in the database by ResolutionField. These
+# are in the data, so they mustn't change
+RESOLUTION_CODES = {
+    'day':        0,
+    'weekday':    1,
+    'weekendday': 2,
+    'week':       3,
+    'month':      4,
+}
+_RESOLUTION_NAMES = dict((code, name) for name, code in RESOLUTION_CODES.items())
+
+
+class ResolutionField(models.SmallIntegerField):
+    """
+    A resolution, stored as a small integer (see RESOLUTION_CODES), rather
+    than as its name, so that rows and indexes with one are smaller. In
+    Python, and in lookups, it's still the name.
+    """
+    __metaclass__ = models.SubfieldBase
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', RESOLUTIONS)
+        super(ResolutionField, self).__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if isinstance(value, (int, long)):
+            return _RESOLUTION_NAMES[value]
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        try:
+            return RESOLUTION_CODES[value]
+        except KeyError:
+            raise ValueError("Unknown resolution: %r" % (value,))
+
+add_introspection_rules([], [r'^apps\.habits\.models\.ResolutionField'])
+
 def _validate_non_negative(val):
     if val < 0:
         raise ValidationError(u'%s is not greater than or equal to zero' % val)
@@ -33,8 +79,60 @@ def _validate_datetime_is_hour(val):
     if val.minute != 0 or val.second != 0 or val.microsecond != 0:
         raise ValidationError(u'%s must have zero-valued minutes, seconds, and microseconds when representing an hour' % val)
 
+def next_reminder_time(reminder_days, reminder_hour, after):
+    """
+    Return the first datetime strictly after ``after`` which falls on one of
+    the weekdays in the ``reminder_days`` bitmask (Monday=1...Sunday=64) at
+    ``reminder_hour`` o'clock, or None if no reminders are scheduled.
+    """
+    if not reminder_days & 0x7f or reminder_hour is None:
+        return None
+
+    candidate = after.replace(hour=reminder_hour, minute=0, second=0, microsecond=0)
+    if candidate <= after:
+        candidate += datetime.timedelta(days=1)
+
+    while not reminder_days & (1 << candidate.weekday()):
+        candidate += datetime.timedelta(days=1)
+
+    return candidate
+
+def utc_offset_minutes(tz, when):
+    """
+    Return the UTC offset of the timezone ``tz`` at the aware datetime
+    ``when``, in minutes.
+    """
+    return int(when.astimezone(tz).utcoffset().total_seconds()) // 60
+
+def utc_reminder_schedule(reminder_days, reminder_hour, offset):
+    """
+    Convert a local reminder schedule (a ``reminder_days`` bitmask and a
+    ``reminder_hour``) into UTC, given the local UTC ``offset`` in minutes.
+    Returns a ``(reminder_days, reminder_hour)`` tuple.
+
+    Offsets which aren't a whole number of hours are rounded so that
+    reminders arrive late rather than early.
+    """
+    if reminder_hour is None:
+        return reminder_days, None
+
+    utc_hour = -((offset - reminder_hour * 60) // 60)
+    day_shift, utc_hour = divmod(utc_hour, 24)
+
+    if day_shift < 0:
+        # Rotate each day back one, so Monday wraps round to Sunday
+        reminder_days = (reminder_days >> 1) | ((reminder_days & 1) << 6)
+    elif day_shift > 0:
+        reminder_days = ((reminder_days << 1) & 0x7f) | (reminder_days >> 6)
+
+    return reminder_days, utc_hour
+
 TimePeriod_ = namedtuple('TimePeriod', 'resolution index date')
 
+# Totals over a window of time periods: how many periods it spans, the sum of
+# their values, and how many had something done and hit the target
+WindowStats = namedtuple('WindowStats', 'periods total nonzero successes')
+
 class TimePeriod(TimePeriod_):
 
     @classmethod
@@ -202,6 +300,14 @@ class TimePeriod(TimePeriod_):
         return "Week of %s %s" % (self.date.strftime("%B"), ordinal(self.date.day))
 
 
+# The fields of a habit which Habit.save() compares with their saved values
+_REMINDER_SCHEDULE_FIELDS = ('reminder_days', 'reminder_hour')
+_RUN_SETTINGS_FIELDS = ('resolution', 'target_value')
+
+# Stands in for the value of a deferred field
+_DEFERRED = object()
+
+
 class Habit(models.Model):
     """
     A habit and its associated data.
@@ -237,29 +343,182 @@ class Habit(models.Model):
         null=True,
         blank=True
     )
+    # The reminder schedule above converted to UTC, using the user's UTC
+    # offset (in minutes) at the time it was last converted
+    reminder_utc_days = models.IntegerField(
+        validators=[_validate_non_negative],
+        default=0,
+    )
+    reminder_utc_hour = models.IntegerField(
+        validators=[_validate_non_negative],
+        default=None,
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+    reminder_utc_offset = models.IntegerField(
+        null=True,
+        blank=True,
+    )
+    next_reminder_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+    )
     send_data_collection_emails = models.BooleanField(default=True)
+    modified = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+    )
+    # Set when the habit is to be deleted by the deletescheduled command
+    scheduled_for_deletion = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+    )
 
     class Meta:
         # HACK: Use ID as proxy for creation order
         ordering = ['archived', '-id']
 
+    def __init__(self, *args, **kwargs):
+        super(Habit, self).__init__(*args, **kwargs)
+        # From __dict__, so that deferred fields aren't loaded here
+        self._saved_reminder_schedule = self._loaded_values(_REMINDER_SCHEDULE_FIELDS)
+        self._saved_run_settings = self._loaded_values(_RUN_SETTINGS_FIELDS)
+
+    def _loaded_values(self, names):
+        # The values of the fields ``names``, or None if any is deferred
+        values = tuple(self.__dict__.get(name, _DEFERRED) for name in names)
+        return None if _DEFERRED in values else values
+
+    def _saved_values(self, saved, names):
+        # ``saved``, the values of the fields ``names`` when the habit was
+        # loaded or last saved. If that's unknown, because some were
+        # deferred, they're looked up now; or if none of them has been
+        # loaded or set since, they can't have changed, and it's None.
+        if saved is not None:
+            return saved
+        if self.pk is None or not any(name in self.__dict__ for name in names):
+            return None
+        return tuple(Habit.objects.filter(pk=self.pk).values_list(*names)[0])
+
     @classmethod
     def scheduled_for_reminder(cls, weekday, hour):
         """
-        Get all habits scheduled for a reminder on the given ``weekday`` and
-        ``hour``. ``weekday`` should be an integer weekday
+        Get all habits scheduled for a reminder on the given UTC ``weekday``
+        and ``hour``. ``weekday`` should be an integer weekday
         (Monday=0...Sunday=6).
         """
         return cls.objects.raw("""
             SELECT * FROM habits_habit
-            WHERE (reminder_days & %s) != 0
-            AND reminder_hour = %s
-        """, [1 << weekday, hour])
+            WHERE reminder_utc_hour = %s
+            AND (reminder_utc_days & %s) != 0
+        """, [hour, 1 << weekday])
+
+    @classmethod
+    def for_user(cls, user):
+        """
+        Get ``user``'s habits, leaving out any scheduled for deletion.
+        """
+        return user.habits.filter(scheduled_for_deletion__isnull=True)
+
+    @classmethod
+    def due_for_reminder(cls, now):
+        """
+        Get all habits whose next reminder is due at or before ``now``, oldest
+        first. This is a range scan over the ``next_reminder_at`` index, so it
+        also picks up any reminders missed by a late or skipped run.
+        """
+        return cls.objects.filter(
+            next_reminder_at__lte=now,
+        ).select_related('user').order_by('next_reminder_at')
 
     def save(self, *args, **kwargs):
         # ensure that model field custom validators are always run before saving
-        self.full_clean()
-        return super(Habit, self).save(*args, **kwargs)
+        # (those which are loaded: deferred fields are left as they are)
+        self.full_clean(exclude=[f.name for f in self._meta.fields
+                                 if f.attname not in self.__dict__])
+
+        saved_schedule = self._saved_values(self._saved_reminder_schedule,
+                                            _REMINDER_SCHEDULE_FIELDS)
+        if saved_schedule is not None:
+            schedule = (self.reminder_days, self.reminder_hour)
+            unscheduled = (self.next_reminder_at is None and
+                           self.reminder_days and
+                           self.reminder_hour is not None)
+            if unscheduled or schedule != saved_schedule:
+                self.update_reminder_schedule(timezone.now())
+
+        saved_run_settings = self._saved_values(self._saved_run_settings,
+                                                _RUN_SETTINGS_FIELDS)
+        rebuild_runs = (self.pk is not None and saved_run_settings is not None and
+                        (self.resolution, self.target_value) != saved_run_settings)
+        if rebuild_runs:
+            old_resolution = saved_run_settings[0]
+
+        result = super(Habit, self).save(*args, **kwargs)
+        self._saved_reminder_schedule = self._loaded_values(_REMINDER_SCHEDULE_FIELDS)
+        self._saved_run_settings = self._loaded_values(_RUN_SETTINGS_FIELDS)
+        if rebuild_runs:
+            if self.resolution != old_resolution:
+                from .rebucketing import rebucket
+                rebucket(self, old_resolution)
+            # Which periods succeeded, or which periods there are, changed
+            runs.rebuild(self)
+            rebuild_cumulative_sums(self.pk)
+            # post_save bumped the cached versions before the rebuild, so a
+            # dashboard rendered in between could have cached the old data
+            caching.habit_changed(self)
+            if self.resolution != old_resolution:
+                habit_resolution_changed.send(sender=self,
+                                              old_resolution=old_resolution)
+        return result
+
+    def update_reminder_schedule(self, now):
+        """
+        Convert the reminder schedule to UTC, using the user's timezone as it
+        is at ``now``, and reschedule the next reminder. Doesn't save the
+        habit.
+        """
+        offset = utc_offset_minutes(self.user.get_timezone(), now)
+        self.reminder_utc_days, self.reminder_utc_hour = utc_reminder_schedule(
+            self.reminder_days, self.reminder_hour, offset,
+        )
+        self.reminder_utc_offset = offset
+        self.schedule_next_reminder(now)
+
+    @classmethod
+    def update_reminder_schedules(cls, habits, now):
+        """
+        Call ``update_reminder_schedule`` on each of ``habits`` and save the
+        result, with one UPDATE for each different reminder schedule among
+        them, rather than one per habit.
+        """
+        schedules = {}
+        for habit in habits:
+            schedules.setdefault((habit.reminder_days, habit.reminder_hour), []).append(habit)
+        for same_schedule in schedules.values():
+            for habit in same_schedule:
+                habit.update_reminder_schedule(now)
+            cls.objects.filter(pk__in=[h.pk for h in same_schedule]).update(
+                reminder_utc_days=habit.reminder_utc_days,
+                reminder_utc_hour=habit.reminder_utc_hour,
+                reminder_utc_offset=habit.reminder_utc_offset,
+                next_reminder_at=habit.next_reminder_at,
+                modified=now,
+            )
+            for habit in same_schedule:
+                caching.habit_changed(habit)
+
+    def schedule_next_reminder(self, after):
+        """
+        Set ``next_reminder_at`` to the first slot in the reminder schedule
+        after the datetime ``after``. Doesn't save the habit.
+        """
+        self.next_reminder_at = next_reminder_time(self.reminder_utc_days,
+                                                   self.reminder_utc_hour,
+                                                   after)
 
     def get_current_time_period(self):
         return self.get_time_period(datetime.date.today())
@@ -275,9 +534,30 @@ class Habit(models.Model):
         return TimePeriod.from_date(self.start, resolution, when)
 
     def is_up_to_date(self):
+        if hasattr(self, '_up_to_date'):
+            return self._up_to_date
         time_period = self.get_current_time_period()
         return self.get_buckets().filter(index=time_period.index).count() != 0
 
+    @classmethod
+    def prefetch_up_to_date(cls, habits):
+        """
+        Work out ``is_up_to_date()`` for each of ``habits`` with one query,
+        rather than one per habit.
+        """
+        habits = list(habits)
+        if not habits:
+            return
+        query = reduce(lambda x, y: x | y, [
+            models.Q(habit=h,
+                     resolution=h.resolution,
+                     index=h.get_current_time_period().index)
+            for h in habits
+        ])
+        up_to_date = set(Bucket.objects.filter(query).values_list('habit_id', flat=True))
+        for h in habits:
+            h._up_to_date = h.pk in up_to_date
+
     def is_binary(self):
         """
         Returns true if this habit is a yes/no task (versus a how many times you
@@ -315,7 +595,18 @@ class Habit(models.Model):
         if time_period.resolution != self.resolution:
             raise ValueError("passed TimePeriod must have resolution matching Habit")
 
-        _increment_bucket(self, time_period, value)
+        if not transaction.is_managed():
+            with transaction.commit_on_success():
+                return self.record(time_period, value)
+
+        # Each bucket's sums are copied from, and added to, its neighbours',
+        # and runs are split and merged, so recording for the same habit at
+        # once would leave them wrong. Lock the habit until this commits.
+        list(Habit.objects.select_for_update().filter(pk=self.pk).values_list('pk'))
+
+        bucket = _increment_bucket(self, time_period, value)
+        runs.record_period(self, time_period.index,
+                           runs.classify(bucket.value, self.target_value))
 
         if self.resolution in ['day', 'weekday', 'weekendday']:
             tp = self.get_time_period(time_period.date, 'week')
@@ -327,6 +618,23 @@ class Habit(models.Model):
 
         habit_data_recorded.send(sender=self)
 
+    def window_stats(self, lo, hi, resolution=None):
+        """
+        Return the WindowStats for the time periods from index ``lo`` up to
+        (but not including) ``hi``, at ``resolution`` (defaults to the
+        Habit's ``resolution``). However wide the window, this is two index
+        lookups, using the buckets' cumulative sums.
+        """
+        if resolution is None:
+            resolution = self.resolution
+
+        sums = self.buckets.filter(resolution=resolution).order_by('-index').values_list(
+            'cumulative_value', 'cumulative_nonzero', 'cumulative_successes')
+        upper = list(sums.filter(index__lt=hi)[:1]) or [(0, 0, 0)]
+        lower = list(sums.filter(index__lt=lo)[:1]) or [(0, 0, 0)]
+        return WindowStats(max(hi - lo, 0),
+                           *[u - l for u, l in zip(upper[0], lower[0])])
+
     def get_buckets(self, order_by='index'):
         return self.buckets.filter(
             resolution=self.resolution,
@@ -366,6 +674,24 @@ class Habit(models.Model):
         if streak:
             yield streak
 
+    def get_runs(self, count=None):
+        """
+        Return this habit's runs (see ``apps.habits.runs``), latest first:
+        the latest ``count`` of them, or all of them.
+        """
+        qs = self.runs.order_by('-start')
+        if count is not None:
+            qs = qs[:count]
+        return list(qs)
+
+    def get_run_streaks(self, kinds=(runs.SUCCESS,)):
+        """
+        Return a generator yielding the length of each streak of time periods
+        whose runs are of one of ``kinds``, latest first. By default, as
+        ``get_streaks()`` but from the habit's runs.
+        """
+        return runs.streaks(self.runs.order_by('-start').iterator(), kinds)
+
     def get_resolution_name(self):
         for ident, name in RESOLUTIONS:
             if self.resolution == ident:
@@ -426,11 +752,15 @@ class Bucket(models.Model):
         validators=[_validate_non_negative],
         default=0,
     )
-    resolution = models.CharField(
-        max_length=10,
-        choices=RESOLUTIONS,
+    resolution = ResolutionField(
         default='day',
     )
+    # Sums over this bucket and every earlier one of the same resolution,
+    # for Habit.window_stats: of the values, of the buckets with a nonzero
+    # value, and of those hitting the habit's target
+    cumulative_value = models.IntegerField(default=0)
+    cumulative_nonzero = models.IntegerField(default=0)
+    cumulative_successes = models.IntegerField(default=0)
 
     def is_succeeding(self):
         return self.value >= self.habit.target_value
@@ -439,20 +769,115 @@ class Bucket(models.Model):
         return "resolution=%s index=%s value=%s" % (self.resolution, self.index, self.value)
 
 
+class Run(models.Model):
+    """
+    A run of consecutive time periods of one kind in a habit's record, at
+    the habit's resolution (see ``apps.habits.runs``).
+    """
+    class Meta(object):
+        unique_together = ['habit', 'start']
+
+    habit = models.ForeignKey(Habit, related_name='runs')
+    kind = models.CharField(max_length=7, choices=(
+        (runs.SUCCESS, _('success')),
+        (runs.PARTIAL, _('partial')),
+        (runs.FAIL,    _('fail')),
+        (runs.MISSING, _('missing')),
+    ))
+    # The index of the first time period in the run, and the one after its
+    # last
+    start = models.IntegerField()
+    stop = models.IntegerField()
+
+    @property
+    def length(self):
+        return self.stop - self.start
+
+    def __unicode__(self):
+        return "kind=%s start=%s stop=%s" % (self.kind, self.start, self.stop)
+
+
 def _increment_bucket(habit, time_period, value):
-    try:
-        b = habit.buckets.get(resolution=time_period.resolution,
-                              index=time_period.index)
-    except Bucket.DoesNotExist:
+    buckets = habit.buckets.filter(resolution=time_period.resolution)
+
+    # The bucket, if there is one, or else the one before it
+    found = list(buckets.filter(index__lte=time_period.index).order_by('-index')[:1])
+    if found and found[0].index == time_period.index:
+        b = found[0]
+        old_value = b.value
+    else:
         b = Bucket(habit=habit,
                    resolution=time_period.resolution,
                    index=time_period.index)
+        if found:
+            b.cumulative_value = found[0].cumulative_value
+            b.cumulative_nonzero = found[0].cumulative_nonzero
+            b.cumulative_successes = found[0].cumulative_successes
+        old_value = None
 
     b.value += value
-    b.save()
+    deltas = {
+        'cumulative_value': value,
+        'cumulative_nonzero': int(b.value > 0) - int(bool(old_value)),
+        'cumulative_successes': (int(b.value >= habit.target_value) -
+                                 int(old_value is not None and
+                                     old_value >= habit.target_value)),
+    }
+    for field, delta in deltas.items():
+        setattr(b, field, getattr(b, field) + delta)
+
+    if old_value is None:
+        b.save(force_insert=True)
+    else:
+        buckets.filter(pk=b.pk).update(value=b.value, **dict(
+            (field, getattr(b, field)) for field in deltas))
+
+    # Every later bucket's sums include this one
+    changed = dict((field, F(field) + delta)
+                   for field, delta in deltas.items() if delta)
+    if changed:
+        buckets.filter(index__gt=time_period.index).update(**changed)
     return b
 
 
+def rebuild_cumulative_sums(habit_id=None):
+    """
+    Work out the cumulative sums of every bucket of the habit with
+    ``habit_id``, or of every habit, from scratch.
+    """
+    sql = """
+        UPDATE habits_bucket
+        SET cumulative_value = sums.cumulative_value,
+            cumulative_nonzero = sums.cumulative_nonzero,
+            cumulative_successes = sums.cumulative_successes
+        FROM (
+            SELECT b.id,
+                   SUM(b.value) OVER w AS cumulative_value,
+                   SUM(CASE WHEN b.value > 0 THEN 1 ELSE 0 END) OVER w AS cumulative_nonzero,
+                   SUM(CASE WHEN b.value >= h.target_value THEN 1 ELSE 0 END) OVER w AS cumulative_successes
+            FROM habits_bucket b
+            JOIN habits_habit h ON h.id = b.habit_id
+            %s
+            WINDOW w AS (PARTITION BY b.habit_id, b.resolution ORDER BY b."index")
+        ) sums
+        WHERE habits_bucket.id = sums.id
+    """
+    cursor = connection.cursor()
+    if habit_id is None:
+        cursor.execute(sql % '')
+    else:
+        cursor.execute(sql % 'WHERE b.habit_id = %s', [habit_id])
+    transaction.commit_unless_managed()
+
+
+# Keep the dashboard cache up to date
+habit_archived.connect(caching.habit_changed)
+habit_data_recorded.connect(caching.habit_changed)
+post_save.connect(caching.habit_changed, sender=Habit)
+post_delete.connect(caching.habit_changed, sender=Habit)
+post_save.connect(caching.user_changed, sender=User)
+
+
 def _num_weekend_days_between(from_date, to_date):
     from_week = from_date - datetime.timedelta(days=from_date.weekday())
     to_week = to_date - datetime.timedelta(days=to_date.weekday())
@@ -0,0 +1,58 @@
+"""
+Rebuilding a habit's buckets when its resolution changes.
+
+Recording data fills in buckets at the habit's resolution and, for daily
+habits, the week and month containing it, so week and month buckets are
+always complete. Each time period of the daily resolutions (day, weekday
+and weekendday) is a single date, so their buckets can be moved between
+them by date: days become weekdays, say, with the weekend days dropped.
+Nothing finer than a week can be made from weeks or months, so moving to a
+daily resolution from those keeps whatever buckets it had before.
+"""
+from apps.habits.models import Bucket, TimePeriod
+
+DAILY_RESOLUTIONS = ('day', 'weekday', 'weekendday')
+
+# Rows per statement
+CHUNK_SIZE = 500
+
+
+def _falls_in(date, resolution):
+    if resolution == 'weekday':
+        return date.weekday() < 5
+    if resolution == 'weekendday':
+        return date.weekday() >= 5
+    return True
+
+
+def rebucket(habit, old_resolution):
+    """
+    Make ``habit``'s buckets at its resolution from those at
+    ``old_resolution``, replacing any which were there for the same time
+    periods. Returns the number of buckets made. Run it in a transaction,
+    and then rework the data derived from the buckets.
+    """
+    new_resolution = habit.resolution
+    if (old_resolution == new_resolution or
+            old_resolution not in DAILY_RESOLUTIONS or
+            new_resolution not in DAILY_RESOLUTIONS):
+        return 0
+
+    values = {}
+    old_buckets = habit.buckets.filter(resolution=old_resolution)
+    for index, value in old_buckets.values_list('index', 'value').iterator():
+        date = TimePeriod.from_index(habit.start, old_resolution, index).date
+        if _falls_in(date, new_resolution):
+            new_index = TimePeriod.from_date(habit.start, new_resolution, date).index
+            values[new_index] = value
+
+    indexes = sorted(values)
+    new_buckets = habit.buckets.filter(resolution=new_resolution)
+    for i in xrange(0, len(indexes), CHUNK_SIZE):
+        new_buckets.filter(index__in=indexes[i:i + CHUNK_SIZE]).delete()
+    Bucket.objects.bulk_create([
+        Bucket(habit=habit, resolution=new_resolution, index=index,
+               value=values[index])
+        for index in indexes
+    ], batch_size=CHUNK_SIZE)
+    return len(indexes)
@@ -1,17 +1,21 @@
 import datetime
 
 from django.core.urlresolvers import reverse
+from django.db import connection, transaction
 from django.utils.translation import ugettext_lazy as _
 
 from apps.autologin.views import make_auto_login_link
+from apps.habits import calendar_index
+from apps.habits.models import Habit, next_reminder_time
 
 from lib.render_to_email import render_to_email
 
-def send_reminder_email(habit):
+def send_reminder_email(habit, send=True):
     if habit.archived:
         return
 
     return render_to_email(
+        send=send,
         text_template='emails/habits/reminder.txt',
         html_template='emails/habits/reminder.html',
         to=(habit.user,),
@@ -28,7 +32,107 @@ def send_reminder_email(habit):
         },
     )
 
-def send_data_collection_email(habit, today=None):
+def send_due_reminder(habit, now, grace, send=True):
+    """
+    Send the reminder for ``habit``, which should be due (its
+    ``next_reminder_at`` at or before ``now``), and advance its schedule past
+    ``now``. Missed reminder slots are caught up if the most recent of them
+    fell due no more than the timedelta ``grace`` ago; older ones are skipped
+    rather than sent late.
+
+    The schedule is advanced with a conditional update, so if two dispatchers
+    pick up the same habit only one of them sends the reminder.
+
+    Returns the reminder email, if there was one; with ``send=False`` it's
+    left for the caller to send.
+    """
+    due = habit.next_reminder_at
+    missed = next_reminder_time(habit.reminder_utc_days,
+                                habit.reminder_utc_hour,
+                                now - grace)
+
+    in_grace = missed is not None and missed <= now
+    if in_grace:
+        habit.reminder_last_sent = missed
+    habit.schedule_next_reminder(now)
+
+    claimed = Habit.objects.filter(
+        pk=habit.pk,
+        next_reminder_at=due,
+    ).update(
+        next_reminder_at=habit.next_reminder_at,
+        reminder_last_sent=habit.reminder_last_sent,
+        modified=now,
+    )
+
+    if claimed and in_grace:
+        return send_reminder_email(habit, send=send)
+
+def claim_due_reminders(habits, now, grace):
+    """
+    Claim and advance the due reminders of ``habits``, as
+    ``send_due_reminder`` does, but with one UPDATE for each group of habits
+    which fell due at the same time on the same schedule (usually all of
+    them), rather than one per habit.
+
+    Returns the claimed habits whose reminders should be sent now.
+    """
+    groups = {}
+    for habit in habits:
+        key = (habit.next_reminder_at, habit.reminder_utc_days, habit.reminder_utc_hour)
+        groups.setdefault(key, []).append(habit)
+
+    to_send = []
+    cursor = connection.cursor()
+    value = connection.ops.value_to_db_datetime
+    for (due, days, hour), group in sorted(groups.items()):
+        missed = next_reminder_time(days, hour, now - grace)
+        in_grace = missed is not None and missed <= now
+        next_at = next_reminder_time(days, hour, now)
+
+        columns, params = ['next_reminder_at = %s', 'modified = %s'], [value(next_at), value(now)]
+        if in_grace:
+            columns.append('reminder_last_sent = %s')
+            params.append(value(missed))
+        # Only the habits still due at ``due`` are claimed, so if another
+        # dispatcher got to some of them first, they aren't sent twice
+        cursor.execute("""
+            UPDATE habits_habit SET %s
+            WHERE next_reminder_at = %%s AND id IN (%s)
+            RETURNING id
+        """ % (', '.join(columns), ', '.join(['%s'] * len(group))),
+            params + [value(due)] + [habit.pk for habit in group])
+        claimed = set(pk for (pk,) in cursor.fetchall())
+        transaction.commit_unless_managed()
+
+        for habit in group:
+            if habit.pk not in claimed:
+                continue
+            habit.next_reminder_at = next_at
+            if in_grace:
+                habit.reminder_last_sent = missed
+                to_send.append(habit)
+    return to_send
+
+def release_reminders(habits, previous):
+    """
+    Undo ``claim_due_reminders`` for claimed ``habits`` whose reminders
+    weren't sent after all, so that the next run sends them (if they're still
+    within the grace period). ``previous`` maps each habit's pk to its
+    ``(next_reminder_at, reminder_last_sent)`` from before it was claimed.
+    """
+    for habit in habits:
+        due, last_sent = previous[habit.pk]
+        Habit.objects.filter(
+            pk=habit.pk,
+            next_reminder_at=habit.next_reminder_at,
+        ).update(
+            next_reminder_at=due,
+            reminder_last_sent=last_sent,
+        )
+        habit.next_reminder_at, habit.reminder_last_sent = due, last_sent
+
+def send_data_collection_email(habit, today=None, send=True):
     if today is None:
         today = datetime.date.today()
 
@@ -39,25 +143,12 @@ def send_data_collection_email(habit, today=None):
         # Don't ask for data from before the habit was created
         return
 
-    if habit.resolution == 'weekday':
-        # Don't ask for data on Sundays and Mondays
-        if today.weekday() in [6, 0]:
-            return
-
-    if habit.resolution == 'weekendday':
-        # Don't ask for data from Tuesday to Saturday
-        if today.weekday() in range(1, 6):
-            return
-
-    if habit.resolution == 'week':
-        # Don't ask for data unless today is a Monday
-        if today.weekday() != 0:
-            return
-
-    if habit.resolution == 'month':
-        # Don't ask for data unless today is the 1st of a new month
-        if today.day != 1:
-            return
+    # Only ask for data once a time period's over: on Tuesday to Saturday
+    # for weekdays, Sunday and Monday for weekend days, Mondays for weeks,
+    # and the 1st for months
+    if not calendar_index.ends_period(today - datetime.timedelta(days=1),
+                                      habit.resolution):
+        return
 
     time_period_name = {
         'day':        _('yesterday'),
@@ -68,6 +159,7 @@ def send_data_collection_email(habit, today=None):
     }[habit.resolution]
 
     return render_to_email(
+        send=send,
         text_template='emails/habits/data_collection.txt',
         html_template='emails/habits/data_collection.html',
         to=(habit.user,),
@@ -0,0 +1,146 @@
+"""
+Each habit's record as a series of runs: stretches of consecutive time
+periods (at the habit's resolution) which all hit the target (``success``),
+all fell short of it with something done (``partial``), all had nothing
+done (``fail``), or all had no data entered (``missing``). The series
+starts at the habit's first time period and ends at the latest one with
+data.
+
+The runs are kept up to date as data is recorded (see ``record_period``),
+so that questions about the shape of a habit's history ("how long is the
+latest streak?", "what were the last three runs?") take a pass over its
+runs, rather than over all of its buckets.
+
+Runs are handled here as ``(kind, start, stop)`` tuples, where ``stop`` is
+the index after the run's last one, as for ``range``.
+"""
+SUCCESS = 'success'
+PARTIAL = 'partial'
+FAIL = 'fail'
+MISSING = 'missing'
+
+
+def classify(value, target_value):
+    """
+    Return the kind of run a time period with ``value`` belongs in.
+    """
+    if value >= target_value:
+        return SUCCESS
+    if value > 0:
+        return PARTIAL
+    return FAIL
+
+
+def _merge(runs):
+    merged = []
+    for kind, start, stop in runs:
+        if merged and merged[-1][0] == kind and merged[-1][2] == start:
+            merged[-1] = (kind, merged[-1][1], stop)
+        else:
+            merged.append((kind, start, stop))
+    return merged
+
+
+def build(periods):
+    """
+    Return the runs for ``periods``, a list of ``(index, kind)`` tuples
+    ordered by index.
+    """
+    runs = []
+    next_index = 0
+    for index, kind in periods:
+        if index > next_index:
+            runs.append((MISSING, next_index, index))
+        runs.append((kind, index, index + 1))
+        next_index = index + 1
+    return _merge(runs)
+
+
+def overwrite(runs, index, kind, series_stop):
+    """
+    Return ``runs``, consecutive runs from a series which stops at
+    ``series_stop``, with the time period ``index`` changed to ``kind``.
+    ``runs`` must include the run containing ``index``, if there is one,
+    and any runs next to it which might be merged with it.
+    """
+    if index >= series_stop:
+        # Extending the series
+        runs = list(runs)
+        if index > series_stop:
+            runs.append((MISSING, series_stop, index))
+        runs.append((kind, index, index + 1))
+        return _merge(runs)
+
+    result = []
+    for run_kind, start, stop in runs:
+        if start <= index < stop:
+            if start < index:
+                result.append((run_kind, start, index))
+            result.append((kind, index, index + 1))
+            if index + 1 < stop:
+                result.append((run_kind, index + 1, stop))
+        else:
+            result.append((run_kind, start, stop))
+    return _merge(result)
+
+
+def streaks(runs, kinds=(SUCCESS,)):
+    """
+    Yield the length of each streak of consecutive time periods whose kinds
+    are all in ``kinds``, from ``runs`` (latest first), latest first.
+    """
+    streak = 0
+    for run in runs:
+        if run.kind in kinds:
+            streak += run.length
+        else:
+            if streak:
+                yield streak
+            streak = 0
+    if streak:
+        yield streak
+
+
+def record_period(habit, index, kind):
+    """
+    Update ``habit``'s runs for the time period ``index`` (at its
+    resolution) now being of ``kind``.
+    """
+    # The run containing the index, and the runs either side of it
+    nearby = list(habit.runs.filter(stop__gte=index,
+                                    start__lte=index + 1).order_by('start'))
+    if nearby:
+        series_stop = nearby[-1].stop
+    else:
+        latest = habit.get_runs(1)
+        series_stop = latest[0].stop if latest else 0
+
+    old = dict((run.start, run) for run in nearby)
+    new = overwrite([(r.kind, r.start, r.stop) for r in nearby],
+                    index, kind, series_stop)
+
+    created = []
+    for run_kind, start, stop in new:
+        run = old.pop(start, None)
+        if run is None:
+            created.append(habit.runs.model(habit=habit, kind=run_kind,
+                                            start=start, stop=stop))
+        elif (run.kind, run.stop) != (run_kind, stop):
+            habit.runs.filter(pk=run.pk).update(kind=run_kind, stop=stop)
+    if old:
+        habit.runs.filter(pk__in=[run.pk for run in old.values()]).delete()
+    if created:
+        habit.runs.model.objects.bulk_create(created)
+
+
+def rebuild(habit):
+    """
+    Replace ``habit``'s runs with ones worked out from its buckets.
+    """
+    periods = [(index, classify(value, habit.target_value))
+               for index, value in habit.get_buckets().values_list('index', 'value')]
+    habit.runs.all().delete()
+    habit.runs.model.objects.bulk_create([
+        habit.runs.model(habit=habit, kind=kind, start=start, stop=stop)
+        for kind, start, stop in build(periods)
+    ])
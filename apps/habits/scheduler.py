@@ -0,0 +1,114 @@
+import datetime
+import heapq
+
+from apps.habits.models import Habit
+from apps.habits.reminders import send_due_reminder
+
+
+class ReminderScheduler(object):
+    """
+    An in-memory schedule of upcoming habit reminders, kept as a heap of
+    ``(fire_at, habit_pk)`` entries.
+
+    Each habit's reminder fires at its ``next_reminder_at`` plus a fixed
+    per-habit offset within ``spread`` (a timedelta), so reminders due on the
+    hour are delivered over the following ``spread`` rather than all at once.
+
+    Rescheduling a habit pushes a new entry rather than removing the old one;
+    entries which no longer match ``self._fire_times`` are discarded when they
+    reach the top of the heap.
+
+    Each refresh loads the habits modified since ``overlap`` (a timedelta)
+    before the previous one, so that a change stamped before a poll but
+    committed after it, or stamped by a clock running behind, is still seen.
+    Loading a habit again is harmless.
+    """
+
+    def __init__(self, spread=datetime.timedelta(0), overlap=datetime.timedelta(0)):
+        self.spread = spread
+        self.overlap = overlap
+        self.last_poll = None
+        self._heap = []
+        self._fire_times = {}
+
+    def __len__(self):
+        return len(self._fire_times)
+
+    def fire_time(self, habit_pk, next_reminder_at):
+        spread_seconds = int(self.spread.total_seconds())
+        if spread_seconds <= 0:
+            return next_reminder_at
+        # Spread habits evenly but deterministically across the window, so a
+        # restarted scheduler fires each one at the same time as before.
+        offset = (habit_pk * 7919) % spread_seconds
+        return next_reminder_at + datetime.timedelta(seconds=offset)
+
+    def schedule(self, habit_pk, next_reminder_at):
+        if next_reminder_at is None:
+            self._fire_times.pop(habit_pk, None)
+            return
+
+        fire_at = self.fire_time(habit_pk, next_reminder_at)
+        if self._fire_times.get(habit_pk) == fire_at:
+            return
+
+        self._fire_times[habit_pk] = fire_at
+        heapq.heappush(self._heap, (fire_at, habit_pk))
+
+    def refresh(self, now):
+        """
+        Load reminder times for every habit changed since the last call (or
+        for every habit with a reminder, on the first call).
+        """
+        habits = Habit.objects.values_list('pk', 'next_reminder_at')
+        if self.last_poll is None:
+            habits = habits.filter(next_reminder_at__isnull=False)
+        else:
+            habits = habits.filter(modified__gte=self.last_poll)
+
+        self.last_poll = now - self.overlap
+        for habit_pk, next_reminder_at in habits.order_by():
+            self.schedule(habit_pk, next_reminder_at)
+
+    def next_fire_time(self):
+        self._discard_stale()
+        if self._heap:
+            return self._heap[0][0]
+
+    def pop_due(self, now):
+        """
+        Yield the pk of each habit whose reminder fires at or before ``now``.
+        """
+        while self.next_fire_time() is not None and self._heap[0][0] <= now:
+            fire_at, habit_pk = heapq.heappop(self._heap)
+            del self._fire_times[habit_pk]
+            yield habit_pk
+
+    def dispatch_due(self, now, grace):
+        """
+        Send every reminder which fires at or before ``now``, and reschedule
+        the habits involved. Returns the number of reminders sent.
+        """
+        sent = 0
+        for habit_pk in list(self.pop_due(now)):
+            try:
+                habit = Habit.objects.select_related('user').get(
+                    pk=habit_pk,
+                    next_reminder_at__lte=now,
+                )
+            except Habit.DoesNotExist:
+                # Deleted, or rescheduled since we last polled; the next
+                # refresh will pick up any new reminder time.
+                continue
+
+            if send_due_reminder(habit, now, grace):
+                sent += 1
+            self.schedule(habit.pk, habit.next_reminder_at)
+        return sent
+
+    def _discard_stale(self):
+        while self._heap:
+            fire_at, habit_pk = self._heap[0]
+            if self._fire_times.get(habit_pk) == fire_at:
+                return
+            heapq.heappop(self._heap)
@@ -0,0 +1,186 @@
+"""
+Generate a large, realistic-looking dataset for load testing and
+benchmarking. See the seed_load_data management command.
+"""
+from collections import defaultdict
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from apps.accounts.models import User
+from apps.habits import runs
+from apps.habits.models import Bucket, Habit, RESOLUTIONS, Run, TimePeriod
+
+TIMEZONES = ['UTC', 'Europe/London', 'Europe/Berlin', 'America/New_York',
+             'America/Los_Angeles', 'Asia/Tokyo', 'Australia/Sydney']
+
+SEED_PASSWORD = 'password'
+
+
+def seed_email(seed, n):
+    return 'load-%d-%06d@example.com' % (seed, n)
+
+
+def periods_between(habit, today):
+    """
+    Return the number of complete time periods between the start of the
+    habit and ``today``.
+    """
+    try:
+        return habit.get_time_period(today).index
+    except ValueError:
+        # No weekdays (or weekend days) yet
+        return 0
+
+
+def habit_values(rng, habit, num_periods):
+    """
+    Yield an ``(index, value)`` pair for each period the user recorded a
+    value for, using a two-state (streak/gap) Markov chain. In a streak the
+    user mostly hits their target; in a gap they either record zero or
+    don't record anything at all. Each habit gets its own probabilities,
+    and some are abandoned partway through.
+    """
+    stay_in_streak = rng.uniform(0.7, 0.97)
+    stay_in_gap = rng.uniform(0.4, 0.85)
+    records_zeroes = rng.random() < 0.5
+    if rng.random() < 0.3:
+        num_periods = rng.randint(0, num_periods)
+
+    in_streak = rng.random() < 0.7
+    for index in xrange(num_periods):
+        if in_streak:
+            if rng.random() < 0.85:
+                yield index, habit.target_value + rng.choice([0, 0, 0, 1, 2])
+            else:
+                yield index, rng.randint(0, habit.target_value)
+            in_streak = rng.random() < stay_in_streak
+        else:
+            if records_zeroes:
+                yield index, 0
+            in_streak = rng.random() >= stay_in_gap
+
+
+def habit_buckets(rng, habit, today):
+    """
+    Return a list of Buckets for the habit, in its own resolution and each
+    coarser one, as ``Habit.record`` would have made them.
+    """
+    totals = defaultdict(int)
+    for index, value in habit_values(rng, habit, periods_between(habit, today)):
+        totals[(habit.resolution, index)] += value
+        if habit.resolution == 'month':
+            continue
+        date = TimePeriod.from_index(habit.start, habit.resolution, index).date
+        if habit.resolution != 'week':
+            totals[('week', habit.get_time_period(date, 'week').index)] += value
+        totals[('month', habit.get_time_period(date, 'month').index)] += value
+
+    buckets = []
+    sums = defaultdict(lambda: [0, 0, 0])
+    for (resolution, index), value in sorted(totals.items()):
+        running = sums[resolution]
+        running[0] += value
+        running[1] += value > 0
+        running[2] += value >= habit.target_value
+        buckets.append(Bucket(habit_id=habit.pk, resolution=resolution,
+                              index=index, value=value,
+                              cumulative_value=running[0],
+                              cumulative_nonzero=running[1],
+                              cumulative_successes=running[2]))
+    return buckets
+
+
+def habit_runs(habit, buckets):
+    """
+    Return a list of Runs for the habit, given its ``buckets``.
+    """
+    periods = [(b.index, runs.classify(b.value, habit.target_value))
+               for b in buckets if b.resolution == habit.resolution]
+    return [Run(habit_id=habit.pk, kind=kind, start=start, stop=stop)
+            for kind, start, stop in runs.build(periods)]
+
+
+def _bulk_create(model, objs, chunk_size):
+    for i in xrange(0, len(objs), chunk_size):
+        model.objects.bulk_create(objs[i:i + chunk_size])
+
+
+def seed_load_data(users, habits_per_user, years, seed=0, today=None, chunk_size=5000):
+    """
+    Create ``users`` users with ``habits_per_user`` habits each, started up
+    to ``years`` years before ``today``, and their data. The same arguments
+    always produce the same data. Returns a ``(users, habits, buckets)``
+    tuple of the number of rows created.
+    """
+    if years < 1:
+        raise ValueError("years must be at least 1")
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    now = timezone.now()
+    emails = [seed_email(seed, n) for n in range(users)]
+
+    if User.objects.filter(email__in=emails[:1]).exists():
+        raise ValueError("Data for seed %d already exists" % seed)
+
+    with transaction.commit_on_success():
+        # Hashing is slow, so every user shares one password hash
+        password = make_password(SEED_PASSWORD)
+        _bulk_create(User, [
+            User(email=email,
+                 name='Load User %d' % n,
+                 password=password,
+                 timezone=rng.choice(TIMEZONES),
+                 last_login=now,
+                 date_joined=now)
+            for n, email in enumerate(emails)
+        ], chunk_size)
+
+        # bulk_create doesn't set primary keys, so fetch the users again
+        user_objs = list(User.objects.filter(email__in=emails).order_by('email'))
+
+        habits = []
+        resolutions = [r for r, _ in RESOLUTIONS]
+        for i, user in enumerate(user_objs):
+            for n in range(habits_per_user):
+                habit = Habit(
+                    user=user,
+                    description='Load habit %d' % n,
+                    resolution=resolutions[(i + n) % len(resolutions)],
+                    start=today - datetime.timedelta(days=rng.randint(1, years * 365)),
+                    target_value=rng.choice([1, 1, 1, rng.randint(2, 10)]),
+                    send_data_collection_emails=rng.random() < 0.5,
+                )
+                if rng.random() < 0.6:
+                    habit.set_reminder_schedule(
+                        [rng.random() < 0.6 for _ in range(7)],
+                        rng.randint(6, 21),
+                    )
+                    # bulk_create doesn't call save(), so schedule the
+                    # reminders here
+                    habit.update_reminder_schedule(now)
+                habits.append(habit)
+        _bulk_create(Habit, habits, chunk_size)
+
+        habit_objs = Habit.objects.filter(user__in=user_objs).order_by('user', 'description')
+        buckets = []
+        habit_run_objs = []
+        num_buckets = 0
+        for habit in habit_objs:
+            new_buckets = habit_buckets(rng, habit, today)
+            buckets.extend(new_buckets)
+            habit_run_objs.extend(habit_runs(habit, new_buckets))
+            if len(buckets) >= chunk_size:
+                num_buckets += len(buckets)
+                _bulk_create(Bucket, buckets, chunk_size)
+                _bulk_create(Run, habit_run_objs, chunk_size)
+                buckets = []
+                habit_run_objs = []
+        num_buckets += len(buckets)
+        _bulk_create(Bucket, buckets, chunk_size)
+        _bulk_create(Run, habit_run_objs, chunk_size)
+
+    return len(user_objs), len(habits), num_buckets
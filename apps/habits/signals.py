@@ -3,3 +3,4 @@ from django.dispatch import Signal
 habit_archived = Signal()
 habit_created = Signal()
 habit_data_recorded = Signal()
+habit_resolution_changed = Signal(providing_args=['old_resolution'])
@@ -1,3 +1,11 @@
+from .test_benchmarks import *
+from .test_calendar_index import *
+from .test_deletion import *
+from .test_loadtest import *
 from .test_models import *
+from .test_rebucketing import *
 from .test_reminders import *
+from .test_runs import *
+from .test_scheduler import *
+from .test_seeding import *
 from .test_views import *
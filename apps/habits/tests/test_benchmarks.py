@@ -0,0 +1,63 @@
+import datetime
+
+from django.test import TestCase
+
+from apps.habits.benchmarks import (benchmarks, compare, percentile,
+                                    run_benchmark, BenchContext)
+from apps.habits.models import Habit
+from apps.habits.seeding import seed_load_data
+
+
+class TestBenchmarks(TestCase):
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 50), 51)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+
+    def test_run_benchmarks(self):
+        today = datetime.date(2013, 6, 1)
+        seed_load_data(users=2, habits_per_user=2, years=1, today=today)
+        ctx = BenchContext(list(Habit.objects.order_by('pk')), today)
+
+        for name in ['habit_record', 'streaks', 'dashboard', 'sendreminders']:
+            result = run_benchmark(benchmarks.get(name), ctx, 3)
+            self.assertEqual(result['iterations'], 3)
+            self.assertTrue(result['p50'] <= result['p90'] <= result['max'])
+            self.assertTrue(result['queries'] > 0)
+
+    def test_compare(self):
+        baseline = {
+            'a': {'p50': 10.0, 'p90': 20.0, 'queries': 3},
+            'b': {'p50': 10.0, 'p90': 20.0, 'queries': 3},
+            'c': {'error': 'DatabaseError'},
+        }
+        results = {
+            'a': {'p50': 12.0, 'p90': 21.0, 'queries': 3},
+            'b': {'p50': 10.5, 'p90': 20.0, 'queries': 4},
+            'c': {'p50': 1.0, 'p90': 1.0, 'queries': 1},
+        }
+        self.assertEqual(compare(results, baseline, 0.1, 1.0), [
+            'a: p50 12.000ms, was 10.000ms',
+            'b: 4 queries, was 3',
+        ])
+        self.assertEqual(compare(results, baseline, 0.1, 5.0), [
+            'b: 4 queries, was 3',
+        ])
+
+    def test_compare_failed_and_missing(self):
+        baseline = {
+            'a': {'p50': 10.0, 'p90': 20.0, 'queries': 3},
+            'b': {'p50': 10.0, 'p90': 20.0, 'queries': 3},
+        }
+        results = {
+            'a': {'error': 'DatabaseError: no such table'},
+            'c': {'p50': 1.0, 'p90': 1.0, 'queries': 1},
+        }
+        self.assertEqual(compare(results, baseline, 0.1, 1.0), [
+            'b: missing from results',
+            'a: failed with DatabaseError: no such table',
+            'c: no baseline',
+        ])
@@ -0,0 +1,44 @@
+import datetime
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from apps.habits import calendar_index
+
+
+class CalendarIndexTests(TestCase):
+
+    def setUp(self):
+        # Build the tables for the overridden years
+        calendar_index._tables = None
+
+    def tearDown(self):
+        calendar_index._tables = None
+
+    def dates(self):
+        # Either side of, and inside, the tables' years
+        day = datetime.date(2011, 11, 1)
+        while day < datetime.date(2014, 2, 1):
+            yield day
+            day += datetime.timedelta(days=1)
+
+    @override_settings(CALENDAR_INDEX_YEARS=(2012, 2013))
+    def test_weekday_occurrences(self):
+        for day in self.dates():
+            occurrences = calendar_index.weekday_occurrences(day.year, day.month)
+            self.assertTrue(day.day in occurrences[day.weekday()])
+            later = day + datetime.timedelta(days=7)
+            self.assertEqual(later.month != day.month,
+                             calendar_index.is_last_weekday_of_month(day))
+        self.assertEqual((3, 10, 17, 24),
+                         calendar_index.weekday_occurrences(2013, 2)[6])
+
+    @override_settings(CALENDAR_INDEX_YEARS=(2012, 2013))
+    def test_ends_period(self):
+        for day in self.dates():
+            tomorrow = day + datetime.timedelta(days=1)
+            self.assertTrue(calendar_index.ends_period(day, 'day'))
+            self.assertEqual(day.weekday() < 5, calendar_index.ends_period(day, 'weekday'))
+            self.assertEqual(day.weekday() >= 5, calendar_index.ends_period(day, 'weekendday'))
+            self.assertEqual(tomorrow.weekday() == 0, calendar_index.ends_period(day, 'week'))
+            self.assertEqual(tomorrow.day == 1, calendar_index.ends_period(day, 'month'))
@@ -0,0 +1,113 @@
+import datetime
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from apps.accounts.models import User
+from apps.encouragements import store_encouragement
+from apps.habits import deletion
+from apps.habits.models import Bucket, Habit, Run
+
+
+class DeletionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='foo@bar.com')
+        self.other_user = User.objects.create(email='baz@bar.com')
+        self.habit = self.create_habit(self.user)
+        self.other_habit = self.create_habit(self.user)
+        self.others_habit = self.create_habit(self.other_user)
+
+    def create_habit(self, user):
+        habit = Habit.objects.create(description="Foo my bar",
+                                     start=datetime.date(2013, 3, 4),
+                                     user=user,
+                                     resolution='day')
+        for days in range(0, 20, 2):
+            date = habit.start + datetime.timedelta(days=days)
+            habit.record(habit.get_time_period(date), days % 3)
+        store_encouragement(habit)
+        return habit
+
+    def test_schedule_user(self):
+        deletion.schedule_user(self.user)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertFalse(user.is_active)
+        self.assertNotEqual(None, user.scheduled_for_deletion)
+        self.assertEqual(2, self.user.habits.filter(archived=True,
+            scheduled_for_deletion__isnull=False).count())
+        self.assertEqual(None, Habit.objects.get(pk=self.others_habit.pk).scheduled_for_deletion)
+
+    def test_schedule_updates_modified(self):
+        before = timezone.now()
+        deletion.schedule_habit(self.habit)
+        self.assertTrue(Habit.objects.get(pk=self.habit.pk).modified >= before)
+        deletion.schedule_user(self.user)
+        self.assertTrue(Habit.objects.get(pk=self.other_habit.pk).modified >= before)
+
+    @override_settings(DASHBOARD_CACHE=True)
+    def test_scheduled_habit_leaves_dashboard(self):
+        self.user.set_password('12345')
+        self.user.save()
+        self.client.login(email=self.user.email, password='12345')
+        edit_url = reverse('habit_edit', args=[self.habit.pk])
+        self.assertContains(self.client.get(reverse('homepage')), edit_url)
+
+        deletion.schedule_habit(self.habit)
+        response = self.client.get(reverse('homepage'))
+        self.assertNotContains(response, edit_url)
+        # Not even as an archived habit which could be revived
+        self.assertNotContains(response, reverse('habit_archive', args=[self.habit.pk]))
+
+    def test_scheduled_habit_cant_be_changed(self):
+        self.user.set_password('12345')
+        self.user.save()
+        self.client.login(email=self.user.email, password='12345')
+        deletion.schedule_habit(self.habit)
+
+        response = self.client.post(reverse('habit_archive', args=[self.habit.pk]),
+                                    {'archive': '0'})
+        self.assertEqual(404, response.status_code)
+        self.assertTrue(Habit.objects.get(pk=self.habit.pk).archived)
+
+        record_url = reverse('habit_record', args=[self.habit.pk])
+        self.assertEqual(404, self.client.get(record_url).status_code)
+        self.assertEqual(404, self.client.post(record_url, {}).status_code)
+        edit_url = reverse('habit_edit', args=[self.habit.pk])
+        self.assertEqual(404, self.client.get(edit_url).status_code)
+
+    def test_deletes_scheduled_user(self):
+        deletion.schedule_user(self.user)
+        call_command('deletescheduled', chunk_size=3, pause=0, verbosity=0)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual([self.others_habit.pk],
+                         list(Habit.objects.values_list('pk', flat=True)))
+        self.assertEqual(set([self.others_habit.pk]),
+                         set(Bucket.objects.values_list('habit', flat=True)))
+        self.assertEqual(set([self.others_habit.pk]),
+                         set(Run.objects.values_list('habit', flat=True)))
+
+    def test_deletes_scheduled_habit(self):
+        deletion.schedule_habit(self.habit)
+        call_command('deletescheduled', chunk_size=3, pause=0, verbosity=0)
+        self.assertTrue(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual([self.other_habit.pk],
+                         list(self.user.habits.values_list('pk', flat=True)))
+        self.assertFalse(Bucket.objects.filter(habit=self.habit.pk).exists())
+
+    def test_resumes(self):
+        deletion.schedule_user(self.user)
+        # Stopped part way through the first habit's buckets
+        deletion._delete_chunks(Bucket, self.habit.pk, 3, 0)
+        call_command('deletescheduled', chunk_size=3, pause=0, verbosity=0)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Bucket.objects.filter(habit__user=self.user.pk).exists())
+
+    def test_deletes_in_chunks(self):
+        buckets = self.habit.buckets.count()
+        self.assertEqual(buckets, deletion._delete_chunks(Bucket, self.habit.pk, 3, 0))
+        self.assertFalse(self.habit.buckets.exists())
+        self.assertTrue(self.other_habit.buckets.exists())
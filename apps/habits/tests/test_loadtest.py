@@ -0,0 +1,63 @@
+import datetime
+
+from django.test import LiveServerTestCase
+
+from apps.habits.loadtest import (forget_latest_period, prepare_flows, record_form_data,
+                                  run_load_test)
+from apps.habits.models import RESOLUTIONS, Habit, TimePeriod
+from apps.habits.seeding import seed_load_data
+
+
+class TestLoadTest(LiveServerTestCase):
+
+    def test_record_form_data(self):
+        html = '''
+            <input type='hidden' name='csrfmiddlewaretoken' value='abc' />
+            <input id="id_3-date" name="3-date" type="hidden" value="2013-06-01" />
+            <input type='hidden' name='3-value' value='0'>
+            <input type='checkbox' name='3-value' value='1'>
+            <input id="id_2-value" name="2-value" type="text" />
+        '''
+        self.assertEqual(record_form_data(html, value=4), {
+            'csrfmiddlewaretoken': 'abc',
+            '3-date': '2013-06-01',
+            '3-value': '4',
+            '2-value': '4',
+        })
+
+    def test_run_load_test(self):
+        seed_load_data(users=3, habits_per_user=1, years=1,
+                       today=datetime.date.today() - datetime.timedelta(days=30))
+        flows = prepare_flows(10)
+        self.assertEqual(len(flows), 3)
+
+        result = run_load_test(self.live_server_url, flows, concurrency=2)
+        summary = result.summary()
+
+        self.assertEqual(summary['flows'], 3)
+        self.assertEqual(summary['error_rate'], 0)
+        for step in ['login', 'record_form', 'record_post', 'encouragement']:
+            self.assertEqual(summary['steps'][step]['requests'], 3)
+
+        for habit in Habit.objects.all():
+            self.assertEqual(habit.get_recent_unentered_time_periods(), [])
+
+    def test_forget_latest_period(self):
+        seed_load_data(users=2, habits_per_user=3, years=1)
+        habits = Habit.objects.exclude(resolution='month')
+        self.assertTrue(habits.exists())
+        for habit in habits:
+            def state():
+                return ([list(habit.buckets.filter(resolution=resolution).order_by('index').values_list(
+                             'index', 'value', 'cumulative_value', 'cumulative_nonzero',
+                             'cumulative_successes'))
+                         for resolution, name in RESOLUTIONS],
+                        list(habit.runs.order_by('start').values_list('start', 'stop', 'kind')))
+            before = state()
+            latest = habit.get_buckets(order_by='-index')[0]
+
+            forget_latest_period(habit)
+            self.assertNotEqual(before, state())
+            period = TimePeriod.from_index(habit.start, habit.resolution, latest.index)
+            habit.record(period, latest.value)
+            self.assertEqual(before, state())
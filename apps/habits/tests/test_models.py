@@ -2,13 +2,17 @@ from collections import namedtuple
 import calendar
 import datetime
 import functools
+import random
 
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 from django.utils import timezone
 
 from apps.accounts.models import User
-from apps.habits.models import Habit, TimePeriod
+from apps.habits.models import (Bucket, Habit, RESOLUTION_CODES, TimePeriod,
+                                next_reminder_time, utc_reminder_schedule)
 from lib import test_helpers as helpers
 
 # If, for example, we create a habit on a Tuesday with a resolution of
@@ -228,6 +232,41 @@ TIME_PERIOD_FRIENDLY_NAME_FIXTURES = (
     TPFNF('2013-03-05', 'week', '2013-03-15', 'Week of March 5th'),
 )
 
+# (reminder_days, reminder_hour, after, expected next reminder). 2013-03-04
+# was a Monday.
+NRF = namedtuple('NextReminderFixture', 'days hour after expected')
+
+NEXT_REMINDER_FIXTURES = (
+    NRF(0,            12,   '2013-03-04 09:00', None),
+    NRF(1,            None, '2013-03-04 09:00', None),
+    NRF(1,            12,   '2013-03-04 09:00', '2013-03-04 12:00'),
+    NRF(1,            12,   '2013-03-04 11:59', '2013-03-04 12:00'),
+    NRF(1,            12,   '2013-03-04 12:00', '2013-03-11 12:00'),
+    NRF(1,            12,   '2013-03-04 12:01', '2013-03-11 12:00'),
+    NRF(1 | 4 | 16,   15,   '2013-03-04 16:00', '2013-03-06 15:00'),
+    NRF(1 | 4 | 16,   15,   '2013-03-08 16:00', '2013-03-11 15:00'),
+    NRF(32 | 64,      0,    '2013-03-09 00:00', '2013-03-10 00:00'),
+    NRF(32 | 64,      0,    '2013-03-10 00:30', '2013-03-16 00:00'),
+    NRF(64,           23,   '2013-03-31 22:00', '2013-03-31 23:00'),
+)
+
+# (local reminder_days, local reminder_hour, UTC offset in minutes, expected
+# UTC reminder_days, expected UTC reminder_hour)
+URSF = namedtuple('UTCReminderScheduleFixture', 'days hour offset utc_days utc_hour')
+
+UTC_REMINDER_SCHEDULE_FIXTURES = (
+    URSF(1,       9,    0,    1,       9),
+    URSF(1,       None, 60,   1,       None),
+    URSF(1,       9,    60,   1,       8),
+    URSF(1,       9,    -300, 1,       14),
+    URSF(1,       0,    60,   64,      23),
+    URSF(1 | 64,  1,    120,  32 | 64, 23),
+    URSF(64,      22,   -180, 1,       1),
+    URSF(32 | 64, 20,   -300, 1 | 64,  1),
+    URSF(1,       9,    330,  1,       4),
+    URSF(1,       9,    -210, 1,       13),
+)
+
 SCHEDULE_MONDAYS     = [n == 0 for n in range(7)]
 SCHEDULE_MON_WED_FRI = [n % 2 == 0 and n != 6 for n in range(7)]
 SCHEDULE_WEEKENDS    = [n > 4 for n in range(7)]
@@ -412,9 +451,209 @@ class HabitTests(TestCase):
         h.save()
         self.assertEqual(h.reminder_last_sent, d)
 
+    def test_next_reminder_at_no_schedule(self):
+        h = Habit.objects.create(user=self.user,
+                                 start=datetime.date(2013, 3, 4),
+                                 description='Do a thing. On a day.')
+        self.assertIsNone(h.next_reminder_at)
+
+    def test_next_reminder_at_set_on_save(self):
+        h = Habit(user=self.user,
+                  start=datetime.date(2013, 3, 4),
+                  description='Do a thing. On a day.')
+        h.set_reminder_schedule(SCHEDULE_MONDAYS, 12)
+        h.save()
+
+        self.assertEqual(h.next_reminder_at.weekday(), calendar.MONDAY)
+        self.assertEqual(h.next_reminder_at.hour, 12)
+        self.assertTrue(h.next_reminder_at > timezone.now())
+        self.assertEqual(list(Habit.due_for_reminder(h.next_reminder_at)), [h])
+        self.assertEqual(list(Habit.due_for_reminder(timezone.now())), [])
+
+    def test_next_reminder_at_follows_schedule_changes(self):
+        h = Habit(user=self.user,
+                  start=datetime.date(2013, 3, 4),
+                  description='Do a thing. On a day.')
+        h.set_reminder_schedule(SCHEDULE_MONDAYS, 12)
+        h.save()
+
+        h = Habit.objects.get(pk=h.pk)
+        h.set_reminder_schedule(SCHEDULE_WEEKENDS, 7)
+        h.save()
+
+        self.assertTrue(h.next_reminder_at.weekday() in [calendar.SATURDAY,
+                                                         calendar.SUNDAY])
+        self.assertEqual(h.next_reminder_at.hour, 7)
+
+    def test_next_reminder_at_unchanged_by_other_edits(self):
+        h = Habit(user=self.user,
+                  start=datetime.date(2013, 3, 4),
+                  description='Do a thing. On a day.')
+        h.set_reminder_schedule(SCHEDULE_MONDAYS, 12)
+        h.save()
+        due = timezone.now().replace(minute=0, second=0, microsecond=0)
+        Habit.objects.filter(pk=h.pk).update(next_reminder_at=due)
+
+        h = Habit.objects.get(pk=h.pk)
+        h.description = 'Do another thing'
+        h.save()
+
+        self.assertEqual(h.next_reminder_at, due)
+
+    def test_deferred_fields_not_loaded(self):
+        h = Habit(user=self.user,
+                  start=datetime.date(2013, 3, 4),
+                  description='Do a thing. On a day.')
+        h.set_reminder_schedule(SCHEDULE_MONDAYS, 12)
+        h.save()
+        h.record(h.get_time_period(h.start), 1)
+
+        with helpers.assert_max_queries(1):
+            habits = list(Habit.objects.only('description'))
+        h = habits[0]
+        h.description = 'Do another thing'
+        with helpers.assert_max_queries(1):
+            h.save()
+        self.assertEqual('Do another thing', Habit.objects.get(pk=h.pk).description)
+
+    def test_deferred_resolution_change_rebuilds(self):
+        h = Habit.objects.create(user=self.user,
+                                 start=datetime.date(2013, 3, 4),
+                                 description='Do a thing. On a day.')
+        h.record(h.get_time_period(datetime.date(2013, 3, 11)), 1)
+
+        h = Habit.objects.only('description').get(pk=h.pk)
+        h.resolution = 'week'
+        h.save()
+        self.assertEqual([(1, 1)], list(h.get_buckets().values_list('index', 'value')))
+
+class WindowStatsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='foo@bar.com')
+        self.habit = Habit.objects.create(description="Foo my bar",
+                                          start=datetime.date(2013, 3, 4),
+                                          user=self.user,
+                                          resolution='day',
+                                          target_value=2)
+
+    def record(self, index, value):
+        self.habit.record(self.habit.get_time_period(
+            self.habit.start + datetime.timedelta(days=index)), value)
+
+    def brute_force(self, lo, hi, resolution):
+        values = self.habit.buckets.filter(
+            resolution=resolution, index__gte=lo, index__lt=hi,
+        ).values_list('value', flat=True)
+        return (max(hi - lo, 0), sum(values), len([v for v in values if v > 0]),
+                len([v for v in values if v >= self.habit.target_value]))
+
+    def check_windows(self, rand):
+        for resolution in ['day', 'week', 'month']:
+            for i in range(20):
+                lo, hi = sorted([rand.randint(-5, 70), rand.randint(-5, 70)])
+                self.assertEqual(self.brute_force(lo, hi, resolution),
+                                 tuple(self.habit.window_stats(lo, hi, resolution)))
+
+    def test_window_stats(self):
+        rand = random.Random(2)
+        indexes = range(60) * 2
+        rand.shuffle(indexes)
+        for index in indexes[:90]:
+            self.record(index, rand.choice([0, 0, 1, 2, 3]))
+        self.check_windows(rand)
+
+        # Sums are reworked when the target changes
+        self.habit.target_value = 3
+        self.habit.save()
+        self.check_windows(rand)
+
+    def test_empty_window(self):
+        self.record(3, 2)
+        self.assertEqual((0, 0, 0, 0), tuple(self.habit.window_stats(5, 5)))
+        self.assertEqual((3, 0, 0, 0), tuple(self.habit.window_stats(0, 3)))
+        self.assertEqual((4, 2, 1, 1), tuple(self.habit.window_stats(0, 4)))
+
+    def test_window_stats_query_budget(self):
+        for index in range(50):
+            self.record(index, 1)
+        with helpers.assert_max_queries(2):
+            stats = self.habit.window_stats(10, 40)
+        self.assertEqual(30, stats.total)
+
+
+class ResolutionFieldTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='foo@bar.com')
+        self.habit = Habit.objects.create(description="Foo my bar",
+                                          start=datetime.date(2013, 3, 4),
+                                          user=self.user,
+                                          resolution='weekday')
+        self.habit.record(self.habit.get_time_period(self.habit.start), 1)
+
+    def test_stored_as_code(self):
+        cursor = connection.cursor()
+        cursor.execute("SELECT resolution FROM habits_bucket WHERE habit_id = %s "
+                       "ORDER BY resolution", [self.habit.pk])
+        self.assertEqual([RESOLUTION_CODES[r] for r in ['weekday', 'week', 'month']],
+                         [row[0] for row in cursor.fetchall()])
+
+    def test_names_in_python(self):
+        bucket = self.habit.get_buckets()[0]
+        self.assertEqual('weekday', bucket.resolution)
+        buckets = Bucket.objects.filter(resolution__in=['week', 'month'])
+        self.assertEqual(['month', 'week'], sorted(b.resolution for b in buckets))
+
+    def test_unknown_resolution(self):
+        with self.assertRaises(ValueError):
+            list(Bucket.objects.filter(resolution='fortnight'))
+
 class TimePeriodTests(TestCase):
     pass
 
+class NextReminderTimeTests(TestCase):
+    pass
+
+class UTCReminderScheduleTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='foo@bar.com',
+                                        timezone='America/New_York')
+
+    def test_habit_schedule_converted_to_utc(self):
+        h = Habit(user=self.user,
+                  start=datetime.date(2013, 3, 4),
+                  description='Do a thing. On a day.')
+        h.set_reminder_schedule(SCHEDULE_MONDAYS, 21)
+        h.save()
+
+        self.assertTrue(h.reminder_utc_offset in [-300, -240])
+        self.assertEqual(h.reminder_utc_days, 2)
+        self.assertEqual(h.reminder_utc_hour, 21 - h.reminder_utc_offset // 60 - 24)
+        self.assertEqual(h.next_reminder_at.weekday(), calendar.TUESDAY)
+        self.assertEqual(list(Habit.scheduled_for_reminder(calendar.TUESDAY,
+                                                           h.reminder_utc_hour)), [h])
+        self.assertEqual(list(Habit.scheduled_for_reminder(calendar.MONDAY, 21)), [])
+
+    def test_refreshreminderschedules(self):
+        h = Habit(user=self.user,
+                  start=datetime.date(2013, 3, 4),
+                  description='Do a thing. On a day.')
+        h.set_reminder_schedule(SCHEDULE_MONDAYS, 21)
+        h.save()
+        utc_hour = h.reminder_utc_hour
+        Habit.objects.filter(pk=h.pk).update(reminder_utc_offset=0,
+                                             reminder_utc_hour=21,
+                                             reminder_utc_days=1)
+
+        call_command('refreshreminderschedules')
+
+        h = Habit.objects.get(pk=h.pk)
+        self.assertTrue(h.reminder_utc_offset in [-300, -240])
+        self.assertEqual(h.reminder_utc_hour, utc_hour)
+        self.assertEqual(h.reminder_utc_days, 2)
+
 def test_time_period_from_date(self, fixture):
     start, when, resolution, result, date = fixture
 
@@ -519,5 +758,26 @@ def test_get_streaks(self, fixture):
         h.record(tp, value)
 
     self.assertEqual(list(h.get_streaks()), fixture.streaks)
+    self.assertEqual(list(h.get_run_streaks()), fixture.streaks)
 
 helpers.attach_fixture_tests(HabitTests, test_get_streaks, STREAKS_FIXTURES)
+
+def test_next_reminder_time(self, fixture):
+    after = datetime.datetime.strptime(fixture.after, '%Y-%m-%d %H:%M')
+    after = timezone.make_aware(after, timezone.utc)
+
+    result = next_reminder_time(fixture.days, fixture.hour, after)
+
+    if fixture.expected is None:
+        self.assertIsNone(result)
+    else:
+        expected = datetime.datetime.strptime(fixture.expected, '%Y-%m-%d %H:%M')
+        self.assertEqual(result, timezone.make_aware(expected, timezone.utc))
+
+helpers.attach_fixture_tests(NextReminderTimeTests, test_next_reminder_time, NEXT_REMINDER_FIXTURES)
+
+def test_utc_reminder_schedule(self, fixture):
+    result = utc_reminder_schedule(fixture.days, fixture.hour, fixture.offset)
+    self.assertEqual(result, (fixture.utc_days, fixture.utc_hour))
+
+helpers.attach_fixture_tests(UTCReminderScheduleTests, test_utc_reminder_schedule, UTC_REMINDER_SCHEDULE_FIXTURES)
@@ -0,0 +1,89 @@
+import datetime
+
+from django.test import TestCase
+
+from apps.accounts.models import User
+from apps.encouragements import store_encouragement
+from apps.encouragements.models import HabitEncouragement
+from apps.habits import runs
+from apps.habits.models import Habit
+from apps.habits.rebucketing import rebucket
+
+
+class RebucketingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='foo@bar.com')
+        # A Monday
+        self.start = datetime.date(2013, 3, 4)
+        self.habit = Habit.objects.create(description="Foo my bar",
+                                          start=self.start,
+                                          user=self.user,
+                                          resolution='day',
+                                          target_value=2)
+
+    def record(self, days, value):
+        date = self.start + datetime.timedelta(days=days)
+        self.habit.record(self.habit.get_time_period(date), value)
+
+    def values(self, resolution=None):
+        return list(self.habit.get_buckets().filter(
+            resolution=resolution or self.habit.resolution
+        ).values_list('index', 'value'))
+
+    def change_resolution(self, resolution):
+        self.habit.resolution = resolution
+        self.habit.save()
+
+    def test_day_to_weekday(self):
+        # Mon, Tue, Sat, Sun, Mon
+        for days, value in [(0, 1), (1, 2), (5, 3), (6, 4), (7, 5)]:
+            self.record(days, value)
+        self.change_resolution('weekday')
+        self.assertEqual([(0, 1), (1, 2), (5, 5)], self.values())
+
+    def test_weekday_to_day(self):
+        self.habit.resolution = 'weekday'
+        self.habit.save()
+        for days, value in [(0, 1), (4, 2), (7, 3)]:
+            self.record(days, value)
+        self.change_resolution('day')
+        self.assertEqual([(0, 1), (4, 2), (7, 3)], self.values())
+
+    def test_replaces_stale_buckets(self):
+        self.record(0, 1)
+        self.record(1, 1)
+        self.change_resolution('weekday')
+        self.change_resolution('day')
+        # Recorded as days, and then (adding to the carried value) as weekdays
+        self.record(2, 2)
+        self.change_resolution('weekday')
+        self.record(1, 3)
+        self.change_resolution('day')
+        self.assertEqual([(0, 1), (1, 4), (2, 2)], self.values())
+
+    def test_week_untouched(self):
+        self.record(0, 1)
+        self.record(8, 2)
+        self.assertEqual(0, rebucket(self.habit, 'week'))
+        self.change_resolution('week')
+        self.assertEqual([(0, 1), (1, 2)], self.values())
+
+    def test_derived_data_rebuilt(self):
+        for days, value in [(0, 2), (5, 2), (7, 2)]:
+            self.record(days, value)
+        self.change_resolution('weekday')
+        self.assertEqual([(runs.SUCCESS, 0, 1), (runs.MISSING, 1, 5),
+                          (runs.SUCCESS, 5, 6)],
+                         [(r.kind, r.start, r.stop)
+                          for r in reversed(self.habit.get_runs())])
+        stats = self.habit.window_stats(0, 6)
+        self.assertEqual((6, 4, 2, 2), (stats.periods, stats.total,
+                                        stats.nonzero, stats.successes))
+
+    def test_stored_encouragement_forgotten(self):
+        self.record(6, 2)
+        store_encouragement(self.habit, 6)
+        self.change_resolution('weekday')
+        self.assertFalse(
+            HabitEncouragement.objects.filter(habit=self.habit).exists())
@@ -1,12 +1,19 @@
+from StringIO import StringIO
 import datetime
+import smtplib
 
 from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
 
 from apps.accounts.models import User
 from apps.habits.models import Habit
-from apps.habits.reminders import send_reminder_email, send_data_collection_email
+from apps.habits.reminders import (send_due_reminder, send_reminder_email,
+                                   send_data_collection_email)
 from lib import test_helpers as helpers
+from lib.metrics import statsd
 
 DATA_COLLECTION_FIXTURES = (
     # habit resolution, send date, should send?
@@ -71,6 +78,113 @@ class TestReminders(TestCase):
         self.assertEqual(len(mail.outbox), 0)
 
 
+class TestDueReminders(TestCase):
+
+    def setUp(self):
+        self.u = User.objects.create(email='foo@bar.com', password='SecretZ!')
+        self.h = Habit(user=self.u,
+                       description='Frobble your wingdangle',
+                       start=datetime.date(2013, 3, 4))
+        self.h.set_reminder_schedule([True] * 7, 9)
+        self.h.save()
+        self.due = self.h.next_reminder_at
+        self.grace = datetime.timedelta(hours=3)
+
+    def test_sends_due_reminder_and_advances(self):
+        now = self.due + datetime.timedelta(minutes=5)
+        send_due_reminder(self.h, now, self.grace)
+
+        self.assertEqual(len(mail.outbox), 1)
+        h = Habit.objects.get(pk=self.h.pk)
+        self.assertEqual(h.reminder_last_sent, self.due)
+        self.assertEqual(h.next_reminder_at, self.due + datetime.timedelta(days=1))
+
+    def test_catches_up_within_grace(self):
+        now = self.due + datetime.timedelta(hours=2)
+        send_due_reminder(self.h, now, self.grace)
+
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_skips_stale_reminder_but_advances(self):
+        now = self.due + datetime.timedelta(hours=4)
+        send_due_reminder(self.h, now, self.grace)
+
+        self.assertEqual(len(mail.outbox), 0)
+        h = Habit.objects.get(pk=self.h.pk)
+        self.assertIsNone(h.reminder_last_sent)
+        self.assertEqual(h.next_reminder_at, self.due + datetime.timedelta(days=1))
+
+    def test_skips_missed_slots_when_advancing(self):
+        now = self.due + datetime.timedelta(days=2, hours=1)
+        send_due_reminder(self.h, now, self.grace)
+
+        self.assertEqual(len(mail.outbox), 1)
+        h = Habit.objects.get(pk=self.h.pk)
+        self.assertEqual(h.reminder_last_sent, self.due + datetime.timedelta(days=2))
+        self.assertEqual(h.next_reminder_at, self.due + datetime.timedelta(days=3))
+
+    def test_only_one_dispatcher_sends(self):
+        now = self.due + datetime.timedelta(minutes=5)
+        other = Habit.objects.get(pk=self.h.pk)
+
+        send_due_reminder(self.h, now, self.grace)
+        send_due_reminder(other, now, self.grace)
+
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_send_releases_unsent_reminders(self):
+        slot = timezone.now().replace(minute=0, second=0, microsecond=0)
+        for i in range(3):
+            h = Habit(user=self.u, description='Habit %d' % i, start=self.h.start)
+            h.set_reminder_schedule([True] * 7, slot.hour)
+            h.save()
+        Habit.objects.exclude(pk=self.h.pk).update(next_reminder_at=slot)
+
+        old_send_messages = locmem.EmailBackend.send_messages
+        def send_messages(backend, messages):
+            if len(mail.outbox) == 1:
+                raise smtplib.SMTPServerDisconnected()
+            return old_send_messages(backend, messages)
+        locmem.EmailBackend.send_messages = send_messages
+        try:
+            self.assertRaises(smtplib.SMTPServerDisconnected,
+                              call_command, 'sendreminders')
+        finally:
+            locmem.EmailBackend.send_messages = old_send_messages
+
+        self.assertEqual(len(mail.outbox), 1)
+        released = Habit.objects.filter(next_reminder_at=slot)
+        self.assertEqual(2, released.count())
+        self.assertEqual([None, None], [h.reminder_last_sent for h in released])
+
+        call_command('sendreminders')
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(0, Habit.objects.filter(next_reminder_at=slot).count())
+
+
+def test_sendreminders_command(self, num_habits):
+    slot = timezone.now().replace(minute=0, second=0, microsecond=0)
+    self.h.set_reminder_schedule([True] * 7, slot.hour)
+    self.h.save()
+    for i in range(1, num_habits):
+        h = Habit(user=self.u, description='Habit %d' % i, start=self.h.start)
+        h.set_reminder_schedule([True] * 7, slot.hour)
+        h.save()
+    Habit.objects.update(next_reminder_at=slot)
+
+    # Habits due together are claimed together, however many there are
+    with helpers.assert_max_queries(3):
+        call_command('sendreminders')
+    call_command('sendreminders')
+
+    self.assertEqual(len(mail.outbox), num_habits)
+    for h in Habit.objects.all():
+        self.assertTrue(h.next_reminder_at > timezone.now())
+        self.assertEqual(h.reminder_last_sent, slot)
+
+helpers.attach_fixture_tests(TestDueReminders, test_sendreminders_command, [1, 50])
+
+
 def test_send_data_collection_email(self, fixture):
     resolution, today, should_send = fixture
     today_date = helpers.parse_isodate(today)
@@ -87,3 +201,48 @@ def test_send_data_collection_email(self, fixture):
         self.assertEqual(len(mail.outbox), 0)
 
 helpers.attach_fixture_tests(TestReminders, test_send_data_collection_email, DATA_COLLECTION_FIXTURES)
+
+
+class CommandProfileTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(email='foo@bar.com')
+        for i in range(3):
+            Habit.objects.create(user=user,
+                                 description='Habit %d' % i,
+                                 start=datetime.date.today() - datetime.timedelta(days=3))
+        self.old_flush = statsd.flush
+        statsd.flush = lambda: None
+        statsd._reset()
+
+    def tearDown(self):
+        statsd.flush = self.old_flush
+        statsd._reset()
+
+    def test_profile(self):
+        err = StringIO()
+        call_command('senddatacollections', profile=True, stderr=err)
+        self.assertEqual(len(mail.outbox), 3)
+
+        self.assertEqual(3, statsd._gauges['command.senddatacollections.items'])
+        for metric in ('time', 'peak_rss_kb', 'query_time', 'render_per_item',
+                       'send_per_item'):
+            self.assertTrue('command.senddatacollections.%s' % metric in statsd._gauges)
+        self.assertTrue(err.getvalue().startswith('senddatacollections: items=3 '))
+
+
+
+def test_no_profile(self, num_habits):
+    user = User.objects.get()
+    for i in range(3, num_habits):
+        Habit.objects.create(user=user,
+                             description='Habit %d' % i,
+                             start=datetime.date.today() - datetime.timedelta(days=3))
+    err = StringIO()
+    with helpers.assert_max_queries(2):
+        call_command('senddatacollections', stderr=err)
+    self.assertEqual(len(mail.outbox), num_habits)
+    self.assertEqual({}, statsd._gauges)
+    self.assertEqual('', err.getvalue())
+
+helpers.attach_fixture_tests(CommandProfileTest, test_no_profile, [3, 50])
@@ -0,0 +1,98 @@
+import datetime
+import random
+
+from django.test import TestCase
+
+from apps.accounts.models import User
+from apps.habits import runs
+from apps.habits.models import Habit
+from apps.habits.runs import FAIL, MISSING, PARTIAL, SUCCESS
+from lib import test_helpers as helpers
+
+
+class RunFunctionTests(TestCase):
+
+    def test_classify(self):
+        self.assertEqual(SUCCESS, runs.classify(3, 3))
+        self.assertEqual(SUCCESS, runs.classify(4, 3))
+        self.assertEqual(PARTIAL, runs.classify(2, 3))
+        self.assertEqual(FAIL, runs.classify(0, 3))
+
+    def test_build(self):
+        self.assertEqual([], runs.build([]))
+        self.assertEqual(
+            [(MISSING, 0, 2), (SUCCESS, 2, 4), (FAIL, 4, 5), (MISSING, 5, 7),
+             (SUCCESS, 7, 8)],
+            runs.build([(2, SUCCESS), (3, SUCCESS), (4, FAIL), (7, SUCCESS)]))
+
+    def test_overwrite_extends(self):
+        self.assertEqual([(SUCCESS, 0, 3)],
+                         runs.overwrite([(SUCCESS, 0, 2)], 2, SUCCESS, 2))
+        self.assertEqual([(SUCCESS, 0, 2), (MISSING, 2, 4), (FAIL, 4, 5)],
+                         runs.overwrite([(SUCCESS, 0, 2)], 4, FAIL, 2))
+        # From an empty series
+        self.assertEqual([(MISSING, 0, 3), (FAIL, 3, 4)],
+                         runs.overwrite([], 3, FAIL, 0))
+
+    def test_overwrite_splits(self):
+        self.assertEqual([(MISSING, 0, 2), (PARTIAL, 2, 3), (MISSING, 3, 5),
+                          (SUCCESS, 5, 6)],
+                         runs.overwrite([(MISSING, 0, 5), (SUCCESS, 5, 6)],
+                                        2, PARTIAL, 6))
+
+    def test_overwrite_merges(self):
+        self.assertEqual([(SUCCESS, 0, 5)],
+                         runs.overwrite([(SUCCESS, 0, 2), (PARTIAL, 2, 3),
+                                         (SUCCESS, 3, 5)],
+                                        2, SUCCESS, 5))
+
+
+class HabitRunsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='foo@bar.com')
+        self.habit = Habit.objects.create(description="Foo my bar",
+                                          start=datetime.date(2013, 3, 4),
+                                          user=self.user,
+                                          resolution='day',
+                                          target_value=3)
+
+    def record(self, index, value):
+        self.habit.record(self.habit.get_time_period(
+            self.habit.start + datetime.timedelta(days=index)), value)
+
+    def get_runs(self):
+        return [(r.kind, r.start, r.stop) for r in reversed(self.habit.get_runs())]
+
+    def rebuilt_runs(self):
+        periods = [(index, runs.classify(value, self.habit.target_value))
+                   for index, value in self.habit.get_buckets().values_list('index', 'value')]
+        return runs.build(periods)
+
+    def test_kept_up_to_date(self):
+        rand = random.Random(4)
+        indexes = range(60) * 2
+        rand.shuffle(indexes)
+        for index in indexes[:80]:
+            self.record(index, rand.choice([0, 0, 1, 2, 3]))
+            self.assertEqual(self.rebuilt_runs(), self.get_runs())
+
+    def test_latest_runs(self):
+        for index, value in [(0, 3), (1, 3), (2, 0), (4, 1)]:
+            self.record(index, value)
+        self.assertEqual([(PARTIAL, 4, 5), (MISSING, 3, 4)],
+                         [(r.kind, r.start, r.stop) for r in self.habit.get_runs(2)])
+
+    def test_rebuilt_when_target_changes(self):
+        for index, value in [(0, 3), (1, 2), (2, 2)]:
+            self.record(index, value)
+        self.habit.target_value = 2
+        self.habit.save()
+        self.assertEqual([(SUCCESS, 0, 3)], self.get_runs())
+
+    def test_record_query_budget(self):
+        self.record(0, 3)
+        # Extending the latest run: find it, and update it
+        with helpers.assert_max_queries(2):
+            runs.record_period(self.habit, 1, SUCCESS)
+        self.assertEqual([(SUCCESS, 0, 2)], self.get_runs())
@@ -0,0 +1,108 @@
+import datetime
+
+from django.core import mail
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.accounts.models import User
+from apps.habits.models import Habit
+from apps.habits.scheduler import ReminderScheduler
+
+
+class TestReminderScheduler(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='foo@bar.com')
+        self.habit = self._create_habit('Frobble your wingdangle', 9)
+        self.due = self.habit.next_reminder_at
+        self.grace = datetime.timedelta(hours=3)
+
+    def _create_habit(self, description, hour):
+        h = Habit(user=self.user,
+                  description=description,
+                  start=datetime.date(2013, 3, 4))
+        h.set_reminder_schedule([True] * 7, hour)
+        h.save()
+        return h
+
+    def test_refresh_loads_scheduled_habits(self):
+        Habit.objects.create(user=self.user,
+                             description='No reminders',
+                             start=datetime.date(2013, 3, 4))
+        scheduler = ReminderScheduler()
+        scheduler.refresh(timezone.now())
+
+        self.assertEqual(len(scheduler), 1)
+        self.assertEqual(scheduler.next_fire_time(), self.due)
+
+    def test_pop_due(self):
+        scheduler = ReminderScheduler()
+        scheduler.refresh(timezone.now())
+
+        early = self.due - datetime.timedelta(seconds=1)
+        self.assertEqual(list(scheduler.pop_due(early)), [])
+        self.assertEqual(list(scheduler.pop_due(self.due)), [self.habit.pk])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_spread(self):
+        scheduler = ReminderScheduler(spread=datetime.timedelta(hours=1))
+        fire_at = scheduler.fire_time(self.habit.pk, self.due)
+
+        self.assertTrue(self.due <= fire_at < self.due + datetime.timedelta(hours=1))
+        self.assertEqual(fire_at, scheduler.fire_time(self.habit.pk, self.due))
+
+    def test_refresh_picks_up_changes(self):
+        scheduler = ReminderScheduler()
+        scheduler.refresh(timezone.now() - datetime.timedelta(seconds=1))
+
+        self.habit.set_reminder_schedule([True] * 7, (self.due.hour + 1) % 24)
+        self.habit.save()
+        other = self._create_habit('Wibble your frobnicator', 10)
+        scheduler.refresh(timezone.now())
+
+        self.assertEqual(len(scheduler), 2)
+        due = list(scheduler.pop_due(self.due + datetime.timedelta(days=2)))
+        self.assertEqual(sorted(due), sorted([self.habit.pk, other.pk]))
+
+    def test_refresh_overlaps_last_poll(self):
+        scheduler = ReminderScheduler(overlap=datetime.timedelta(minutes=5))
+        scheduler.refresh(timezone.now())
+
+        # Stamped before that poll, but committed after it
+        self.habit.set_reminder_schedule([True] * 7, (self.due.hour + 1) % 24)
+        self.habit.save()
+        Habit.objects.filter(pk=self.habit.pk).update(
+            modified=timezone.now() - datetime.timedelta(minutes=1))
+        scheduler.refresh(timezone.now())
+
+        self.assertEqual(scheduler.next_fire_time(), self.habit.next_reminder_at)
+        self.assertEqual(len(scheduler), 1)
+
+    def test_rescheduling_discards_stale_entries(self):
+        scheduler = ReminderScheduler()
+        scheduler.schedule(self.habit.pk, self.due)
+        scheduler.schedule(self.habit.pk, self.due + datetime.timedelta(days=1))
+
+        self.assertEqual(len(scheduler), 1)
+        self.assertEqual(list(scheduler.pop_due(self.due)), [])
+        self.assertEqual(scheduler.next_fire_time(), self.due + datetime.timedelta(days=1))
+
+    def test_dispatch_due(self):
+        scheduler = ReminderScheduler()
+        scheduler.refresh(timezone.now())
+
+        now = self.due + datetime.timedelta(minutes=5)
+        self.assertEqual(scheduler.dispatch_due(now, self.grace), 1)
+        self.assertEqual(scheduler.dispatch_due(now, self.grace), 0)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(scheduler.next_fire_time(), self.due + datetime.timedelta(days=1))
+
+    def test_dispatch_skips_deleted_habits(self):
+        scheduler = ReminderScheduler()
+        scheduler.refresh(timezone.now())
+        self.habit.delete()
+
+        self.assertEqual(scheduler.dispatch_due(self.due, self.grace), 0)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(len(scheduler), 0)
@@ -0,0 +1,100 @@
+from StringIO import StringIO
+import datetime
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from apps.accounts.models import User
+from apps.habits import runs
+from apps.habits.models import Bucket, Habit, RESOLUTIONS, rebuild_cumulative_sums
+from apps.habits.seeding import seed_load_data, seed_email
+
+
+class TestSeedLoadData(TestCase):
+
+    def setUp(self):
+        self.today = datetime.date(2013, 6, 1)
+
+    def _seed(self, seed=0):
+        return seed_load_data(users=4, habits_per_user=5, years=1,
+                              seed=seed, today=self.today, chunk_size=50)
+
+    def _dataset(self):
+        return sorted(Bucket.objects.values_list(
+            'habit__user__email', 'habit__description', 'resolution', 'index', 'value'))
+
+    def test_creates_users_habits_and_buckets(self):
+        users, habits, buckets = self._seed()
+
+        self.assertEqual(users, 4)
+        self.assertEqual(habits, 20)
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(Habit.objects.count(), 20)
+        self.assertEqual(Bucket.objects.count(), buckets)
+        self.assertTrue(User.objects.get(email=seed_email(0, 0)).check_password('password'))
+
+        resolutions = set(Habit.objects.values_list('resolution', flat=True))
+        self.assertEqual(resolutions, set(r for r, _ in RESOLUTIONS))
+
+    def test_deterministic(self):
+        self._seed()
+        first = self._dataset()
+
+        Bucket.objects.all().delete()
+        Habit.objects.all().delete()
+        User.objects.all().delete()
+        self._seed()
+
+        self.assertEqual(first, self._dataset())
+
+    def test_refuses_to_reseed(self):
+        self._seed()
+        self.assertRaises(ValueError, self._seed)
+        self._seed(seed=1)
+        self.assertEqual(User.objects.count(), 8)
+
+    def test_coarser_buckets_add_up(self):
+        self._seed()
+        for habit in Habit.objects.exclude(resolution='month'):
+            fine = habit.buckets.filter(resolution=habit.resolution)
+            months = habit.buckets.filter(resolution='month')
+            self.assertEqual(sum(b.value for b in fine),
+                             sum(b.value for b in months))
+            for bucket in fine:
+                self.assertTrue(bucket.index < habit.get_time_period(self.today).index)
+
+    def test_runs_match_buckets(self):
+        self._seed()
+        for habit in Habit.objects.all():
+            runs_before = [(r.kind, r.start, r.stop) for r in habit.get_runs()]
+            runs.rebuild(habit)
+            self.assertEqual(runs_before,
+                             [(r.kind, r.start, r.stop) for r in habit.get_runs()])
+
+    def test_cumulative_sums(self):
+        self._seed()
+        sums = sorted(Bucket.objects.values_list(
+            'pk', 'cumulative_value', 'cumulative_nonzero', 'cumulative_successes'))
+        rebuild_cumulative_sums()
+        self.assertEqual(sums, sorted(Bucket.objects.values_list(
+            'pk', 'cumulative_value', 'cumulative_nonzero', 'cumulative_successes')))
+
+    def test_reminders_scheduled(self):
+        self._seed()
+        scheduled = Habit.objects.filter(reminder_days__gt=0)
+        self.assertTrue(scheduled.exists())
+        self.assertFalse(scheduled.filter(next_reminder_at__isnull=True).exists())
+
+    def test_years_at_least_one(self):
+        with self.assertRaises(ValueError):
+            seed_load_data(users=1, habits_per_user=1, years=0, today=self.today)
+        with self.assertRaises(CommandError):
+            call_command('seed_load_data', users=1, habits_per_user=1, years=0,
+                         stdout=StringIO())
+        self.assertFalse(User.objects.exists())
+
+    def test_command(self):
+        call_command('seed_load_data', users=2, habits_per_user=2, years=1,
+                     today='2013-06-01', stdout=StringIO())
+        self.assertEqual(Habit.objects.count(), 4)
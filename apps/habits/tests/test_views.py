@@ -6,7 +6,9 @@ from django_webtest import WebTest
 from django.core.urlresolvers import reverse
 
 from apps.accounts.models import User
+from apps.encouragements import HabitEncouragement, store_encouragement
 from apps.habits.models import Habit, TimePeriod
+from lib import test_helpers as helpers
 
 
 class HabitArchiveViewTest(TestCase):
@@ -82,6 +84,13 @@ class HabitRecordViewTest(WebTest):
         bucket = self.habit.get_buckets().get(index=time_period.index)
         self.assertEquals(2, bucket.value)
 
+        # The encouragement is chosen once, when the data's recorded
+        stored = HabitEncouragement.objects.get(habit=self.habit)
+        self.assertEqual(time_period.index, stored.index)
+        for i in range(2):
+            response = self.app.get(reverse('habit_encouragement', args=[self.habit.id]))
+            self.assertEqual(stored.text, response.html.find(id='encouragement').text)
+
     def test_record_post_two(self):
         self.habit = Habit.objects.create(
             description="Frob my Hobbits",
@@ -220,3 +229,75 @@ class HabitPerformanceViewTest(WebTest):
 
         response = self.app.get(reverse('habit_performance'), user='someone@example.com')
         self.assertEqual(expect, json.loads(response.body))
+
+
+class HabitViewQueryBudgetTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='someone@example.com', password='123456', is_active=True
+        )
+        self.client.login(email='someone@example.com', password='123456')
+
+    def create_habits(self, num_habits):
+        start = datetime.date.today() - datetime.timedelta(days=30)
+        for i in range(num_habits):
+            habit = Habit.objects.create(description="Habit %d" % i,
+                                         start=start,
+                                         user=self.user,
+                                         resolution='week',
+                                         target_value=2)
+            for days in range(0, 21, 7):
+                tp = habit.get_time_period(start + datetime.timedelta(days=days))
+                habit.record(tp, i % 3)
+        # The first habit created
+        return self.user.habits.order_by('pk')[0]
+
+
+def test_performance_query_budget(self, num_habits):
+    self.create_habits(num_habits)
+    with helpers.assert_max_queries(4):
+        response = self.client.get(reverse('habit_performance'))
+    self.assertEqual(num_habits, len(json.loads(response.content)['habits']))
+
+def test_detail_query_budget(self, num_habits):
+    habit = self.create_habits(num_habits)
+    with helpers.assert_max_queries(3):
+        response = self.client.get(reverse('habit', args=[habit.pk]))
+    self.assertEqual(200, response.status_code)
+
+def test_edit_query_budget(self, num_habits):
+    habit = self.create_habits(num_habits)
+    with helpers.assert_max_queries(3):
+        response = self.client.get(reverse('habit_edit', args=[habit.pk]))
+    self.assertEqual(200, response.status_code)
+
+def test_record_query_budget(self, num_habits):
+    habit = self.create_habits(num_habits)
+    with helpers.assert_max_queries(5):
+        response = self.client.get(reverse('habit_record', args=[habit.pk]))
+    self.assertEqual(200, response.status_code)
+
+    data = {}
+    periods = habit.get_recent_unentered_time_periods()
+    for period in periods:
+        data['%d-date' % period.index] = period.date.isoformat()
+        data['%d-value' % period.index] = '1'
+    # Recording each period reads and writes a week and a month bucket, and
+    # updates the runs; then the providers are tried (in a random order, so
+    # allow for all of them) and the encouragement stored
+    with helpers.assert_max_queries(5 + 8 * len(periods) + 20 + 2):
+        response = self.client.post(reverse('habit_record', args=[habit.pk]), data)
+    self.assertRedirects(response, reverse('habit_encouragement', args=[habit.pk]))
+
+def test_encouragement_query_budget(self, num_habits):
+    habit = self.create_habits(num_habits)
+    store_encouragement(habit)
+    # It was chosen when the data was recorded
+    with helpers.assert_max_queries(4):
+        response = self.client.get(reverse('habit_encouragement', args=[habit.pk]))
+    self.assertEqual(200, response.status_code)
+
+for test in [test_performance_query_budget, test_detail_query_budget,
+             test_edit_query_budget, test_record_query_budget,
+             test_encouragement_query_budget]:
+    helpers.attach_fixture_tests(HabitViewQueryBudgetTest, test, [1, 50])
@@ -1,5 +1,8 @@
+from collections import defaultdict
 import json
 
+from django.db import transaction
+from django.db.models import Q
 from django.views.generic import View, DetailView, FormView, UpdateView
 from django.views.generic.detail import SingleObjectMixin
 from django.views.decorators.cache import never_cache
@@ -9,16 +12,18 @@ from django.shortcuts import render, get_object_or_404
 from django.utils.translation import ugettext as _
 from django import forms
 
-from apps.habits.models import Habit, habit_archived
+from apps.habits import caching
+from apps.habits.models import Bucket, Habit, habit_archived
 from apps.habits.forms import HabitForm
-from apps.encouragements import get_encouragement
+from apps.encouragements import store_encouragement, stored_encouragement
+from lib.dbrouter import use_replica
 from lib.metrics import statsd
 
 class HabitDetailView(DetailView):
     model = Habit
 
     def get_queryset(self):
-        return self.request.user.habits.all()
+        return Habit.for_user(self.request.user)
 
 
 class HabitEditView(UpdateView):
@@ -26,6 +31,18 @@ class HabitEditView(UpdateView):
     form_class = HabitForm
     template_name_suffix = '_edit_form'
 
+    def get_queryset(self):
+        return Habit.for_user(self.request.user)
+
+    def form_valid(self, form):
+        # Changing the resolution rebuilds the habit's buckets
+        with transaction.commit_on_success():
+            response = super(HabitEditView, self).form_valid(form)
+        # Until the rebuild was committed, other requests could still cache
+        # the old data under the versions bumped when the habit was saved
+        caching.habit_changed(self.object)
+        return response
+
     def get_success_url(self):
         return reverse('homepage')
 
@@ -34,7 +51,7 @@ class HabitArchiveView(SingleObjectMixin, View):
     model = Habit
 
     def get_queryset(self):
-        return self.request.user.habits.all()
+        return Habit.for_user(self.request.user)
 
     def get_success_url(self):
         return self.request.POST.get("next",
@@ -51,7 +68,7 @@ class HabitArchiveView(SingleObjectMixin, View):
 
 @never_cache
 def habit_record_view(request, pk):
-    habit = get_object_or_404(Habit, pk=pk, user=request.user)
+    habit = get_object_or_404(Habit.for_user(request.user), pk=pk)
 
     time_periods = habit.get_recent_unentered_time_periods()
 
@@ -78,9 +95,17 @@ def habit_record_view(request, pk):
 
     if request.method == 'POST': # If the form has been submitted...
         if all(map(lambda f: f.is_valid(), _forms)):
-            for form in _forms:
-                time_period = habit.get_time_period(form.cleaned_data['date'])
-                habit.record(time_period, form.cleaned_data['value'])
+            with transaction.commit_on_success():
+                recorded = []
+                for form in _forms:
+                    time_period = habit.get_time_period(form.cleaned_data['date'])
+                    habit.record(time_period, form.cleaned_data['value'])
+                    recorded.append(time_period.index)
+                # Choose the encouragement now, rather than each time it's
+                # shown
+                store_encouragement(habit, max(recorded))
+            # As in HabitEditView
+            caching.habit_changed(habit)
             return HttpResponseRedirect(reverse('habit_encouragement', args=[habit.id]))
 
     return render(request, 'habits/habit_record_form.html', {
@@ -93,9 +118,18 @@ class HabitEncouragementView(DetailView):
     model = Habit
     template_name = "habits/habit_encouragement.html"
 
+    def get_queryset(self):
+        return Habit.for_user(self.request.user)
+
+    # Straight after recording data the visitor is pinned to the primary,
+    # so this sees it
+    @use_replica()
+    def get(self, request, *args, **kwargs):
+        return super(HabitEncouragementView, self).get(request, *args, **kwargs)
+
     def get_context_data(self, **kwargs):
        ctx = super(HabitEncouragementView, self).get_context_data(**kwargs)
-       ctx['encouragement'] = get_encouragement(self.get_object())
+       ctx['encouragement'] = stored_encouragement(self.object)
        return ctx
 
 
@@ -103,15 +137,31 @@ RECENT_BUCKETS = 20
 
 class HabitPerformanceView(View):
 
+    @use_replica()
     def get(self, request, *args, **kwargs):
         result = {'habits': []}
 
-        for habit in request.user.habits.filter(archived=False):
-            current = habit.get_current_time_period()
+        habits = list(Habit.for_user(request.user).filter(archived=False))
+        current = dict((h.pk, h.get_current_time_period()) for h in habits)
+
+        # Fetch the recent buckets for every habit at once
+        values = defaultdict(list)
+        if habits:
+            query = reduce(lambda x, y: x | y, [
+                Q(habit=h,
+                  resolution=h.resolution,
+                  index__gt=current[h.pk].index - RECENT_BUCKETS)
+                for h in habits
+            ])
+            for habit_id, index, value in Bucket.objects.filter(query).values_list(
+                    'habit_id', 'index', 'value'):
+                values[habit_id].append((index, value))
+
+        for habit in habits:
             recent_buckets = [None] * RECENT_BUCKETS
 
-            for bucket in habit.get_buckets().filter(index__gt=current.index - RECENT_BUCKETS):
-                recent_buckets[bucket.index - current.index - 1] = bucket.value
+            for index, value in values[habit.pk]:
+                recent_buckets[index - current[habit.pk].index - 1] = value
 
             result['habits'].append({'description': habit.description,
                                      'resolution': habit.resolution,
@@ -1,10 +1,15 @@
 from django_webtest import TestCase
 from django.core.urlresolvers import reverse
+from django.db.models.signals import post_save
+from django.test.utils import override_settings
 
 import datetime
 
 from apps.accounts.models import User
+from apps.habits import caching
 from apps.habits.models import Habit
+from apps.habits.signals import habit_data_recorded
+from lib import test_helpers as helpers
 
 
 class HomepageTest(TestCase):
@@ -39,3 +44,150 @@ class HomepageTest(TestCase):
         )
         response = self.client.get(reverse('homepage'))
         self.assertContains(response, habit.description)
+
+
+class DashboardQueryBudgetTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='someone@example.com',
+                                             password='12345',
+                                             is_active=True)
+        self.client.login(email=self.user.email, password='12345')
+
+
+def test_dashboard_query_budget(self, num_habits):
+    for i in range(num_habits):
+        habit = Habit.objects.create(
+            description="Habit %d" % i,
+            start=datetime.date.today() - datetime.timedelta(days=3),
+            user=self.user,
+            resolution='day',
+        )
+        habit.record(habit.get_current_time_period(), 1)
+
+    with helpers.assert_max_queries(4):
+        response = self.client.get(reverse('homepage'))
+    self.assertContains(response, "Data entered for Habit 0")
+
+helpers.attach_fixture_tests(DashboardQueryBudgetTest, test_dashboard_query_budget, [1, 50])
+
+
+@override_settings(DASHBOARD_CACHE=True)
+class DashboardCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='someone@example.com',
+                                             password='12345',
+                                             is_active=True)
+        self.client.login(email=self.user.email, password='12345')
+        self.habit = Habit.objects.create(
+            description="Brush my teeth",
+            start=datetime.date.today() - datetime.timedelta(days=3),
+            user=self.user,
+            resolution='day',
+        )
+
+    def get_dashboard(self):
+        with helpers.assert_max_queries(50) as log:
+            response = self.client.get(reverse('homepage'))
+        tables = [q['sql'] for q in log.queries
+                  if 'habits_habit' in q['sql'] or 'habits_bucket' in q['sql']]
+        return response, tables
+
+    def test_warm_dashboard_skips_habits_and_buckets(self):
+        response, tables = self.get_dashboard()
+        self.assertNotEqual([], tables)
+        response, tables = self.get_dashboard()
+        self.assertEqual([], tables)
+        self.assertContains(response, "Enter data for Brush my teeth")
+
+    def test_recording_invalidates(self):
+        self.get_dashboard()
+        self.habit.record(self.habit.get_current_time_period(), 1)
+        response, tables = self.get_dashboard()
+        self.assertContains(response, "Data entered for Brush my teeth")
+
+    def test_editing_invalidates(self):
+        self.get_dashboard()
+        self.habit.description = "Floss"
+        self.habit.save()
+        response, tables = self.get_dashboard()
+        self.assertContains(response, "Floss")
+
+    def test_new_habit_invalidates(self):
+        self.get_dashboard()
+        Habit.objects.create(description="Floss", user=self.user,
+                             start=datetime.date.today())
+        response, tables = self.get_dashboard()
+        self.assertContains(response, "Floss")
+
+    def test_archiving_invalidates(self):
+        self.get_dashboard()
+        self.client.post(reverse('habit_archive', args=[self.habit.pk]),
+                         {'archive': '1'})
+        response, tables = self.get_dashboard()
+        self.assertContains(response, "Revive")
+
+    def test_rolls_over_at_period_boundary(self):
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        self.habit.record(self.habit.get_time_period(yesterday), 1)
+        render = lambda habits: ['rendered'] * len(habits)
+        self.assertEqual(['rendered'], caching.get_fragments('test', [self.habit], render, yesterday))
+        render = lambda habits: ['rerendered'] * len(habits)
+        self.assertEqual(['rendered'], caching.get_fragments('test', [self.habit], render, yesterday))
+        self.assertEqual(['rerendered'], caching.get_fragments('test', [self.habit], render))
+
+    def test_changing_resolution_invalidates_after_rebuilding(self):
+        self.habit.record(self.habit.get_current_time_period(), 1)
+        # A dashboard rendered after the habit is saved, but before its
+        # buckets are rebuilt at the new resolution
+        def render_early(sender, **kwargs):
+            post_save.disconnect(render_early, sender=Habit)
+            self.get_dashboard()
+        post_save.connect(render_early, sender=Habit)
+        try:
+            weekend = datetime.date.today().weekday() >= 5
+            self.habit.resolution = 'weekendday' if weekend else 'weekday'
+            self.habit.save()
+        finally:
+            post_save.disconnect(render_early, sender=Habit)
+
+        response, tables = self.get_dashboard()
+        self.assertContains(response, "Data entered for Brush my teeth")
+
+    def test_recording_invalidates_after_commit(self):
+        # Until the view's transaction commits, other requests could cache
+        # the rows from before the data was recorded
+        versions = []
+        def recorded(sender, **kwargs):
+            versions.append(caching.get_versions('habit', [self.habit.pk])[self.habit.pk])
+        habit_data_recorded.connect(recorded)
+        try:
+            data = {}
+            for period in self.habit.get_recent_unentered_time_periods():
+                data['%d-date' % period.index] = period.date.isoformat()
+                data['%d-value' % period.index] = '1'
+            self.client.post(reverse('habit_record', args=[self.habit.pk]), data)
+        finally:
+            habit_data_recorded.disconnect(recorded)
+
+        self.assertTrue(versions)
+        self.assertTrue(caching.get_versions('habit', [self.habit.pk])[self.habit.pk] >
+                        max(versions))
+
+    def test_caches_from_the_primary(self):
+        self.get_dashboard()
+        with helpers.lagging_replica_database():
+            self.habit.description = "Floss"
+            self.habit.save()
+            response, tables = self.get_dashboard()
+            self.assertContains(response, "Floss")
+            # And it's the new rows which were cached
+            response, tables = self.get_dashboard()
+            self.assertEqual([], tables)
+            self.assertContains(response, "Floss")
+
+    @override_settings(DASHBOARD_CACHE=False)
+    def test_off_without_a_shared_cache(self):
+        self.get_dashboard()
+        response, tables = self.get_dashboard()
+        self.assertNotEqual([], tables)
+        self.assertContains(response, "Enter data for Brush my teeth")
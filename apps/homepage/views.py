@@ -1,6 +1,10 @@
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.views.generic import ListView, View, TemplateView
+from apps.habits import caching
 from apps.habits.models import Habit
 from apps.onboarding.forms import HabitForm
+from lib.dbrouter import use_replica
 
 class HomepageView(View):
     def get(self, request, *args, **kwargs):
@@ -13,9 +17,27 @@ class HomepageView(View):
 class UserDashboard(ListView):
     model = Habit
     template_name = 'homepage/user_dashboard.html'
+    context_object_name = 'habit_list'
+
+    @use_replica()
+    def get(self, request, *args, **kwargs):
+        return super(UserDashboard, self).get(request, *args, **kwargs)
 
     def get_queryset(self):
-        return self.request.user.habits.all()
+        return caching.get_habit_list(self.request.user)
+
+    def get_context_data(self, **kwargs):
+        ctx = super(UserDashboard, self).get_context_data(**kwargs)
+        habits = ctx['object_list']
+        rows = caching.get_fragments('dashboard', habits, self.render_rows)
+        ctx['habit_rows'] = zip(habits, map(mark_safe, rows))
+        return ctx
+
+    def render_rows(self, habits):
+        # Only the rows which weren't cached
+        Habit.prefetch_up_to_date(habits)
+        return [render_to_string('homepage/habit_row.html', {'habit': habit})
+                for habit in habits]
 
     def is_dashboard(self):
         return True
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.contrib.formtools.wizard.storage.cookie import CookieStorage
+from django.core import signing
+from django.core.exceptions import SuspiciousOperation
+
+
+class CompressedCookieStorage(CookieStorage):
+    """
+    Wizard storage which keeps the step data in a signed, compressed cookie,
+    so that stepping through the wizard doesn't touch the session table.
+    Cookies older than WIZARD_COOKIE_MAX_AGE seconds are ignored, and the
+    wizard starts again.
+    """
+    salt = 'apps.onboarding.storage.CompressedCookieStorage'
+
+    def load_data(self):
+        cookie = self.request.COOKIES.get(self.prefix)
+        if cookie is None:
+            return None
+        try:
+            return signing.loads(cookie, salt=self.salt,
+                                 max_age=settings.WIZARD_COOKIE_MAX_AGE)
+        except signing.SignatureExpired:
+            return None
+        except signing.BadSignature:
+            raise SuspiciousOperation('WizardView cookie manipulated')
+
+    def update_response(self, response):
+        # Once the wizard's done (or reset), there's nothing to keep
+        if self.current_step is not None or self.data[self.step_data_key]:
+            response.set_cookie(
+                self.prefix,
+                signing.dumps(self.data, salt=self.salt, compress=True),
+                max_age=settings.WIZARD_COOKIE_MAX_AGE,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+            )
+        else:
+            response.delete_cookie(self.prefix)
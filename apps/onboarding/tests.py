@@ -2,6 +2,8 @@ from bs4 import BeautifulSoup
 from django_webtest import WebTest
 from django.core.urlresolvers import reverse
 from django.core import mail
+from django.contrib.sessions.models import Session
+from django.core.exceptions import SuspiciousOperation
 
 from apps.accounts.models import User
 
@@ -119,3 +121,31 @@ class OnboardingViewTest(WebTest):
 
         form = response.forms['add-habit-form']
         self.assertEqual('stop being an idiot', form.fields['habit-description'][0].value)
+
+    def test_session_only_written_once_user_created(self):
+        response = self.app.get(reverse('add_habit_step', args=['habit']))
+        form = response.forms['add-habit-form']
+        form.set('habit-description', 'Frobnicate my wibble')
+        form.set('habit-target_value', '2')
+        response = form.submit().follow()
+        response = response.forms['skip-reminder-form'].submit().follow()
+        self.assertEqual(0, Session.objects.count())
+        self.assertTrue('wizard_onboarding_wizard' in self.app.cookies)
+
+        form = response.forms['summary-form']
+        form.set('summary-email', 'foo@bar.com')
+        form.submit().follow()
+        self.assertEqual(1, Session.objects.count())
+        self.assertFalse('wizard_onboarding_wizard' in self.app.cookies)
+
+    def test_tampered_cookie(self):
+        response = self.app.get(reverse('add_habit_step', args=['habit']))
+        form = response.forms['add-habit-form']
+        form.set('habit-description', 'Frobnicate my wibble')
+        form.set('habit-target_value', '2')
+        form.submit()
+        for cookie in self.app.cookiejar:
+            if cookie.name == 'wizard_onboarding_wizard':
+                cookie.value = cookie.value.replace(':', 'x:', 1)
+        self.assertRaises(SuspiciousOperation, self.app.get,
+                          reverse('add_habit_step', args=['reminder']))
@@ -1,7 +1,7 @@
 from datetime import datetime
 from django.contrib.auth import get_user_model, login
 from django.contrib.auth.models import update_last_login
-from django.contrib.formtools.wizard.views import NamedUrlSessionWizardView
+from django.contrib.formtools.wizard.views import NamedUrlCookieWizardView
 from django.db import connection
 from django.db.utils import IntegrityError
 from django.http import HttpResponse, HttpResponseRedirect
@@ -23,12 +23,16 @@ from lib.render_to_email import render_to_email
 User = get_user_model()
 
 
-class OnboardingWizard(NamedUrlSessionWizardView):
+class OnboardingWizard(NamedUrlCookieWizardView):
     """
     Wizard to add new habits. It will also create a user if the current user
     isn't authenticated.
+
+    The steps are kept in a cookie rather than the session, so that visitors
+    who never finish don't write to the session table.
     """
     template_name = 'onboarding/wizard.html'
+    storage_name = 'apps.onboarding.storage.CompressedCookieStorage'
     send_habit_email = False
 
     def get_template_names(self):
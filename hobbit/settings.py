@@ -2,6 +2,7 @@
 from os import environ as env
 import os.path
 import sys
+import tempfile
 
 SITE_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 
@@ -52,9 +53,33 @@ try:
     database = dj_database_url.config()
     if database:
         DATABASES['default'] = database
+    # Send the read-heavy pages and scans to a replica, if there is one
+    # (see lib.dbrouter). To try it locally, point DATABASE_REPLICA_URL at
+    # the same database as DATABASE_URL.
+    if 'DATABASE_REPLICA_URL' in env:
+        DATABASES['replica'] = dj_database_url.parse(env['DATABASE_REPLICA_URL'])
+        DATABASES['replica']['TEST_MIRROR'] = 'default'
 except ImportError:
     pass
 
+DATABASE_ROUTERS = ('lib.dbrouter.ReplicaRouter',)
+# Seconds to keep reading a user's data from the primary after they write
+# any, so that they don't see the replica lagging behind.
+REPLICA_PIN_SECONDS = int(env.get('REPLICA_PIN_SECONDS', '10'))
+
+# Keep Postgres connections open between requests, in a pool in each process
+# (see lib.db.postgresql_pooled), unless DATABASE_POOL=false.
+if 'true' == env.get('DATABASE_POOL', 'true'):
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.postgresql_psycopg2':
+            database['ENGINE'] = 'lib.db.postgresql_pooled'
+            database['POOL'] = {
+                'MAX_SIZE': int(env.get('DATABASE_POOL_SIZE', '4')),
+                'MAX_AGE': int(env.get('DATABASE_POOL_MAX_AGE', '600')),
+            }
+    if DATABASES['default']['ENGINE'] == 'lib.db.postgresql_pooled':
+        SOUTH_DATABASE_ADAPTERS = {'default': 'south.db.postgresql_psycopg2'}
+
 TIME_ZONE = 'UTC'
 LANGUAGE_CODE = 'en-gb'
 SITE_ID = 1
@@ -126,13 +151,18 @@ TEMPLATE_CONTEXT_PROCESSORS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'lib.instrumentation.ViewMetricsMiddleware',
+    'lib.nplusone.NPlusOneMiddleware',
+    'djangosecure.middleware.SecurityMiddleware',
+    'lib.pagecache.AnonymousPageCacheMiddleware',
+    'lib.dbrouter.ReplicaPinMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'djangosecure.middleware.SecurityMiddleware',
+    'lib.profiling.ProfilingMiddleware',
 )
 
 ROOT_URLCONF = 'hobbit.urls'
@@ -161,6 +191,7 @@ INSTALLED_APPS = (
     'apps.habits',
     'apps.onboarding',
     'apps.homepage',
+    'lib',
 )
 
 AUTH_USER_MODEL = 'accounts.User'
@@ -168,6 +199,66 @@ LOGIN_REDIRECT_URL = 'homepage'
 LOGIN_URL = 'login'
 LOGOUT_URL = 'logout'
 
+# Use memcached if it's available. Otherwise each process has its own cache,
+# which is fine for development, but can't hold anything which another
+# process might need to invalidate.
+#
+# The pages cache holds whole pages for anonymous visitors (see
+# lib.pagecache). It's on disk so that every process on a machine shares it,
+# and so that purgepagecache can empty it.
+PAGE_CACHE_DIR = env.get('PAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'hobbit-pages'))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': PAGE_CACHE_DIR,
+    },
+}
+if 'MEMCACHE_SERVERS' in env:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': env['MEMCACHE_SERVERS'].split(','),
+    }
+
+# Whether to cache habit lists and dashboard rows (see apps.habits.caching).
+# They're invalidated by bumping version counters in the default cache, so
+# this needs a cache shared by every process: with a per-process cache, a
+# change made through one worker would leave the others showing stale rows.
+DASHBOARD_CACHE = 'MEMCACHE_SERVERS' in env
+
+# Pages (by URL pattern name) which are the same for every anonymous
+# visitor, and how long to cache them, in seconds.
+PAGE_CACHE_URLS = ('homepage', 'about', 'hobbit', 'styletile')
+PAGE_CACHE_TIMEOUT = int(env.get('PAGE_CACHE_TIMEOUT', '600'))
+
+# How long, in seconds, to cache each user's habit list and dashboard rows.
+# They're invalidated when they change, so this can be long.
+DASHBOARD_CACHE_TIMEOUT = int(env.get('DASHBOARD_CACHE_TIMEOUT', str(60 * 60 * 24 * 7)))
+
+# How long, in seconds, the add habit wizard remembers its steps for.
+WIZARD_COOKIE_MAX_AGE = int(env.get('WIZARD_COOKIE_MAX_AGE', str(60 * 60 * 24)))
+
+# The first and last years covered by the precomputed calendar tables (see
+# apps.habits.calendar_index). Dates outside them still work, just slower.
+CALENDAR_INDEX_YEARS = (
+    int(env.get('CALENDAR_INDEX_FIRST_YEAR', '2010')),
+    int(env.get('CALENDAR_INDEX_LAST_YEAR', '2040')),
+)
+
+# Reminders missed by a late or skipped sendreminders run are still sent if
+# they fell due no more than this many hours ago.
+REMINDER_GRACE_HOURS = int(env.get('REMINDER_GRACE_HOURS', '3'))
+
+# The run_scheduler worker spreads reminders due at the same time over this
+# many minutes, and sends data collection emails at this hour (UTC).
+REMINDER_SPREAD_MINUTES = int(env.get('REMINDER_SPREAD_MINUTES', '60'))
+DATA_COLLECTION_HOUR = int(env.get('DATA_COLLECTION_HOUR', '8'))
+# Each poll for changed habits looks this many seconds further back than the
+# last one, to catch changes committed late, or stamped by a skewed clock.
+REMINDER_POLL_OVERLAP_SECONDS = int(env.get('REMINDER_POLL_OVERLAP_SECONDS', '300'))
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error when DEBUG=False.
@@ -186,7 +277,11 @@ LOGGING = {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
-        }
+        },
+        'console': {
+            'level': 'WARNING',
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django.request': {
@@ -194,6 +289,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'lib.nplusone': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
     }
 }
 
@@ -203,6 +302,36 @@ LOGGING = {
 # STATSD_PORT = 8125
 # STATSD_PREFIX = ''
 
+# Metrics are buffered in each process and sent once this many have been
+# recorded, or this many seconds after the last send.
+
+# STATSD_MAX_BUFFERED = 100
+# STATSD_FLUSH_INTERVAL = 10
+
+# ViewMetricsMiddleware measures this fraction of requests (all of them
+# when developing), and adds an X-View-Metrics header to them if
+# VIEW_METRICS_HEADER is on.
+VIEW_METRICS_SAMPLE_RATE = float(env.get('VIEW_METRICS_SAMPLE_RATE',
+                                         '1' if DEBUG else '0.1'))
+VIEW_METRICS_HEADER = DEBUG
+
+# ProfilingMiddleware writes profiles of requests to PROFILE_DIR: those with
+# ?profile from staff users, those with an X-Profile header no older than
+# PROFILE_TOKEN_MAX_AGE seconds, and a PROFILE_SAMPLE_RATE fraction of the
+# rest. See the profiledumps command.
+PROFILE_DIR = env.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'hobbit-profiles'))
+PROFILE_SAMPLE_RATE = float(env.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_TOKEN_MAX_AGE = int(env.get('PROFILE_TOKEN_MAX_AGE', '3600'))
+PROFILE_TOP_N = int(env.get('PROFILE_TOP_N', '40'))
+
+# With N_PLUS_ONE_DETECTION on, any query run more than N_PLUS_ONE_THRESHOLD
+# times in one request is logged, and totted up in N_PLUS_ONE_REPORT_FILE. For
+# development and staging only. The batch commands do the same when run with
+# --n-plus-one.
+N_PLUS_ONE_DETECTION = 'true' == env.get('N_PLUS_ONE_DETECTION', 'false')
+N_PLUS_ONE_THRESHOLD = int(env.get('N_PLUS_ONE_THRESHOLD', '5'))
+N_PLUS_ONE_REPORT_FILE = env.get('N_PLUS_ONE_REPORT_FILE', os.path.join(tempfile.gettempdir(), 'hobbit-nplusone.json'))
+
 if 'true' == env.get('FULLY_SECURE'):
     SECURE_SSL_REDIRECT = True
     SECURE_HSTS_SECONDS = 31536000 # 1 year
@@ -20,6 +20,7 @@ urlpatterns = patterns('',
     url(r'^logout/$', apps.accounts.views.LogoutView.as_view(), name='logout'),
     url(r'^password-change/$', apps.accounts.views.password_change, name='password_change'),
     url(r'^password-change/done/$', 'django.contrib.auth.views.password_change_done', name='password_change_done'),
+    secured_url(r'^accounts/settings/timezone$', apps.accounts.views.TimezoneView.as_view(), name='account_timezone'),
     secured_url(r'^accounts/settings', apps.accounts.views.SettingsView.as_view(), name='account_settings'),
 
     url(r'^admin/doc/', include('django.contrib.admindocs.urls')),
@@ -0,0 +1,150 @@
+"""
+Online backfills: data migrations run a chunk at a time against a live
+database, rather than in one transaction which locks the table until done.
+
+A backfill subclasses ``Backfill``, saying which ``model`` it walks and how
+to ``process`` a chunk of it, and is registered in an app's ``backfills``
+module::
+
+    @backfills.register
+    class BuildRuns(Backfill):
+        name = 'runs'
+        model = Habit
+
+        def process(self, habits):
+            ...
+            return number_of_rows_changed
+
+The runbackfill command then runs it in ranges of primary keys, committing
+each chunk on its own and sleeping in between so that the database spends
+no more than a given fraction of its time on the backfill. Progress is
+checkpointed in ``BackfillCheckpoint``, so that an interrupted backfill
+carries on where it stopped when run again.
+
+The rows to backfill are those which existed when it started: rows created
+since should have been written correctly by the application already.
+"""
+from collections import namedtuple
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.importlib import import_module
+from django.utils.module_loading import module_has_submodule
+
+from lib.models import BackfillCheckpoint
+
+# Progress after each chunk: the last primary key done, of ``max_pk``, and
+# the rows processed and seconds taken (including sleeping) so far this run
+Progress = namedtuple('Progress', 'last_pk max_pk rows seconds')
+
+
+class Backfill(object):
+    """
+    A data migration over the rows of ``model``, in chunks of ``chunk_size``
+    consecutive primary keys.
+    """
+    name = None
+    model = None
+    chunk_size = 1000
+
+    def queryset(self):
+        """
+        Return the rows to backfill. Override this to skip rows which don't
+        need it.
+        """
+        return self.model._default_manager.all()
+
+    def process(self, queryset):
+        """
+        Backfill the rows in ``queryset`` (a chunk of ``queryset()``), and
+        return how many there were.
+        """
+        raise NotImplementedError
+
+    def checkpoint(self):
+        checkpoint, _ = BackfillCheckpoint.objects.get_or_create(name=self.name)
+        return checkpoint
+
+    def run(self, chunk_size=None, load=1.0, restart=False):
+        """
+        Run the backfill from its checkpoint (or from the start, if
+        ``restart``), yielding ``Progress`` after each chunk. Between chunks
+        it sleeps long enough to keep the time spent working to ``load``
+        (between 0 and 1) of the total.
+        """
+        if not 0 < load <= 1:
+            raise ValueError("load must be more than 0, and at most 1")
+        chunk_size = chunk_size or self.chunk_size
+
+        checkpoint = self.checkpoint()
+        if restart or checkpoint.max_pk is None:
+            checkpoint.last_pk = 0
+            checkpoint.max_pk = self.queryset().aggregate(Max('pk'))['pk__max'] or 0
+            checkpoint.rows = 0
+            checkpoint.started = timezone.now()
+            checkpoint.finished = None
+            if checkpoint.last_pk >= checkpoint.max_pk:
+                # There are no rows, so it's done already
+                checkpoint.finished = checkpoint.started
+            checkpoint.save()
+
+        rows = 0
+        started = time.time()
+        while checkpoint.last_pk < checkpoint.max_pk:
+            chunk_started = time.time()
+            lo = checkpoint.last_pk
+            hi = min(lo + chunk_size, checkpoint.max_pk)
+            with transaction.commit_on_success():
+                chunk = self.queryset().filter(pk__gt=lo, pk__lte=hi).order_by('pk')
+                done = self.process(chunk)
+                checkpoint.last_pk = hi
+                checkpoint.rows += done
+                if hi == checkpoint.max_pk:
+                    checkpoint.finished = timezone.now()
+                checkpoint.save()
+            rows += done
+
+            working = time.time() - chunk_started
+            if load < 1 and hi < checkpoint.max_pk:
+                time.sleep(working * (1 - load) / load)
+            yield Progress(hi, checkpoint.max_pk, rows, time.time() - started)
+
+
+class BackfillRegistry(object):
+    """
+    The registered backfills, by name.
+    """
+
+    def __init__(self):
+        self._backfills = {}
+
+    def register(self, cls):
+        if not cls.name:
+            raise ValueError("Backfills must have a name")
+        if cls.name in self._backfills:
+            raise ValueError("A backfill named %r is already registered" % cls.name)
+        self._backfills[cls.name] = cls
+        return cls
+
+    def names(self):
+        return sorted(self._backfills)
+
+    def get(self, name):
+        return self._backfills[name]()
+
+
+backfills = BackfillRegistry()
+
+
+def autodiscover():
+    """
+    Import each installed app's ``backfills`` module, as
+    ``admin.autodiscover`` does for ``admin`` modules.
+    """
+    for app in settings.INSTALLED_APPS:
+        module = import_module(app)
+        if module_has_submodule(module, 'backfills'):
+            import_module('%s.backfills' % app)
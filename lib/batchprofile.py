@@ -0,0 +1,168 @@
+"""
+Runtime and memory profiling for batch management commands. Commands which
+subclass ``ProfiledCommand`` take a ``--profile`` option which times each
+phase of the run (see ``BatchProfile``), and reports the totals, per-item
+averages and peak memory to statsd and as a summary line on stderr, and a
+``--n-plus-one`` option which reports repeated queries (see
+``lib.nplusone``).
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from optparse import make_option
+import resource
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from lib.metrics import statsd
+from lib.nplusone import RepeatedQueries
+
+try:
+    import tracemalloc
+except ImportError:
+    # Only in Python 3.4+ (or a patched 2.7)
+    tracemalloc = None
+
+
+class BatchProfile(object):
+    """
+    Times the phases of a batch job, and counts the items it handles::
+
+        profile = BatchProfile()
+        for habit in profile.iterate(habits):
+            with profile.phase('render'):
+                ...
+
+    ``iterate`` times fetching each item as the ``query`` phase. Phases
+    which are entered more than once accumulate.
+    """
+
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.items = 0
+        self.started = self.finished = None
+
+    def start(self):
+        if tracemalloc is not None:
+            tracemalloc.start()
+        self.started = time.time()
+
+    def stop(self):
+        self.finished = time.time()
+        self.peak_rss_kb = peak_rss_kb()
+        self.peak_traced_kb = None
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            self.peak_traced_kb = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.time() - started
+
+    def iterate(self, iterable, phase='query'):
+        iterator = iter(iterable)
+        while True:
+            with self.phase(phase):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            self.items += 1
+            yield item
+
+    def metrics(self):
+        """
+        Return a dict of the results: times in ms, and memory in KB.
+        """
+        metrics = {
+            'items': self.items,
+            'time': int((self.finished - self.started) * 1000),
+            'peak_rss_kb': self.peak_rss_kb,
+        }
+        if self.peak_traced_kb is not None:
+            metrics['peak_traced_kb'] = self.peak_traced_kb
+        for name, seconds in self.phases.items():
+            metrics['%s_time' % name] = int(seconds * 1000)
+            if self.items:
+                metrics['%s_per_item' % name] = round(seconds * 1000 / self.items, 3)
+        return metrics
+
+
+class _NoProfile(BatchProfile):
+    # Keeps the same interface, so commands needn't check whether they're
+    # being profiled
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    def iterate(self, iterable, phase='query'):
+        return iter(iterable)
+
+
+def peak_rss_kb():
+    """
+    Return the peak resident set size of this process so far, in KB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # In bytes on OS X, KB elsewhere
+        peak //= 1024
+    return peak
+
+
+class ProfiledCommand(BaseCommand):
+    """
+    A management command with ``--profile`` and ``--n-plus-one`` options.
+    Its ``handle`` should time its work with ``self.profile``, which is a
+    ``BatchProfile``. When profiling, each result is sent to statsd as the
+    gauge ``command.<name>.<metric>``.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--profile', action='store_true', default=False,
+                    help='Report time spent in each phase, and peak memory, '
+                         'to statsd and stderr.'),
+        make_option('--n-plus-one', action='store_true', default=False,
+                    help='Report queries repeated more than '
+                         'N_PLUS_ONE_THRESHOLD times.'),
+    )
+
+    @property
+    def command_name(self):
+        return self.__module__.rsplit('.', 1)[-1]
+
+    def execute(self, *args, **options):
+        if not options.get('n_plus_one'):
+            return self._execute(*args, **options)
+        # The command's queries are kept until it finishes, so this is only
+        # asked for, never on by default
+        with RepeatedQueries(self.command_name,
+                             report_file=settings.N_PLUS_ONE_REPORT_FILE):
+            return self._execute(*args, **options)
+
+    def _execute(self, *args, **options):
+        if not options.get('profile'):
+            self.profile = _NoProfile()
+            return super(ProfiledCommand, self).execute(*args, **options)
+
+        self.profile = BatchProfile()
+        self.profile.start()
+        try:
+            return super(ProfiledCommand, self).execute(*args, **options)
+        finally:
+            self.profile.stop()
+            self.report_profile()
+
+    def report_profile(self):
+        metrics = self.profile.metrics()
+        for name, value in metrics.items():
+            statsd.gauge('command.%s.%s' % (self.command_name, name), value)
+        statsd.flush()
+        self.stderr.write('%s: %s' % (self.command_name, ' '.join(
+            '%s=%s' % item for item in sorted(metrics.items()))))
@@ -0,0 +1,168 @@
+"""
+A small, thread-safe pool of database connections, for keeping connections
+open between requests. It knows nothing about any particular database: it's
+given functions to connect, to check that a connection still works, and to
+reset one when it's returned. See ``lib.db.postgresql_pooled`` for the
+Django backend which uses it.
+"""
+import logging
+import threading
+import time
+
+from lib.metrics import statsd
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _Pooled(object):
+    __slots__ = ('connection', 'created', 'last_used')
+
+    def __init__(self, connection, now):
+        self.connection = connection
+        self.created = self.last_used = now
+
+
+class ConnectionPool(object):
+    """
+    Holds up to ``max_size`` connections, made by calling ``connect()`` (or
+    the function passed to ``checkout``).
+
+    ``checkout()`` returns an idle connection, or a new one if there are
+    fewer than ``max_size``; otherwise it waits up to ``timeout`` seconds
+    for one to be checked back in, then raises ``PoolTimeout``. Idle
+    connections are checked with ``check(connection)`` (which should raise
+    if it's broken) before being handed out, if they haven't been used for
+    ``check_interval`` seconds.
+
+    ``checkin(connection)`` calls ``reset(connection)`` (to roll back
+    anything left open, say) and keeps the connection for next time, unless
+    that fails or the connection is older than ``max_age`` seconds, in
+    which case it's closed.
+
+    Checkouts, new connections and waits are counted in statsd under
+    ``name``.
+    """
+
+    def __init__(self, connect=None, check=None, reset=None, max_size=4,
+                 max_age=600, check_interval=30, timeout=10, name='db.pool',
+                 clock=time.time):
+        self.connect = connect
+        self.check = check
+        self.reset = reset
+        self.max_size = max_size
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.name = name
+        self.clock = clock
+
+        self._idle = []
+        self._in_use = {}
+        self._lock = threading.Condition()
+
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use)
+
+    def checkout(self, connect=None):
+        statsd.incr('%s.checkout' % self.name)
+        with self._lock:
+            started = None
+            while True:
+                pooled = self._take_idle()
+                if pooled is not None:
+                    break
+                if self.size < self.max_size:
+                    pooled = self._new(connect or self.connect)
+                    break
+
+                if started is None:
+                    started = self.clock()
+                    statsd.incr('%s.wait' % self.name)
+                remaining = self.timeout - (self.clock() - started)
+                if remaining <= 0:
+                    raise PoolTimeout("No connection free after %ss" % self.timeout)
+                self._lock.wait(remaining)
+
+            if started is not None:
+                statsd.timing('%s.wait_time' % self.name,
+                              int((self.clock() - started) * 1000))
+            self._in_use[id(pooled.connection)] = pooled
+            return pooled.connection
+
+    def checkin(self, connection):
+        with self._lock:
+            pooled = self._in_use.pop(id(connection), None)
+            if pooled is None:
+                # Not one of ours (the pool's been cleared since, say)
+                self._close(connection)
+                return
+
+            now = self.clock()
+            if now - pooled.created >= self.max_age:
+                self._close(connection)
+            elif self._reset(connection):
+                pooled.last_used = now
+                self._idle.append(pooled)
+            self._lock.notify()
+
+    def clear(self):
+        """
+        Close all the idle connections, and forget about those checked out
+        (which will be closed when they're checked in).
+        """
+        with self._lock:
+            for pooled in self._idle:
+                self._close(pooled.connection)
+            self._idle = []
+            self._in_use = {}
+            self._lock.notify_all()
+
+    def _take_idle(self):
+        now = self.clock()
+        while self._idle:
+            # Most recently used first, so that the rest can age out
+            pooled = self._idle.pop()
+            if now - pooled.created >= self.max_age:
+                self._close(pooled.connection)
+                continue
+            if now - pooled.last_used >= self.check_interval and not self._check(pooled.connection):
+                statsd.incr('%s.broken' % self.name)
+                self._close(pooled.connection)
+                continue
+            return pooled
+        return None
+
+    def _new(self, connect):
+        statsd.incr('%s.connect' % self.name)
+        return _Pooled(connect(), self.clock())
+
+    def _check(self, connection):
+        if self.check is None:
+            return True
+        try:
+            self.check(connection)
+            return True
+        except Exception:
+            return False
+
+    def _reset(self, connection):
+        if self.reset is None:
+            return True
+        try:
+            self.reset(connection)
+            return True
+        except Exception:
+            logger.warning("Couldn't reset pooled connection", exc_info=True)
+            self._close(connection)
+            return False
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
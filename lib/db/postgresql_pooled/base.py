@@ -0,0 +1,125 @@
+"""
+The postgresql_psycopg2 backend, with connections kept open in a pool (one
+per process) between requests instead of being closed at the end of each.
+Configure the pool with a POOL dict in the database's settings::
+
+    'POOL': {
+        'MAX_SIZE': 4,          # connections per process
+        'MAX_AGE': 600,         # seconds before a connection is replaced
+        'CHECK_INTERVAL': 30,   # idle seconds before checking a connection
+        'TIMEOUT': 10,          # seconds to wait for a free connection
+    }
+"""
+import os
+import threading
+
+from django.db.backends.postgresql_psycopg2 import base
+from django.db.backends.postgresql_psycopg2.creation import DatabaseCreation as BaseDatabaseCreation
+
+from lib.db.pool import ConnectionPool
+
+# Pools, by process and connection parameters
+_pools = {}
+_pools_lock = threading.Lock()
+
+_PARAMS = ('NAME', 'USER', 'HOST', 'PORT')
+
+
+def _pool_key(settings_dict):
+    # A forked process mustn't share its parent's connections
+    return (os.getpid(),) + tuple(settings_dict[p] for p in _PARAMS)
+
+
+def get_pool(wrapper):
+    key = _pool_key(wrapper.settings_dict)
+    with _pools_lock:
+        if key not in _pools:
+            options = wrapper.settings_dict.get('POOL', {})
+            _pools[key] = ConnectionPool(
+                check=_check,
+                reset=_reset,
+                max_size=options.get('MAX_SIZE', 4),
+                max_age=options.get('MAX_AGE', 600),
+                check_interval=options.get('CHECK_INTERVAL', 30),
+                timeout=options.get('TIMEOUT', 10),
+                name='db.pool.%s' % wrapper.alias,
+            )
+        return _pools[key]
+
+
+def close_pools(name):
+    """
+    Close every idle pooled connection to the database ``name``.
+    """
+    with _pools_lock:
+        for key, pool in _pools.items():
+            if key[1] == name:
+                pool.clear()
+                del _pools[key]
+
+
+def _check(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    finally:
+        cursor.close()
+    # Leave the connection as it was
+    connection.rollback()
+
+
+def _reset(connection):
+    if connection.closed:
+        raise base.Database.InterfaceError("connection already closed")
+    # Don't hand a transaction, or an aborted one, to the next request
+    connection.rollback()
+
+
+class DatabaseCreation(BaseDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Postgres won't drop a database with connections open to it
+        close_pools(test_database_name)
+        super(DatabaseCreation, self)._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        self.creation = DatabaseCreation(self)
+
+    def _cursor(self):
+        if self.connection is None:
+            self.connection = get_pool(self).checkout(self._connect)
+            # It may have been left in autocommit mode by the last user
+            self.connection.set_isolation_level(self.isolation_level)
+        return super(DatabaseWrapper, self)._cursor()
+
+    def _connect(self):
+        # Let the standard backend make and set up a new connection
+        super(DatabaseWrapper, self)._cursor()
+        connection, self.connection = self.connection, None
+        return connection
+
+    def close(self):
+        """
+        Return the connection to the pool, rather than closing it.
+        """
+        self.validate_thread_sharing()
+        if self.connection is None:
+            return
+        try:
+            # Abandon anything uncommitted, as closing the connection would,
+            # so that the next request doesn't start inside this one's
+            # transaction
+            self._rollback()
+        except base.Database.Error:
+            # The pool will discard it when it can't be reset
+            pass
+        # Nor with this one's transaction state
+        if self._dirty:
+            self.set_clean()
+        self.clean_savepoints()
+        connection, self.connection = self.connection, None
+        get_pool(self).checkin(connection)
@@ -0,0 +1,124 @@
+"""
+Routing of reads to a read replica.
+
+Everything goes to the ``default`` database (the primary) unless it's run
+inside ``use_replica``, which sends reads to the ``replica`` database, if
+one is configured::
+
+    @use_replica
+    def get(self, request, *args, **kwargs):
+        ...
+
+    with use_replica():
+        habits = list(Habit.objects.filter(...))
+
+Writes always go to the primary. So that people see their own changes
+straight away, despite replication lag, reads go to the primary for the
+rest of any request which writes, and ``ReplicaPinMiddleware`` pins the
+visitor to the primary for REPLICA_PIN_SECONDS afterwards.
+
+Reads whose results outlive the request, such as those filling a cache,
+should be made inside ``use_primary``, which overrides ``use_replica``:
+otherwise a lagging replica's stale rows could be cached as current.
+"""
+from functools import wraps
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE_NAME = 'primary_until'
+
+_state = threading.local()
+
+
+def _get(name, default):
+    return getattr(_state, name, default)
+
+
+class use_replica(object):
+    """
+    A context manager, or decorator, inside which reads go to the replica.
+    """
+
+    def __enter__(self):
+        _state.replica = _get('replica', 0) + 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _state.replica -= 1
+
+    def __call__(self, func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return inner
+
+
+class use_primary(object):
+    """
+    A context manager inside which reads go to the primary, even inside
+    ``use_replica``.
+    """
+
+    def __enter__(self):
+        _state.primary = _get('primary', 0) + 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _state.primary -= 1
+
+
+def pinned():
+    """
+    Whether reads should stay on the primary, whatever ``use_replica`` says.
+    """
+    return (_get('pinned', False) or _get('primary', 0) or
+            (_get('in_request', False) and _get('wrote', False)))
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if (_get('replica', 0) and not pinned() and
+                REPLICA_DB_ALIAS in connections.databases):
+            return REPLICA_DB_ALIAS
+        # Rather than where the instance in any hint came from
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # They're the same database
+        return True
+
+    def allow_syncdb(self, db, model):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinMiddleware(object):
+    """
+    Keeps a visitor's reads on the primary for REPLICA_PIN_SECONDS after
+    any request which writes, with a cookie saying until when.
+    """
+
+    def process_request(self, request):
+        try:
+            until = float(request.COOKIES.get(PIN_COOKIE_NAME, 0))
+        except ValueError:
+            until = 0
+        _state.in_request = True
+        _state.pinned = until > time.time()
+        _state.wrote = False
+
+    def process_response(self, request, response):
+        if _get('in_request', False) and _get('wrote', False):
+            response.set_cookie(PIN_COOKIE_NAME,
+                                '%.3f' % (time.time() + settings.REPLICA_PIN_SECONDS),
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True)
+        _state.in_request = _state.pinned = _state.wrote = False
+        return response
@@ -0,0 +1,57 @@
+import random
+import time
+
+from django.conf import settings
+
+from lib.metrics import statsd
+from lib.querylog import QueryLog
+
+
+class ViewMetricsMiddleware(object):
+    """
+    Times each request and counts the SQL it runs, and sends the numbers to
+    statsd under the name of the URL pattern it resolved to:
+
+        view.<url_name>.time      wall time, in ms
+        view.<url_name>.sql_time  time spent in SQL, in ms
+        view.<url_name>.queries   number of queries
+
+    All three are timers, so that statsd works out their distributions. Only
+    a VIEW_METRICS_SAMPLE_RATE fraction of requests is measured, and the
+    timers are sent with that sample rate, so that statsd scales the counts
+    of requests back up. With VIEW_METRICS_HEADER on, measured responses also
+    carry an X-View-Metrics header with the same numbers.
+
+    Put this first in MIDDLEWARE_CLASSES so that it measures the other
+    middleware too.
+    """
+
+    def process_request(self, request):
+        sample_rate = getattr(settings, 'VIEW_METRICS_SAMPLE_RATE', 1)
+        if random.random() >= sample_rate:
+            return
+        log = QueryLog()
+        log.__enter__()
+        request._view_metrics = (time.time(), log, sample_rate)
+
+    def process_response(self, request, response):
+        metrics = getattr(request, '_view_metrics', None)
+        if metrics is None:
+            return response
+        del request._view_metrics
+
+        started, log, sample_rate = metrics
+        log.__exit__(None, None, None)
+        elapsed = int((time.time() - started) * 1000)
+        sql_time = int(log.time * 1000)
+
+        match = getattr(request, 'resolver_match', None)
+        name = match.url_name if match and match.url_name else 'unknown'
+        statsd.timing('view.%s.time' % name, elapsed, sample_rate)
+        statsd.timing('view.%s.sql_time' % name, sql_time, sample_rate)
+        statsd.timing('view.%s.queries' % name, log.count, sample_rate)
+
+        if getattr(settings, 'VIEW_METRICS_HEADER', False):
+            response['X-View-Metrics'] = 'view=%s time=%dms queries=%d sql=%dms' % (
+                name, elapsed, log.count, sql_time)
+        return response
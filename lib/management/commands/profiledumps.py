@@ -0,0 +1,68 @@
+import datetime
+from optparse import make_option
+import os
+import pstats
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.profiling import make_profile_token
+
+
+class Command(BaseCommand):
+    args = 'list | merge <output> [<dump> ...] | token'
+    option_list = BaseCommand.option_list + (
+        make_option('--sort', default='cumulative',
+                    help='pstats sort key for the merged summary.'),
+        make_option('--limit', type='int', default=None,
+                    help='Number of functions in the merged summary.'),
+    )
+
+    def handle(self, *args, **options):
+        """
+        Work with the profiles written by ProfilingMiddleware.
+
+        list: show the dumps in PROFILE_DIR, newest first.
+        merge: combine the named dumps (all of them, if none are named) into
+        one pstats file, and print a summary of it.
+        token: print a value for the X-Profile header.
+        """
+        action = args[0] if args else 'list'
+        if action == 'list':
+            self.list_dumps()
+        elif action == 'merge':
+            if len(args) < 2:
+                raise CommandError("merge needs an output filename")
+            self.merge(args[1], args[2:], options)
+        elif action == 'token':
+            self.stdout.write(make_profile_token())
+        else:
+            raise CommandError("Unknown action %r" % action)
+
+    def dumps(self):
+        if not os.path.isdir(settings.PROFILE_DIR):
+            return []
+        paths = [os.path.join(settings.PROFILE_DIR, f)
+                 for f in os.listdir(settings.PROFILE_DIR)
+                 if f.endswith('.prof')]
+        return sorted(paths, key=os.path.getmtime, reverse=True)
+
+    def list_dumps(self):
+        for path in self.dumps():
+            modified = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+            self.stdout.write('%s  %8d  %s' % (
+                modified.strftime('%Y-%m-%d %H:%M:%S'),
+                os.path.getsize(path),
+                os.path.basename(path),
+            ))
+
+    def merge(self, output, names, options):
+        paths = [os.path.join(settings.PROFILE_DIR, n) for n in names]
+        paths = paths or self.dumps()
+        if not paths:
+            raise CommandError("No dumps to merge")
+
+        stats = pstats.Stats(*paths, stream=self.stdout)
+        stats.dump_stats(output)
+        stats.sort_stats(options['sort'])
+        stats.print_stats(options['limit'] or settings.PROFILE_TOP_N)
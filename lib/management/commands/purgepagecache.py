@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import NoReverseMatch, reverse
+
+from lib.pagecache import cache_key, page_cache
+
+
+class Command(BaseCommand):
+    args = '[<url name or path> ...]'
+
+    def handle(self, *args, **options):
+        """
+        Remove pages from the anonymous page cache: those given (by URL
+        pattern name, or by path), or all of them if none are. Run this
+        after deploying changes to the cached pages.
+        """
+        cache = page_cache()
+        if not args:
+            cache.clear()
+            self.stdout.write('Purged all pages')
+            return
+
+        for name in args:
+            if name.startswith('/'):
+                path = name
+            else:
+                try:
+                    path = reverse(name)
+                except NoReverseMatch:
+                    raise CommandError("No URL named %r" % name)
+            cache.delete(cache_key(path))
+            self.stdout.write('Purged %s' % path)
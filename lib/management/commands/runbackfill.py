@@ -0,0 +1,77 @@
+from optparse import make_option
+
+from django.core.management.base import CommandError
+
+from lib.backfill import autodiscover, backfills
+from lib.batchprofile import ProfiledCommand
+
+class Command(ProfiledCommand):
+    args = '<backfill>'
+    option_list = ProfiledCommand.option_list + (
+        make_option('--chunk-size', type='int', default=None,
+                    help='Number of primary keys to process at a time '
+                         '(defaults to the backfill\'s own).'),
+        make_option('--load', type='float', default=0.5,
+                    help='Fraction of the time to spend working, rather '
+                         'than sleeping between chunks.'),
+        make_option('--restart', action='store_true', default=False,
+                    help='Start again from the beginning, rather than from '
+                         'the last checkpoint.'),
+        make_option('--list', action='store_true', default=False,
+                    help='List the backfills and how far each has got.'),
+    )
+
+    def handle(self, *args, **options):
+        """
+        Run a backfill (a data migration registered in an app's backfills
+        module) against the live database, a chunk at a time, committing
+        each and sleeping in between to keep to the given --load. It picks
+        up from where it last stopped, and reports its progress in rows per
+        second.
+        """
+        autodiscover()
+        if options['list']:
+            for name in backfills.names():
+                checkpoint = backfills.get(name).checkpoint()
+                self.stdout.write('%s: %s' % (name, self.describe(checkpoint)))
+            return
+
+        if len(args) != 1:
+            raise CommandError("Give the name of one backfill: %s" %
+                               ', '.join(backfills.names()))
+        try:
+            backfill = backfills.get(args[0])
+        except KeyError:
+            raise CommandError("Unknown backfill: %s" % args[0])
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        if not 0 < options['load'] <= 1:
+            raise CommandError("--load must be more than 0, and at most 1")
+
+        progress = None
+        chunks = backfill.run(options['chunk_size'], options['load'],
+                              options['restart'])
+        for progress in self.profile.iterate(chunks, phase='chunk'):
+            if int(options['verbosity']) > 1:
+                self.stdout.write(self.describe_progress(progress))
+
+        if int(options['verbosity']) > 0:
+            if progress is None:
+                self.stdout.write('%s: %s' % (backfill.name,
+                                              self.describe(backfill.checkpoint())))
+            else:
+                self.stdout.write(self.describe_progress(progress))
+
+    def describe(self, checkpoint):
+        if checkpoint.max_pk is None:
+            return 'not started'
+        if checkpoint.finished:
+            return 'finished %s, %d rows' % (checkpoint.finished, checkpoint.rows)
+        return 'at pk %d of %d, %d rows' % (checkpoint.last_pk, checkpoint.max_pk,
+                                            checkpoint.rows)
+
+    def describe_progress(self, progress):
+        rate = progress.rows / progress.seconds if progress.seconds else 0
+        return 'pk %d of %d: %d rows in %.1fs (%.0f rows/s)' % (
+            progress.last_pk, progress.max_pk, progress.rows,
+            progress.seconds, rate)
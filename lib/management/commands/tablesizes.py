@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+# The size of each table and of its indexes, in bytes
+POSTGRES_SQL = """
+    SELECT c.relname, pg_relation_size(c.oid), pg_indexes_size(c.oid)
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind = 'r' AND n.nspname = current_schema()
+"""
+# Needs SQLite built with SQLITE_ENABLE_DBSTAT_VTAB
+SQLITE_SQL = """
+    SELECT m.tbl_name,
+           SUM(CASE WHEN m.type = 'table' THEN d.pgsize ELSE 0 END),
+           SUM(CASE WHEN m.type = 'index' THEN d.pgsize ELSE 0 END)
+    FROM dbstat d
+    JOIN sqlite_master m ON m.name = d.name
+    GROUP BY m.tbl_name
+"""
+
+class Command(BaseCommand):
+    args = '[<table> ...]'
+
+    def handle(self, *tables, **options):
+        """
+        Print the size on disk of each table (or of those given) and of its
+        indexes, largest first, to compare before and after schema changes.
+        """
+        if connection.vendor == 'postgresql':
+            sql = POSTGRES_SQL
+        elif connection.vendor == 'sqlite':
+            sql = SQLITE_SQL
+        else:
+            raise CommandError("Table sizes aren't supported on %s" % connection.vendor)
+
+        cursor = connection.cursor()
+        cursor.execute(sql)
+        sizes = [row for row in cursor.fetchall() if not tables or row[0] in tables]
+        sizes.sort(key=lambda (name, table, indexes): (-(table + indexes), name))
+
+        self.stdout.write('%-40s %12s %12s' % ('table', 'table KB', 'indexes KB'))
+        for name, table, indexes in sizes:
+            self.stdout.write('%-40s %12d %12d' % (name, table // 1024, indexes // 1024))
@@ -1,7 +1,181 @@
+from collections import defaultdict
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+import weakref
+
 from django.conf import settings
 
-from statsd import StatsdClient
+logger = logging.getLogger(__name__)
+
+# The shortest the flushing thread waits when there's nothing to flush, so
+# that a very short flush_interval doesn't keep it spinning
+MIN_IDLE_WAIT = 0.1
+
+
+class BufferedStatsdClient(object):
+    """
+    A statsd client which aggregates metrics in memory and sends them in as
+    few UDP packets as possible.
+
+    Counters are summed and gauges keep their latest value; every timing is
+    kept. The buffer is flushed once ``max_buffered`` metrics have been
+    recorded since the last flush, once ``flush_interval`` seconds have
+    passed, and when the process exits. So recording a metric on the request
+    path costs a dict update, and the occasional flush. The interval is also
+    kept by a background thread, so that an idle process doesn't hold on to
+    what it has buffered; it's started by the first metric recorded in each
+    process, as threads don't survive forking.
+
+    The buffer is locked, as it's shared by the request threads and the
+    flushing thread. ``stop`` flushes and stops the thread; clients still
+    running when the process exits are stopped then.
+    """
+
+    def __init__(self, host=None, port=None, prefix=None, max_packet_size=512,
+                 max_buffered=100, flush_interval=10):
+        self._address = (host or 'localhost', port or 8125)
+        self._prefix = prefix + '.' if prefix else ''
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.max_packet_size = max_packet_size
+        self.max_buffered = max_buffered
+        self.flush_interval = flush_interval
+        self._flusher_pid = None
+        self._flusher = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._reset()
+        _clients.add(self)
+
+    def incr(self, bucket, delta=1, sample_rate=None):
+        """
+        Increment a counter by ``delta``. If it's only incremented for a
+        ``sample_rate`` fraction of events, statsd scales the count up.
+        """
+        with self._lock:
+            self._counters[bucket, sample_rate or 1] += delta
+        self._recorded()
+
+    def decr(self, bucket, delta=1, sample_rate=None):
+        with self._lock:
+            self._counters[bucket, sample_rate or 1] -= delta
+        self._recorded()
+
+    def gauge(self, bucket, value, sample_rate=None):
+        with self._lock:
+            self._gauges[bucket] = value
+        self._recorded()
+
+    def timing(self, bucket, ms, sample_rate=None):
+        """
+        Record a timing, or any other value whose distribution is wanted.
+        If only a ``sample_rate`` fraction of events is timed, statsd scales
+        the count and rate of them up.
+        """
+        with self._lock:
+            self._timers[bucket, sample_rate or 1].append(ms)
+        self._recorded()
+
+    def flush(self):
+        """
+        Send everything buffered so far.
+        """
+        with self._lock:
+            counters, timers, gauges = self._counters, self._timers, self._gauges
+            self._reset()
+
+        lines = []
+        for (bucket, rate), value in counters.iteritems():
+            lines.append('%s%s:%s|c%s' % (self._prefix, bucket, value, _rate(rate)))
+        for (bucket, rate), values in timers.iteritems():
+            lines.extend('%s%s:%s|ms%s' % (self._prefix, bucket, value, _rate(rate))
+                         for value in values)
+        for bucket, value in gauges.iteritems():
+            lines.append('%s%s:%s|g' % (self._prefix, bucket, value))
+
+        for packet in self._packets(lines):
+            try:
+                self._socket.sendto(packet, self._address)
+            except Exception:
+                logger.error("Failed to send statsd packet.", exc_info=True)
+
+    def _packets(self, lines):
+        packet = ''
+        for line in lines:
+            line = line.encode('utf8')
+            if packet and len(packet) + 1 + len(line) > self.max_packet_size:
+                yield packet
+                packet = ''
+            packet = packet + '\n' + line if packet else line
+        if packet:
+            yield packet
+
+    def _flush_periodically(self):
+        try:
+            while not self._stopping.is_set():
+                wait = self._last_flush + self.flush_interval - time.time()
+                if wait > 0:
+                    self._stopping.wait(wait)
+                elif self._buffered:
+                    self.flush()
+                else:
+                    self._stopping.wait(max(self.flush_interval, MIN_IDLE_WAIT))
+        except Exception:
+            # Modules are torn down under daemon threads at exit
+            if not self._stopping.is_set():
+                raise
+
+    def stop(self):
+        """
+        Flush, and stop the flushing thread. Metrics recorded afterwards are
+        only flushed by recording more of them, or by calling ``flush``.
+        """
+        self._stopping.set()
+        if self._flusher is not None and self._flusher_pid == os.getpid():
+            self._flusher.join()
+        self.flush()
+
+    def _recorded(self):
+        with self._lock:
+            if self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                self._flusher = threading.Thread(target=self._flush_periodically,
+                                                 name='statsd-flusher')
+                self._flusher.daemon = True
+                self._flusher.start()
+            self._buffered += 1
+            due = (self._buffered >= self.max_buffered or
+                   time.time() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def _reset(self):
+        self._counters = defaultdict(int)
+        self._timers = defaultdict(list)
+        self._gauges = {}
+        self._buffered = 0
+        self._last_flush = time.time()
+
+
+def _rate(sample_rate):
+    return '|@%s' % sample_rate if sample_rate < 1 else ''
+
+
+# Every client, so that they can all be flushed at exit
+_clients = weakref.WeakSet()
+
+
+@atexit.register
+def _stop_clients():
+    for client in list(_clients):
+        client.stop()
+
 
-statsd = StatsdClient(host=getattr(settings, 'STATSD_HOST', None),
-                      port=getattr(settings, 'STATSD_PORT', None),
-                      prefix=getattr(settings, 'STATSD_PREFIX', None))
+statsd = BufferedStatsdClient(host=getattr(settings, 'STATSD_HOST', None),
+                              port=getattr(settings, 'STATSD_PORT', None),
+                              prefix=getattr(settings, 'STATSD_PREFIX', None),
+                              max_buffered=getattr(settings, 'STATSD_MAX_BUFFERED', 100),
+                              flush_interval=getattr(settings, 'STATSD_FLUSH_INTERVAL', 10))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'BackfillCheckpoint'
+        db.create_table(u'lib_backfillcheckpoint', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('name', self.gf('django.db.models.fields.CharField')(unique=True, max_length=100)),
+            ('last_pk', self.gf('django.db.models.fields.BigIntegerField')(default=0)),
+            ('max_pk', self.gf('django.db.models.fields.BigIntegerField')(null=True)),
+            ('rows', self.gf('django.db.models.fields.BigIntegerField')(default=0)),
+            ('started', self.gf('django.db.models.fields.DateTimeField')(null=True)),
+            ('finished', self.gf('django.db.models.fields.DateTimeField')(null=True)),
+            ('modified', self.gf('django.db.models.fields.DateTimeField')(auto_now=True, blank=True)),
+        ))
+        db.send_create_signal(u'lib', ['BackfillCheckpoint'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'BackfillCheckpoint'
+        db.delete_table(u'lib_backfillcheckpoint')
+
+
+    models = {
+        u'lib.backfillcheckpoint': {
+            'Meta': {'object_name': 'BackfillCheckpoint'},
+            'finished': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_pk': ('django.db.models.fields.BigIntegerField', [], {'default': '0'}),
+            'max_pk': ('django.db.models.fields.BigIntegerField', [], {'null': 'True'}),
+            'modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '100'}),
+            'rows': ('django.db.models.fields.BigIntegerField', [], {'default': '0'}),
+            'started': ('django.db.models.fields.DateTimeField', [], {'null': 'True'})
+        }
+    }
+
+    complete_apps = ['lib']
\ No newline at end of file
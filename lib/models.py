@@ -0,0 +1,19 @@
+from django.db import models
+
+
+class BackfillCheckpoint(models.Model):
+    """
+    How far a backfill (see ``lib.backfill``) has got.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    # Rows with primary keys up to last_pk are done, of those up to max_pk
+    # when it started (None if it hasn't)
+    last_pk = models.BigIntegerField(default=0)
+    max_pk = models.BigIntegerField(null=True)
+    rows = models.BigIntegerField(default=0)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return self.name
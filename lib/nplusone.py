@@ -0,0 +1,165 @@
+"""
+Development-time detection of N+1 queries: the same query, with different
+parameters, run over and over in one request or management command, as
+when a template calls a method which queries the database for each habit in
+a list.
+
+Turn it on for requests with N_PLUS_ONE_DETECTION, and for the batch
+commands (see ``lib.batchprofile``) with their --n-plus-one option. Any
+query run more than N_PLUS_ONE_THRESHOLD times in one request or command is
+logged (as a warning, on the ``lib.nplusone`` logger) with the stack of its
+first occurrence, and added to the running totals in N_PLUS_ONE_REPORT_FILE.
+"""
+import json
+import logging
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from lib.querylog import QueryLog
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    Return ``sql`` with its literals and parameters replaced by ``?``, and
+    lists of them by ``(...)``, so that queries which differ only in their
+    parameters have the same fingerprint.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _project_frames(stack):
+    # Only our own code's frames are interesting; Django's, the standard
+    # library's and the query logging's just get in the way
+    root = settings.SITE_ROOT + os.sep
+    return [frame for frame in stack
+            if os.path.realpath(frame[0]).startswith(root)
+            and not frame[0].endswith(('querylog.py', 'nplusone.py'))]
+
+
+class RepeatedQueries(object):
+    """
+    A context manager which records the queries run inside it, and reports
+    each query (by fingerprint) run more than ``threshold`` times::
+
+        with RepeatedQueries('sendreminders') as repeated:
+            call_command('sendreminders')
+        for fp, count, first in repeated.offenders:
+            ...
+
+    ``label`` names the unit of work in the report, and may be changed
+    before the block exits.
+    """
+
+    def __init__(self, label, threshold=None, report_file=None):
+        self.label = label
+        if threshold is None:
+            threshold = settings.N_PLUS_ONE_THRESHOLD
+        self.threshold = threshold
+        self.report_file = report_file
+        self.offenders = []
+        self._log = QueryLog(capture_stacks=True)
+
+    def __enter__(self):
+        self._log.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._log.__exit__(exc_type, exc_value, traceback)
+        self.offenders = self.find_offenders(self._log.queries)
+        if self.offenders:
+            logger.warning(self.report())
+            if self.report_file:
+                self.update_report_file()
+
+    def find_offenders(self, queries):
+        """
+        Return a ``(fingerprint, count, first query)`` tuple for each
+        fingerprint in ``queries`` which occurs more than ``threshold``
+        times, most frequent first.
+        """
+        counts = {}
+        first = {}
+        for query in queries:
+            fp = fingerprint(query['raw_sql'])
+            counts[fp] = counts.get(fp, 0) + 1
+            first.setdefault(fp, query)
+
+        offenders = [(fp, count, first[fp]) for fp, count in counts.items()
+                     if count > self.threshold]
+        return sorted(offenders, key=lambda o: -o[1])
+
+    def report(self):
+        lines = ['%d repeated queries in %s:' % (len(self.offenders), self.label)]
+        for fp, count, query in self.offenders:
+            lines.append('%d x %s' % (count, fp))
+            lines.append('  First run from:')
+            for filename, lineno, function, text in _project_frames(query['stack']):
+                lines.append('    %s:%d in %s' % (filename, lineno, function))
+                if text:
+                    lines.append('      %s' % text)
+        return '\n'.join(lines)
+
+    def update_report_file(self):
+        """
+        Add the offenders to the running totals in ``report_file``: for each
+        fingerprint, how many units of work ran it too often, how many times
+        in all, the most in one unit, and the first unit it was seen in.
+        """
+        try:
+            with open(self.report_file) as f:
+                totals = json.load(f)
+        except (IOError, ValueError):
+            totals = {}
+
+        for fp, count, query in self.offenders:
+            entry = totals.setdefault(fp, {'units': 0, 'queries': 0,
+                                           'worst': 0, 'first_seen': self.label})
+            entry['units'] += 1
+            entry['queries'] += count
+            entry['worst'] = max(entry['worst'], count)
+
+        with open(self.report_file, 'w') as f:
+            json.dump(totals, f, indent=2, sort_keys=True)
+
+
+class NPlusOneMiddleware(object):
+    """
+    Detects repeated queries in each request, if N_PLUS_ONE_DETECTION is on.
+    Requests are labelled with the name of the URL pattern they matched.
+    """
+
+    def __init__(self):
+        if not settings.N_PLUS_ONE_DETECTION:
+            raise MiddlewareNotUsed()
+
+    def process_request(self, request):
+        request._repeated_queries = RepeatedQueries(
+            request.path,
+            report_file=settings.N_PLUS_ONE_REPORT_FILE,
+        ).__enter__()
+
+    def process_response(self, request, response):
+        detector = getattr(request, '_repeated_queries', None)
+        if detector is None:
+            return response
+        del request._repeated_queries
+
+        match = getattr(request, 'resolver_match', None)
+        if match and match.url_name:
+            detector.label = match.url_name
+        detector.__exit__(None, None, None)
+        return response
@@ -0,0 +1,111 @@
+"""
+A cache of whole pages for anonymous visitors.
+
+Pages named in PAGE_CACHE_URLS (by URL pattern name) are cached for
+PAGE_CACHE_TIMEOUT seconds in the ``pages`` cache, and served from there
+to any GET without a session, before the rest of the stack runs. Each
+page's CSRF token is swapped for a placeholder when it's cached, and for
+the visitor's own token (from their cookie, or a new one) when it's
+served, so that forms on cached pages still work.
+
+Hits and misses are counted in statsd as ``pagecache.hit`` and
+``pagecache.miss``. See the purgepagecache command.
+"""
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.urlresolvers import Resolver404, resolve
+from django.http import HttpResponse
+from django.middleware.csrf import _get_new_csrf_key, _sanitize_token, get_token
+from django.utils.cache import patch_vary_headers
+
+from lib.metrics import statsd
+
+CSRF_PLACEHOLDER = 'PAGE-CACHE-CSRF-TOKEN'
+
+
+def page_cache():
+    return get_cache('pages')
+
+
+def cache_key(path):
+    return 'page:%s' % path
+
+
+def _cacheable_request(request):
+    if request.method != 'GET':
+        return False
+    if any(not name.startswith('utm_') for name in request.GET):
+        # Campaign tracking parameters don't change the page; anything
+        # else might
+        return False
+    if 'HTTP_X_PROFILE' in request.META:
+        return False
+    # Logged in visitors, and those with messages waiting, get the page
+    # from Django
+    return not (settings.SESSION_COOKIE_NAME in request.COOKIES or
+                'messages' in request.COOKIES)
+
+
+def _cacheable_response(response):
+    return (response.status_code == 200 and
+            not getattr(response, 'streaming', False) and
+            set(response.cookies) <= set([settings.CSRF_COOKIE_NAME]))
+
+
+class AnonymousPageCacheMiddleware(object):
+    """
+    Serves the pages named in PAGE_CACHE_URLS to anonymous visitors from
+    the cache. Put this early in MIDDLEWARE_CLASSES: after SecurityMiddleware,
+    so that hits are still redirected to HTTPS, but before CsrfViewMiddleware,
+    which sets the CSRF cookie on cached pages too.
+    """
+
+    def process_request(self, request):
+        if not _cacheable_request(request):
+            return
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return
+        if match.url_name not in settings.PAGE_CACHE_URLS:
+            return
+        # For anything measuring views by name
+        request.resolver_match = match
+
+        request._page_cache_key = cache_key(request.path)
+        cached = page_cache().get(request._page_cache_key)
+        if cached is None:
+            statsd.incr('pagecache.miss')
+            return
+
+        statsd.incr('pagecache.hit')
+        content, content_type = cached
+        if CSRF_PLACEHOLDER in content:
+            # As CsrfViewMiddleware would; it then sets the cookie
+            try:
+                token = _sanitize_token(request.COOKIES[settings.CSRF_COOKIE_NAME])
+            except KeyError:
+                token = _get_new_csrf_key()
+            request.META['CSRF_COOKIE'] = token
+            # Tokens are alphanumeric, so safe to use in the encoded content
+            content = content.replace(CSRF_PLACEHOLDER, str(get_token(request)))
+
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Page-Cache'] = 'hit'
+        patch_vary_headers(response, ('Cookie',))
+        request._page_cache_key = None
+        return response
+
+    def process_response(self, request, response):
+        key = getattr(request, '_page_cache_key', None)
+        if key is None or not _cacheable_response(response):
+            return response
+
+        content = response.content
+        token = request.META.get('CSRF_COOKIE')
+        if token:
+            content = content.replace(str(token), CSRF_PLACEHOLDER)
+        page_cache().set(key, (content, response['Content-Type']),
+                         settings.PAGE_CACHE_TIMEOUT)
+        response['X-Page-Cache'] = 'miss'
+        return response
@@ -0,0 +1,88 @@
+import cProfile
+import datetime
+import os
+import pstats
+import random
+
+from django.conf import settings
+from django.core import signing
+
+SIGNING_SALT = 'lib.profiling'
+
+
+def make_profile_token():
+    """
+    Return a value for the X-Profile header which turns profiling on for a
+    request, until it expires after PROFILE_TOKEN_MAX_AGE seconds.
+    """
+    return signing.dumps('profile', salt=SIGNING_SALT)
+
+
+def _valid_token(token):
+    try:
+        signing.loads(token, salt=SIGNING_SALT,
+                      max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def should_profile(request):
+    user = getattr(request, 'user', None)
+    if 'profile' in request.GET and user is not None and user.is_staff:
+        return True
+    token = request.META.get('HTTP_X_PROFILE')
+    if token and _valid_token(token):
+        return True
+    return random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+def write_dump(profiler, name):
+    """
+    Save ``profiler``'s stats to PROFILE_DIR as ``<name>.prof``, with the top
+    PROFILE_TOP_N functions by cumulative time in ``<name>.txt``. Returns
+    the path of the .prof file.
+    """
+    if not os.path.isdir(settings.PROFILE_DIR):
+        os.makedirs(settings.PROFILE_DIR)
+    path = os.path.join(settings.PROFILE_DIR, name)
+    profiler.dump_stats(path + '.prof')
+    with open(path + '.txt', 'w') as summary:
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats('cumulative').print_stats(settings.PROFILE_TOP_N)
+    return path + '.prof'
+
+
+class ProfilingMiddleware(object):
+    """
+    Runs a request's view (and, for a TemplateResponse, its rendering) under
+    cProfile, and writes the results to PROFILE_DIR (see ``write_dump``).
+
+    A request is profiled if a staff user adds ``?profile`` to the URL, if
+    it has an X-Profile header made by ``make_profile_token``, or at random
+    for a PROFILE_SAMPLE_RATE fraction of requests.
+
+    This returns the view's response itself, so it must come last in
+    MIDDLEWARE_CLASSES.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not should_profile(request):
+            return None
+
+        def run_view():
+            response = view_func(request, *view_args, **view_kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+            return response
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match and match.url_name else 'unknown'
+        name = '%s-%s-%d' % (datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+                              url_name, os.getpid())
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(run_view)
+        finally:
+            write_dump(profiler, name)
@@ -0,0 +1,116 @@
+from time import time
+import traceback
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.util import CursorWrapper
+
+
+class QueryLog(object):
+    """
+    Records the SQL run on every database connection while it's active,
+    whether or not DEBUG is on::
+
+        with QueryLog() as log:
+            do_something()
+        print log.count, log.time
+
+    Each query is a dict with ``sql`` and ``time`` (in seconds, as a string)
+    keys, as in ``connection.queries``, which is left alone, and ``raw_sql``,
+    the SQL before its parameters were filled in. With ``capture_stacks``,
+    each also has a ``stack`` (as from ``traceback.extract_stack``). QueryLogs
+    can be nested.
+    """
+
+    def __init__(self, capture_stacks=False):
+        self.queries = []
+        self.capture_stacks = capture_stacks
+        self._state = {}
+
+    def __enter__(self):
+        for connection in self._connections():
+            self._state[connection.alias] = (
+                connection.use_debug_cursor,
+                connection.__dict__.get('make_debug_cursor'),
+            )
+            connection.make_debug_cursor = self._cursor_factory(connection)
+            connection.use_debug_cursor = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for connection in self._connections():
+            use_debug_cursor, make_debug_cursor = self._state.pop(connection.alias)
+            connection.use_debug_cursor = use_debug_cursor
+            if make_debug_cursor is None:
+                del connection.make_debug_cursor
+            else:
+                connection.make_debug_cursor = make_debug_cursor
+
+    def _connections(self):
+        # One alias can be another's connection under a second name (as a
+        # test mirror, say)
+        seen = set()
+        for connection in connections.all():
+            if id(connection) not in seen:
+                seen.add(id(connection))
+                yield connection
+
+    def _cursor_factory(self, connection):
+        # Debug cursors are made by the connection's make_debug_cursor method
+        # (or an enclosing QueryLog's replacement for it) if DEBUG or an
+        # enclosing QueryLog asked for them; keep doing that, so that they
+        # still get their queries.
+        debug = connection.use_debug_cursor or (
+            connection.use_debug_cursor is None and settings.DEBUG)
+        make_debug_cursor = connection.make_debug_cursor
+
+        def factory(cursor):
+            if debug:
+                cursor = make_debug_cursor(cursor)
+            return _LoggingCursor(cursor, connection, self)
+        return factory
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def time(self):
+        return sum(float(q['time']) for q in self.queries)
+
+
+class _LoggingCursor(CursorWrapper):
+
+    def __init__(self, cursor, db, log):
+        super(_LoggingCursor, self).__init__(cursor, db)
+        self.log = log
+
+    def execute(self, sql, params=()):
+        start = time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self._record(sql, time() - start,
+                         self.db.ops.last_executed_query(self.cursor, sql, params))
+
+    def executemany(self, sql, param_list):
+        start = time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            try:
+                times = len(param_list)
+            except TypeError:
+                times = '?'
+            self._record(sql, time() - start, '%s times: %s' % (times, sql))
+
+    def _record(self, raw_sql, duration, sql):
+        query = {
+            'sql': sql,
+            'raw_sql': raw_sql,
+            'time': '%.3f' % duration,
+        }
+        if self.log.capture_stacks:
+            # Leave out this method and execute()
+            query['stack'] = traceback.extract_stack()[:-2]
+        self.log.queries.append(query)
@@ -1,4 +1,13 @@
+from contextlib import contextmanager
 import datetime
+import functools
+
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import get_models
+
+from lib.dbrouter import REPLICA_DB_ALIAS
+from lib.querylog import QueryLog
 
 def attach_fixture_tests(test_cls, test_func, fixtures):
     """
@@ -26,3 +35,92 @@ def attach_fixture_tests(test_cls, test_func, fixtures):
 
 def parse_isodate(iso_string):
     return datetime.datetime.strptime(iso_string, '%Y-%m-%d').date()
+
+class assert_max_queries(QueryLog):
+    """
+    A context manager which fails the test if more than ``max_queries`` SQL
+    queries are run inside it, listing the queries::
+
+        with assert_max_queries(3):
+            self.client.get(reverse('homepage'))
+
+    To catch per-row queries, check the same budget with one row and with
+    many.
+    """
+
+    def __init__(self, max_queries):
+        super(assert_max_queries, self).__init__()
+        self.max_queries = max_queries
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super(assert_max_queries, self).__exit__(exc_type, exc_value, traceback)
+        if exc_type is None and self.count > self.max_queries:
+            raise AssertionError('%d queries run, budget is %d:\n%s' % (
+                self.count,
+                self.max_queries,
+                '\n'.join('  %d. %s' % (i + 1, q['sql'])
+                           for i, q in enumerate(self.queries)),
+            ))
+
+def query_budget(max_queries):
+    """
+    Decorator version of ``assert_max_queries``, for a whole test method.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with assert_max_queries(max_queries):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def replica_database():
+    """
+    A context manager inside which there's a ``replica`` database, which is
+    the default database under another name (so that it sees the test's
+    data, inside the test's transaction).
+    """
+    connections.databases[REPLICA_DB_ALIAS] = dict(
+        connections.databases[DEFAULT_DB_ALIAS], TEST_MIRROR=DEFAULT_DB_ALIAS)
+    connections[REPLICA_DB_ALIAS] = connections[DEFAULT_DB_ALIAS]
+    try:
+        yield
+    finally:
+        del connections.databases[REPLICA_DB_ALIAS]
+        delattr(connections._connections, REPLICA_DB_ALIAS)
+
+@contextmanager
+def lagging_replica_database():
+    """
+    A context manager inside which there's a ``replica`` database holding a
+    copy of the default database as it was on entering, so that it doesn't
+    see anything written since, like a replica lagging behind. Only works
+    with SQLite.
+    """
+    default = connections[DEFAULT_DB_ALIAS]
+    connections.databases[REPLICA_DB_ALIAS] = dict(
+        connections.databases[DEFAULT_DB_ALIAS], NAME=':memory:')
+    replica = connections[REPLICA_DB_ALIAS]
+    try:
+        source, copy = default.cursor(), replica.cursor()
+        known = set()
+        for model in get_models(include_auto_created=True):
+            if not model._meta.managed or model._meta.proxy:
+                continue
+            sql, _ = replica.creation.sql_create_model(model, no_style(), known)
+            known.add(model)
+            for statement in sql:
+                copy.execute(statement)
+            table = default.ops.quote_name(model._meta.db_table)
+            source.execute('SELECT * FROM %s' % table)
+            columns = [default.ops.quote_name(c[0]) for c in source.description]
+            rows = source.fetchall()
+            if rows:
+                copy.executemany('INSERT INTO %s (%s) VALUES (%s)' % (
+                    table, ', '.join(columns), ', '.join(['%s'] * len(columns))), rows)
+        yield
+    finally:
+        replica.close()
+        del connections.databases[REPLICA_DB_ALIAS]
+        delattr(connections._connections, REPLICA_DB_ALIAS)
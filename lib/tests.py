@@ -0,0 +1,716 @@
+from StringIO import StringIO
+from collections import defaultdict
+import datetime
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from apps.accounts.models import User
+from apps.habits.models import Habit, Run
+from lib import test_helpers as helpers
+from lib.backfill import Backfill
+from lib.batchprofile import ProfiledCommand
+from lib.db.pool import ConnectionPool, PoolTimeout
+from lib.dbrouter import PIN_COOKIE_NAME, ReplicaPinMiddleware, use_primary, use_replica
+from lib.metrics import BufferedStatsdClient, statsd
+from lib.models import BackfillCheckpoint
+from lib import nplusone
+from lib.nplusone import fingerprint, NPlusOneMiddleware, RepeatedQueries
+from lib.pagecache import CSRF_PLACEHOLDER, page_cache
+from lib.profiling import make_profile_token
+from lib.querylog import QueryLog
+
+
+class BufferedStatsdClientTest(SimpleTestCase):
+    def setUp(self):
+        self.sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sink.bind(('127.0.0.1', 0))
+        self.client = BufferedStatsdClient(host='127.0.0.1',
+                                           port=self.sink.getsockname()[1],
+                                           prefix='test',
+                                           max_buffered=1000,
+                                           flush_interval=3600)
+
+    def tearDown(self):
+        self.client.stop()
+        self.sink.close()
+
+    def received(self):
+        packets = []
+        self.sink.settimeout(0.1)
+        try:
+            while True:
+                packets.append(self.sink.recv(4096))
+        except socket.timeout:
+            return packets
+
+    def test_nothing_sent_until_flushed(self):
+        self.client.incr('foo')
+        self.assertEqual([], self.received())
+
+    def test_aggregates_counters(self):
+        self.client.incr('foo')
+        self.client.incr('foo', 2)
+        self.client.decr('bar')
+        self.client.flush()
+        packets = self.received()
+        self.assertEqual(1, len(packets))
+        self.assertEqual(set(['test.foo:3|c', 'test.bar:-1|c']),
+                         set(packets[0].split('\n')))
+
+    def test_keeps_every_timing_and_last_gauge(self):
+        self.client.timing('t', 10)
+        self.client.timing('t', 20)
+        self.client.gauge('g', 1)
+        self.client.gauge('g', 5)
+        self.client.flush()
+        lines = self.received()[0].split('\n')
+        self.assertEqual(['test.t:10|ms', 'test.t:20|ms', 'test.g:5|g'], lines)
+
+    def test_sample_rates(self):
+        self.client.incr('c', sample_rate=0.5)
+        self.client.incr('c')
+        self.client.timing('t', 10, sample_rate=0.1)
+        self.client.timing('t', 20, 1)
+        self.client.flush()
+        self.assertEqual(set(['test.c:1|c|@0.5', 'test.c:1|c',
+                              'test.t:10|ms|@0.1', 'test.t:20|ms']),
+                         set(self.received()[0].split('\n')))
+
+    def test_flush_empties_buffer(self):
+        self.client.incr('foo')
+        self.client.flush()
+        self.client.flush()
+        self.assertEqual(['test.foo:1|c'], self.received())
+
+    def test_flushes_after_max_buffered(self):
+        self.client.max_buffered = 3
+        self.client.incr('a')
+        self.client.incr('b')
+        self.assertEqual([], self.received())
+        self.client.incr('c')
+        self.assertEqual(1, len(self.received()))
+
+    def test_flushes_after_interval(self):
+        self.client.flush_interval = 0
+        self.client.incr('a')
+        self.assertEqual(['test.a:1|c'], self.received())
+
+    def test_flushes_when_idle(self):
+        self.client.flush_interval = 0.05
+        self.client.incr('a')
+        time.sleep(0.2)
+        self.assertEqual(['test.a:1|c'], self.received())
+
+    def test_flushes_from_many_threads(self):
+        self.client.max_buffered = 10
+        def record():
+            for i in range(500):
+                self.client.incr('a')
+        threads = [threading.Thread(target=record) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.client.flush()
+        lines = sum((p.split('\n') for p in self.received()), [])
+        self.assertEqual(2000, sum(int(line[len('test.a:'):-len('|c')]) for line in lines))
+
+    def test_stop(self):
+        self.client.incr('a')
+        self.client.stop()
+        self.assertEqual(['test.a:1|c'], self.received())
+        self.assertFalse(self.client._flusher.is_alive())
+
+    def test_splits_packets_at_max_size(self):
+        self.client.max_packet_size = 64
+        for i in range(20):
+            self.client.incr('counter%02d' % i)
+        self.client.flush()
+        packets = self.received()
+        self.assertTrue(len(packets) > 1)
+        for packet in packets:
+            self.assertTrue(len(packet) <= 64)
+        lines = sum((p.split('\n') for p in packets), [])
+        self.assertEqual(20, len(lines))
+
+
+class QueryLogTest(TestCase):
+    def test_records_queries(self):
+        with QueryLog() as log:
+            User.objects.count()
+            User.objects.count()
+        self.assertEqual(2, log.count)
+        self.assertTrue('COUNT' in log.queries[0]['sql'])
+        self.assertTrue(log.time >= 0)
+
+    @override_settings(DEBUG=False)
+    def test_cleans_up_connection(self):
+        use_debug_cursor = connection.use_debug_cursor
+        with QueryLog():
+            User.objects.count()
+        self.assertEqual(use_debug_cursor, connection.use_debug_cursor)
+        self.assertEqual([], connection.queries)
+
+    def test_survives_reset_queries(self):
+        with QueryLog() as log:
+            User.objects.count()
+            reset_queries()
+            User.objects.count()
+        self.assertEqual(2, log.count)
+
+    @override_settings(DEBUG=False)
+    def test_nested(self):
+        with QueryLog() as outer:
+            User.objects.count()
+            with QueryLog() as inner:
+                User.objects.count()
+        self.assertEqual(1, inner.count)
+        self.assertEqual(2, outer.count)
+
+    def test_capture_stacks(self):
+        with QueryLog(capture_stacks=True) as log:
+            User.objects.filter(pk=1).exists()
+        self.assertTrue('%s' in log.queries[0]['raw_sql'])
+        functions = [frame[2] for frame in log.queries[0]['stack']]
+        self.assertTrue('test_capture_stacks' in functions)
+
+
+class RepeatedQueriesTest(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(email='n%d@example.com' % i)
+                      for i in range(4)]
+        fd, self.report_file = tempfile.mkstemp()
+        os.close(fd)
+        os.unlink(self.report_file)
+        nplusone.logger.disabled = True
+
+    def tearDown(self):
+        nplusone.logger.disabled = False
+        if os.path.exists(self.report_file):
+            os.unlink(self.report_file)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            'SELECT "a" FROM "t" WHERE "b" = ? AND "c" IN (...) AND "d" = ?',
+            fingerprint('SELECT "a"  FROM "t"\nWHERE "b" = 12 AND "c" IN (1, 2, 3) '
+                        'AND "d" = \'it\'\'s\''),
+        )
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+                         fingerprint('SELECT * FROM t WHERE id IN (%s)'))
+
+    def test_flags_repeated_queries(self):
+        with RepeatedQueries('test', threshold=3) as repeated:
+            for user in self.users:
+                User.objects.get(pk=user.pk)
+            User.objects.count()
+        self.assertEqual(1, len(repeated.offenders))
+        fp, count, first = repeated.offenders[0]
+        self.assertEqual(4, count)
+        self.assertTrue('"accounts_user"."id" = ?' in fp)
+        report = repeated.report()
+        self.assertTrue('lib/tests.py' in report)
+        self.assertTrue('test_flags_repeated_queries' in report)
+        self.assertFalse('django' in report)
+
+    def test_under_threshold(self):
+        with RepeatedQueries('test', threshold=4) as repeated:
+            for user in self.users:
+                User.objects.get(pk=user.pk)
+        self.assertEqual([], repeated.offenders)
+
+    def test_report_file(self):
+        for i in range(2):
+            with RepeatedQueries('unit %d' % i, threshold=3,
+                                 report_file=self.report_file):
+                for user in self.users[:3 + i]:
+                    User.objects.get(pk=user.pk)
+        with open(self.report_file) as f:
+            totals = json.load(f)
+        self.assertEqual(1, len(totals))
+        self.assertEqual({'units': 1, 'queries': 4, 'worst': 4,
+                          'first_seen': 'unit 1'}, totals.values()[0])
+
+    @override_settings(N_PLUS_ONE_DETECTION=False)
+    def test_off_by_default(self):
+        self.assertRaises(MiddlewareNotUsed, NPlusOneMiddleware)
+
+    @override_settings(N_PLUS_ONE_DETECTION=True, N_PLUS_ONE_THRESHOLD=3)
+    def test_middleware(self):
+        with self.settings(N_PLUS_ONE_REPORT_FILE=self.report_file):
+            middleware = NPlusOneMiddleware()
+            request = RequestFactory().get('/somewhere/')
+            middleware.process_request(request)
+            for user in self.users:
+                User.objects.get(pk=user.pk)
+            middleware.process_response(request, None)
+        with open(self.report_file) as f:
+            totals = json.load(f)
+        self.assertEqual('/somewhere/', totals.values()[0]['first_seen'])
+
+    @override_settings(N_PLUS_ONE_THRESHOLD=3)
+    def test_command_option(self):
+        users = self.users
+        class Command(ProfiledCommand):
+            def handle(self, *args, **options):
+                for user in users:
+                    User.objects.get(pk=user.pk)
+
+        with self.settings(N_PLUS_ONE_REPORT_FILE=self.report_file):
+            Command().execute(stdout=StringIO(), stderr=StringIO())
+            self.assertFalse(os.path.exists(self.report_file))
+            Command().execute(n_plus_one=True, stdout=StringIO(), stderr=StringIO())
+        with open(self.report_file) as f:
+            totals = json.load(f)
+        self.assertEqual('tests', totals.values()[0]['first_seen'])
+
+
+class ViewMetricsMiddlewareTest(TestCase):
+    @override_settings(VIEW_METRICS_HEADER=True, VIEW_METRICS_SAMPLE_RATE=1)
+    def test_header(self):
+        response = self.client.get(reverse('about'))
+        self.assertTrue(response['X-View-Metrics'].startswith('view=about '))
+        self.assertTrue(' queries=0 ' in response['X-View-Metrics'])
+
+    @override_settings(VIEW_METRICS_SAMPLE_RATE=0.999)
+    def test_sends_sample_rate(self):
+        timings = []
+        old_timing = statsd.timing
+        statsd.timing = lambda *args: timings.append(args)
+        try:
+            while not timings:
+                self.client.get(reverse('about'))
+        finally:
+            statsd.timing = old_timing
+        self.assertEqual(['view.about.time', 'view.about.sql_time', 'view.about.queries'],
+                         [name for name, value, rate in timings])
+        self.assertEqual([0.999] * 3, [rate for name, value, rate in timings])
+
+    @override_settings(VIEW_METRICS_HEADER=True, VIEW_METRICS_SAMPLE_RATE=0)
+    def test_sampling(self):
+        response = self.client.get(reverse('about'))
+        self.assertFalse(response.has_header('X-View-Metrics'))
+
+
+# Cached pages aren't profiled
+@override_settings(PAGE_CACHE_URLS=())
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.settings = override_settings(PROFILE_DIR=self.profile_dir)
+        self.settings.enable()
+        self.user = User.objects.create_user(email='staff@example.com',
+                                             password='12345',
+                                             is_active=True)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.profile_dir)
+
+    def dumps(self):
+        return sorted(os.listdir(self.profile_dir))
+
+    def test_not_profiled_by_default(self):
+        self.client.get(reverse('about'))
+        self.assertEqual([], self.dumps())
+
+    def test_profile_flag_needs_staff(self):
+        self.client.login(email='staff@example.com', password='12345')
+        self.client.get(reverse('about') + '?profile')
+        self.assertEqual([], self.dumps())
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('about') + '?profile')
+        self.assertEqual(200, response.status_code)
+        dumps = self.dumps()
+        self.assertEqual(2, len(dumps))
+        self.assertTrue(dumps[0].endswith('-about-%d.prof' % os.getpid()))
+        self.assertTrue(dumps[1].endswith('.txt'))
+
+    def test_signed_header(self):
+        self.client.get(reverse('about'), HTTP_X_PROFILE='forged')
+        self.assertEqual([], self.dumps())
+        self.client.get(reverse('about'), HTTP_X_PROFILE=make_profile_token())
+        self.assertEqual(2, len(self.dumps()))
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sampling(self):
+        self.client.get(reverse('about'))
+        self.assertEqual(2, len(self.dumps()))
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_profiledumps_command(self):
+        self.client.get(reverse('about'))
+        self.client.get(reverse('hobbit'))
+
+        out = StringIO()
+        call_command('profiledumps', 'list', stdout=out)
+        self.assertEqual(2, len(out.getvalue().strip().splitlines()))
+
+        merged = os.path.join(self.profile_dir, 'merged.out')
+        out = StringIO()
+        call_command('profiledumps', 'merge', merged, stdout=out)
+        self.assertTrue(os.path.exists(merged))
+        self.assertTrue('function calls' in out.getvalue())
+
+
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+        self.old_incr = statsd.incr
+        self.counts = defaultdict(int)
+        statsd.incr = lambda name: self.counts.__setitem__(name, self.counts[name] + 1)
+
+    def tearDown(self):
+        statsd.incr = self.old_incr
+        page_cache().clear()
+
+    def test_caches_anonymous_pages(self):
+        response = self.client.get(reverse('about'))
+        self.assertEqual('miss', response['X-Page-Cache'])
+        response = self.client.get(reverse('about'))
+        self.assertEqual('hit', response['X-Page-Cache'])
+        self.assertEqual({'pagecache.miss': 1, 'pagecache.hit': 1}, self.counts)
+
+    def test_csrf_token(self):
+        first = self.client.get(reverse('homepage'))
+        first_token = first.cookies['csrftoken'].value
+        self.assertContains(first, first_token)
+        self.assertTrue(CSRF_PLACEHOLDER in page_cache().get('page:/')[0])
+
+        # A new visitor gets a new token
+        self.client.cookies.clear()
+        second = self.client.get(reverse('homepage'))
+        self.assertEqual('hit', second['X-Page-Cache'])
+        second_token = second.cookies['csrftoken'].value
+        self.assertNotEqual(first_token, second_token)
+        self.assertContains(second, "value='%s'" % second_token)
+        self.assertNotContains(second, CSRF_PLACEHOLDER)
+
+        # A returning one keeps theirs
+        third = self.client.get(reverse('homepage'))
+        self.assertContains(third, "value='%s'" % second_token)
+
+    def test_redirects_to_https_before_serving_hits(self):
+        self.client.get(reverse('about'))
+        with self.settings(SECURE_SSL_REDIRECT=True):
+            self.client = self.client_class()
+            response = self.client.get(reverse('about'))
+            self.assertEqual(301, response.status_code)
+            self.assertTrue(response['Location'].startswith('https://'))
+            response = self.client.get(reverse('about'), **{'wsgi.url_scheme': 'https'})
+            self.assertEqual('hit', response['X-Page-Cache'])
+
+    def test_ignores_tracking_parameters(self):
+        self.client.get(reverse('about'))
+        response = self.client.get(reverse('about') + '?utm_source=newsletter')
+        self.assertEqual('hit', response['X-Page-Cache'])
+        response = self.client.get(reverse('about') + '?profile')
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+    def test_logged_in(self):
+        User.objects.create_user(email='someone@example.com', password='12345',
+                                 is_active=True)
+        self.assertTrue(self.client.login(email='someone@example.com', password='12345'))
+        response = self.client.get(reverse('homepage'))
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertEqual(None, page_cache().get('page:/'))
+
+    def test_uncached_pages(self):
+        response = self.client.get(reverse('login'))
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+    def test_purgepagecache_command(self):
+        self.client.get(reverse('about'))
+        self.client.get(reverse('hobbit'))
+        call_command('purgepagecache', 'about', stdout=StringIO())
+        self.assertEqual('miss', self.client.get(reverse('about'))['X-Page-Cache'])
+        self.assertEqual('hit', self.client.get(reverse('hobbit'))['X-Page-Cache'])
+        call_command('purgepagecache', stdout=StringIO())
+        self.assertEqual('miss', self.client.get(reverse('hobbit'))['X-Page-Cache'])
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+        self.resets = 0
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 0
+        self.tick = 0
+        self.made = []
+        self.pool = ConnectionPool(connect=self.connect, check=self.check,
+                                   reset=self.reset, max_size=2, max_age=100,
+                                   check_interval=10, timeout=0.01,
+                                   clock=self.clock)
+
+    def clock(self):
+        self.now += self.tick
+        return self.now
+
+    def connect(self):
+        self.made.append(FakeConnection())
+        return self.made[-1]
+
+    def check(self, connection):
+        if connection.broken:
+            raise IOError("broken")
+
+    def reset(self, connection):
+        if connection.closed:
+            raise IOError("closed")
+        connection.resets += 1
+
+    def test_reuses_connections(self):
+        first = self.pool.checkout()
+        self.pool.checkin(first)
+        self.assertTrue(first is self.pool.checkout())
+        self.assertEqual(1, len(self.made))
+        self.assertEqual(1, first.resets)
+
+    def test_bounded(self):
+        first = self.pool.checkout()
+        self.pool.checkout()
+        self.tick = 0.001
+        self.assertRaises(PoolTimeout, self.pool.checkout)
+        self.tick = 0
+
+        # Once one's returned, it can be had again
+        self.pool.checkin(first)
+        self.assertTrue(first is self.pool.checkout())
+
+    def test_waits_for_checkin(self):
+        self.pool.timeout = 5
+        first = self.pool.checkout()
+        self.pool.checkout()
+        timer = threading.Timer(0.05, self.pool.checkin, [first])
+        timer.start()
+        self.assertTrue(first is self.pool.checkout())
+        timer.join()
+
+    def test_health_check(self):
+        first = self.pool.checkout()
+        self.pool.checkin(first)
+        first.broken = True
+        # Not checked if it was used recently
+        self.assertTrue(first is self.pool.checkout())
+        self.pool.checkin(first)
+
+        self.now = 10
+        second = self.pool.checkout()
+        self.assertFalse(second is first)
+        self.assertTrue(first.closed)
+
+    def test_max_age(self):
+        first = self.pool.checkout()
+        self.now = 100
+        self.pool.checkin(first)
+        self.assertTrue(first.closed)
+        self.assertEqual(0, self.pool.size)
+
+    def test_reset_failure_discards(self):
+        first = self.pool.checkout()
+        first.closed = True
+        self.pool.checkin(first)
+        self.assertEqual(0, self.pool.size)
+        self.assertFalse(first is self.pool.checkout())
+
+    def test_clear(self):
+        first = self.pool.checkout()
+        second = self.pool.checkout()
+        self.pool.checkin(second)
+        self.pool.clear()
+        self.assertTrue(second.closed)
+        self.pool.checkin(first)
+        self.assertTrue(first.closed)
+        self.assertEqual(0, self.pool.size)
+
+
+class CountHabits(Backfill):
+    name = 'test.count_habits'
+    model = Habit
+
+    def __init__(self):
+        self.seen = []
+
+    def process(self, habits):
+        pks = list(habits.values_list('pk', flat=True))
+        self.seen.extend(pks)
+        return len(pks)
+
+
+class BackfillTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(email='foo@bar.com')
+        self.habits = [
+            Habit.objects.create(description="Foo my bar %d" % i,
+                                 start=datetime.date(2013, 3, 4),
+                                 user=user, resolution='day')
+            for i in range(5)
+        ]
+        self.pks = [habit.pk for habit in self.habits]
+
+    def test_runs_in_chunks(self):
+        backfill = CountHabits()
+        progress = list(backfill.run(chunk_size=2))
+        self.assertEqual(self.pks, backfill.seen)
+        self.assertEqual(5, progress[-1].rows)
+        self.assertEqual(max(self.pks), progress[-1].last_pk)
+        checkpoint = BackfillCheckpoint.objects.get(name=backfill.name)
+        self.assertEqual(5, checkpoint.rows)
+        self.assertNotEqual(None, checkpoint.finished)
+
+        # Finished, so there's nothing to do until it's restarted
+        self.assertEqual([], list(CountHabits().run(chunk_size=2)))
+        backfill = CountHabits()
+        list(backfill.run(chunk_size=2, restart=True))
+        self.assertEqual(self.pks, backfill.seen)
+
+    def test_resumes(self):
+        backfill = CountHabits()
+        chunks = backfill.run(chunk_size=1)
+        next(chunks)
+        next(chunks)
+        # Interrupted: carry on with a new one
+        rest = CountHabits()
+        list(rest.run(chunk_size=1))
+        self.assertEqual(self.pks[:2], backfill.seen)
+        self.assertEqual(self.pks[2:], rest.seen)
+        self.assertEqual(5, BackfillCheckpoint.objects.get(name=rest.name).rows)
+
+    def test_ignores_new_rows(self):
+        backfill = CountHabits()
+        chunks = backfill.run(chunk_size=1)
+        next(chunks)
+        Habit.objects.create(description="Baz", start=datetime.date(2013, 3, 4),
+                             user=self.habits[0].user, resolution='day')
+        list(chunks)
+        self.assertEqual(self.pks, backfill.seen)
+
+    def test_empty_table(self):
+        Habit.objects.all().delete()
+        backfill = CountHabits()
+        self.assertEqual([], list(backfill.run()))
+        self.assertNotEqual(None, BackfillCheckpoint.objects.get(name=backfill.name).finished)
+
+    def test_command(self):
+        for habit in self.habits:
+            habit.record(habit.get_time_period(habit.start), 1)
+        Run.objects.all().delete()
+        out = StringIO()
+        call_command('runbackfill', 'habits.runs', load=1, stdout=out)
+        self.assertTrue('rows/s' in out.getvalue())
+        self.assertEqual(5, Run.objects.values('habit').distinct().count())
+
+        out = StringIO()
+        call_command('runbackfill', list=True, stdout=out)
+        self.assertTrue('habits.runs: finished' in out.getvalue())
+
+    def test_nothing_to_do_after_migrating(self):
+        # habits.bucket_resolution_codes is only for between migrations
+        out = StringIO()
+        call_command('runbackfill', 'habits.bucket_resolution_codes', stdout=out)
+        call_command('runbackfill', list=True, stdout=out)
+        self.assertTrue('habits.bucket_resolution_codes: finished' in out.getvalue())
+        self.assertTrue('habits.cumulative_sums: not started' in out.getvalue())
+
+
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='someone@example.com',
+                                             password='12345', is_active=True)
+        self.habit = Habit.objects.create(
+            description="Brush teeth",
+            start=datetime.date.today() - datetime.timedelta(days=3),
+            user=self.user,
+            resolution='day',
+        )
+        self.middleware = ReplicaPinMiddleware()
+
+    def request(self, **cookies):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        self.middleware.process_request(request)
+        return request
+
+    def test_no_replica(self):
+        with use_replica():
+            self.assertEqual('default', Habit.objects.all().db)
+
+    def test_reads_inside_use_replica(self):
+        with helpers.replica_database():
+            self.assertEqual('default', Habit.objects.all().db)
+            with use_replica():
+                self.assertEqual('replica', Habit.objects.all().db)
+                self.assertEqual([self.habit], list(Habit.objects.all()))
+                self.assertEqual('replica', Habit.objects.get(pk=self.habit.pk)._state.db)
+                # Writes still go to the primary
+                self.assertEqual('default', Habit.objects.all()._clone(_for_write=True).db)
+
+    def test_use_primary_overrides_use_replica(self):
+        with helpers.replica_database():
+            with use_replica():
+                with use_primary():
+                    self.assertEqual('default', Habit.objects.all().db)
+                self.assertEqual('replica', Habit.objects.all().db)
+
+    def test_write_pins_rest_of_request(self):
+        with helpers.replica_database():
+            request = self.request()
+            with use_replica():
+                self.assertEqual('replica', Habit.objects.all().db)
+                self.habit.save()
+                self.assertEqual('default', Habit.objects.all().db)
+            response = self.middleware.process_response(request, HttpResponse())
+            self.assertTrue(PIN_COOKIE_NAME in response.cookies)
+
+            # And the next request, with the cookie
+            cookie = response.cookies[PIN_COOKIE_NAME].value
+            request = self.request(**{PIN_COOKIE_NAME: cookie})
+            with use_replica():
+                self.assertEqual('default', Habit.objects.all().db)
+            response = self.middleware.process_response(request, HttpResponse())
+            self.assertFalse(PIN_COOKIE_NAME in response.cookies)
+
+    def test_expired_pin(self):
+        with helpers.replica_database():
+            request = self.request(**{PIN_COOKIE_NAME: '%.3f' % (time.time() - 1)})
+            with use_replica():
+                self.assertEqual('replica', Habit.objects.all().db)
+            self.middleware.process_response(request, HttpResponse())
+
+    def test_record_then_encouragement(self):
+        self.client.login(email=self.user.email, password='12345')
+        data = {}
+        for period in self.habit.get_recent_unentered_time_periods():
+            data['%d-date' % period.index] = period.date.isoformat()
+            data['%d-value' % period.index] = '1'
+        with helpers.replica_database():
+            response = self.client.post(
+                reverse('habit_record', args=[self.habit.pk]), data)
+            self.assertTrue(PIN_COOKIE_NAME in response.cookies)
+            response = self.client.get(reverse('habit_encouragement',
+                                               args=[self.habit.pk]))
+            self.assertEqual(200, response.status_code)
+            response = self.client.get(reverse('habit_performance'))
+            self.assertEqual(1, json.loads(response.content)['habits'][0]['recent_buckets'][-2])